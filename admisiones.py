@@ -0,0 +1,485 @@
+# admisiones.py
+import os
+import re
+import sys
+import json
+import time
+import glob
+import socket
+import argparse
+import datetime
+import threading
+import socketserver
+from collections import OrderedDict
+
+from plantillas_zpl import FORMATOS, generar_segmentos, con_marca_tiempo
+from normalizacion_pacientes import normalizar_paciente, DatosInvalidos
+
+# Puertos por defecto: 2575 es el registrado para HL7 sobre MLLP
+PUERTO_MLLP = 2575
+PUERTO_JSON = 2576
+CARPETA_ADMISIONES = "admisiones"
+# Encuadre MLLP: <VT> mensaje <FS><CR>
+INICIO_MLLP = b"\x0b"
+FIN_MLLP = b"\x1c\x0d"
+# Eventos ADT que traen un paciente para pulsera: admisión, registro, preadmisión, actualización
+EVENTOS_ADT = {"A01", "A04", "A05", "A08"}
+# Tipos de identificador (PID-3.5) que se toman como DNI; si no hay ninguno, el primero
+TIPOS_DNI = {"DNI", "NN", "NNARG", "PN"}
+
+# Cola de pulseras listas: máximo y cuánto tiempo se conserva una admisión sin imprimir
+CAPACIDAD_LISTAS = 500
+VIGENCIA_HORAS = 12
+
+
+class EventoInvalido(ValueError):
+    """El mensaje no es un evento de admisión reconocible"""
+
+
+# ---------------------------------------------------------------- HL7 ADT
+
+def _desescapar_hl7(texto, componente="^"):
+    reemplazos = {"\\F\\": "|", "\\S\\": componente, "\\T\\": "&", "\\R\\": "~", "\\E\\": "\\"}
+    for secuencia, caracter in reemplazos.items():
+        texto = texto.replace(secuencia, caracter)
+    return texto
+
+
+def _campo_hl7(segmento, numero):
+    return segmento[numero] if numero < len(segmento) else ""
+
+
+def parsear_hl7(mensaje):
+    """
+    Extrae el paciente de un mensaje HL7 v2 ADT (segmentos MSH, PID y PV1).
+    Retorna un dict con nombre, dni, nacimiento, hospital y control (MSH-10).
+    Lanza EventoInvalido si no es un ADT de admisión o no trae PID.
+    """
+    if isinstance(mensaje, bytes):
+        mensaje = mensaje.decode('utf-8', errors='replace')
+    segmentos = {}
+    for linea in mensaje.replace("\r\n", "\r").replace("\n", "\r").split("\r"):
+        if len(linea) >= 4 and linea[:3].isalnum():
+            segmentos.setdefault(linea[:3], linea)
+    msh = segmentos.get("MSH")
+    if msh is None:
+        raise EventoInvalido("falta el segmento MSH")
+    if len(msh) < 8:
+        # MSH|^~\& : separador de campo y los cuatro caracteres de codificación
+        raise EventoInvalido("segmento MSH incompleto")
+    separador, componente = msh[3], msh[4]
+    repeticion = msh[5] if len(msh) > 5 else "~"
+    # En MSH el separador es el campo 1: se corre la numeración en uno
+    msh = ["MSH", separador] + msh[4:].split(separador)
+    tipo = _campo_hl7(msh, 9).split(componente)
+    if tipo[0] != "ADT" or len(tipo) < 2 or tipo[1] not in EVENTOS_ADT:
+        raise EventoInvalido(f"evento no usado para pulseras ({'^'.join(tipo)})")
+    if "PID" not in segmentos:
+        raise EventoInvalido("falta el segmento PID")
+    pid = segmentos["PID"].split(separador)
+
+    # PID-3: lista de identificadores (id^^^autoridad^tipo); se prefiere el DNI
+    identificadores = [i.split(componente) for i in _campo_hl7(pid, 3).split(repeticion) if i]
+    dni = next((i[0] for i in identificadores if len(i) > 4 and i[4].upper() in TIPOS_DNI),
+               identificadores[0][0] if identificadores else "")
+
+    # PID-5: apellido^nombre^segundo nombre -> "Apellido, Nombre Segundo"
+    nombre = _campo_hl7(pid, 5).split(repeticion)[0].split(componente)
+    apellido = nombre[0].split("&")[0]
+    nombres = " ".join(parte for parte in nombre[1:3] if parte)
+    nombre = f"{apellido}, {nombres}" if apellido and nombres else apellido or nombres
+
+    # PID-7: AAAAMMDD[HHMM...]
+    nacimiento = _campo_hl7(pid, 7)[:8]
+    if len(nacimiento) == 8 and nacimiento.isdigit():
+        nacimiento = f"{nacimiento[6:8]}/{nacimiento[4:6]}/{nacimiento[:4]}"
+
+    # Hospital: PV1-3.4 (establecimiento de la cama) o, si no viene, MSH-4
+    hospital = ""
+    if "PV1" in segmentos:
+        ubicacion = _campo_hl7(segmentos["PV1"].split(separador), 3).split(componente)
+        hospital = ubicacion[3] if len(ubicacion) > 3 else ""
+    hospital = hospital or _campo_hl7(msh, 4).split(componente)[0]
+
+    return {'nombre': _desescapar_hl7(nombre, componente), 'dni': dni,
+            'nacimiento': nacimiento, 'hospital': _desescapar_hl7(hospital, componente),
+            'control': _campo_hl7(msh, 10)}
+
+
+def mensajes_hl7(contenido):
+    """Separa los mensajes de un archivo con varios (cada uno empieza con MSH)"""
+    contenido = contenido.replace("\r\n", "\r").replace("\n", "\r").strip("\r")
+    return [mensaje for mensaje in re.split(r"\r(?=MSH)", contenido) if mensaje.startswith("MSH")]
+
+
+def acuse_hl7(mensaje, codigo="AA", texto=""):
+    """ACK para el mensaje recibido (AA aceptado, AE error, AR rechazado)"""
+    if isinstance(mensaje, bytes):
+        mensaje = mensaje.decode('utf-8', errors='replace')
+    msh = mensaje.replace("\n", "\r").split("\r")[0]
+    separador = msh[3] if msh.startswith("MSH") and len(msh) > 3 else "|"
+    campos = msh.split(separador) if msh.startswith("MSH") else ["MSH", "^~\\&"]
+    campos += [""] * (12 - len(campos))
+    ahora = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    # Emisor y receptor invertidos respecto del mensaje original
+    encabezado = separador.join(["MSH", campos[1], campos[4], campos[5], campos[2], campos[3], ahora, "",
+                                 "ACK", f"ACK{ahora}", campos[10] or "P", campos[11] or "2.3"])
+    texto = texto.replace(separador, " ").replace("\r", " ")
+    return f"{encabezado}\rMSA{separador}{codigo}{separador}{campos[9]}{separador}{texto}\r"
+
+
+# ---------------------------------------------------------------- JSON
+
+def _texto_json(evento, *claves):
+    """El primer valor presente (un null cuenta como ausente) como texto, o ''"""
+    for clave in claves:
+        if evento.get(clave) is not None:
+            return str(evento[clave])
+    return ""
+
+
+def parsear_json(linea):
+    """
+    Un evento por línea: {"nombre": ..., "dni": ..., "nacimiento": ..., "hospital": ...}
+    (también acepta "paciente" y "documento"; "bebes" en un parto, para la
+    pulsera madre / bebé). Lanza EventoInvalido si no es un objeto.
+    """
+    try:
+        evento = json.loads(linea)
+    except ValueError as e:
+        raise EventoInvalido(f"JSON inválido: {e}")
+    if not isinstance(evento, dict):
+        raise EventoInvalido("se esperaba un objeto JSON")
+    return {'nombre': _texto_json(evento, 'nombre', 'paciente'),
+            'dni': _texto_json(evento, 'dni', 'documento'),
+            'nacimiento': _texto_json(evento, 'nacimiento'),
+            'hospital': _texto_json(evento, 'hospital'),
+            'bebes': _texto_json(evento, 'bebes'),
+            'control': _texto_json(evento, 'id')}
+
+
+# ---------------------------------------------------------------- cola de pulseras listas
+
+class EtiquetaLista:
+    """Paciente admitido ya validado, con su etiqueta pre-renderizada en cada formato"""
+
+    def __init__(self, datos, segmentos, origen):
+        self.datos = datos            # nombre, dni, nacimiento, hospital (normalizados) y bebes si vino
+        self.segmentos = segmentos    # formato -> tupla de segmentos de bytes
+        self.origen = origen
+        self.recibida = time.time()
+
+    def etiqueta(self, formato, ahora=None):
+        """Segmentos listos para enviar, con la fecha/hora de impresión de ahora"""
+        return con_marca_tiempo(formato, self.segmentos[formato], ahora)
+
+    def coincide(self, nombre, dni, nacimiento, hospital):
+        return (nombre, dni, nacimiento, hospital) == (self.datos['nombre'], self.datos['dni'],
+                                                       self.datos['nacimiento'], self.datos['hospital'])
+
+
+class ColaListas:
+    """
+    Pulseras listas para imprimir, por DNI: cada evento de admisión se
+    valida y se renderiza al llegar, de modo que en el mostrador imprimir
+    es elegir el paciente y enviar. Una nueva admisión del mismo DNI
+    reemplaza a la anterior.
+    """
+
+    def __init__(self, formatos=None, logo=None, capacidad=CAPACIDAD_LISTAS, vigencia_horas=VIGENCIA_HORAS):
+        self.formatos = list(formatos or FORMATOS)
+        self.logo = logo
+        self.capacidad = capacidad
+        self.vigencia = vigencia_horas * 3600
+        # al_cambiar(): se llama desde el hilo que recibió el evento
+        self.al_cambiar = None
+        self.rechazadas = []          # (origen, datos, motivo) de los últimos eventos inválidos
+        self._listas = OrderedDict()  # dni -> EtiquetaLista, en orden de llegada
+        self._lock = threading.Lock()
+
+    def agregar(self, evento, origen=""):
+        """
+        Valida y pre-renderiza un evento (dict con nombre, dni, nacimiento,
+        hospital). Retorna la EtiquetaLista; lanza DatosInvalidos si no pasa
+        la validación.
+        """
+        try:
+            datos = normalizar_paciente(evento.get('nombre', ""), evento.get('dni', ""),
+                                        evento.get('nacimiento', ""), evento.get('hospital', ""))
+        except DatosInvalidos as e:
+            with self._lock:
+                self.rechazadas = (self.rechazadas + [(origen, evento, str(e))])[-50:]
+            raise
+        # Recién nacidos del parto (pulsera madre / bebé): si no viene o no es 1-9, se pregunta al imprimir
+        bebes = str(evento.get('bebes') or "").strip()
+        if bebes.isdigit() and 1 <= int(bebes) <= 9:
+            datos['bebes'] = int(bebes)
+        segmentos = {formato: generar_segmentos(formato, datos['nombre'], datos['dni'], datos['nacimiento'],
+                                                datos['hospital'], logo=self.logo)
+                     for formato in self.formatos}
+        lista = EtiquetaLista(datos, segmentos, origen)
+        with self._lock:
+            self._listas.pop(datos['dni'], None)
+            self._listas[datos['dni']] = lista
+            self._descartar_viejas()
+        if self.al_cambiar:
+            self.al_cambiar()
+        return lista
+
+    def _descartar_viejas(self):
+        limite = time.time() - self.vigencia
+        while self._listas and (len(self._listas) > self.capacidad
+                                or next(iter(self._listas.values())).recibida < limite):
+            self._listas.popitem(last=False)
+
+    def ver(self, dni):
+        with self._lock:
+            return self._listas.get(dni)
+
+    def tomar(self, dni):
+        """Saca la pulsera de la cola (ya se imprimió). None si no estaba."""
+        with self._lock:
+            lista = self._listas.pop(dni, None)
+        if lista is not None and self.al_cambiar:
+            self.al_cambiar()
+        return lista
+
+    def pendientes(self):
+        """Pulseras listas, la más reciente primero"""
+        with self._lock:
+            self._descartar_viejas()
+            return list(reversed(self._listas.values()))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._listas)
+
+
+# ---------------------------------------------------------------- fuentes de eventos
+
+class _ManejadorMLLP(socketserver.BaseRequestHandler):
+    """Mensajes HL7 encuadrados en MLLP; responde un ACK por mensaje"""
+
+    def handle(self):
+        ingesta = self.server.ingesta
+        buffer = b""
+        while True:
+            try:
+                bloque = self.request.recv(65536)
+            except OSError:
+                return
+            if not bloque:
+                return
+            buffer += bloque
+            while FIN_MLLP in buffer:
+                mensaje, _, buffer = buffer.partition(FIN_MLLP)
+                mensaje = mensaje[mensaje.find(INICIO_MLLP) + 1:]
+                codigo, texto = ingesta.recibir_hl7(mensaje, f"mllp:{self.client_address[0]}")
+                respuesta = INICIO_MLLP + acuse_hl7(mensaje, codigo, texto).encode('utf-8') + FIN_MLLP
+                try:
+                    self.request.sendall(respuesta)
+                except OSError:
+                    return
+
+
+class _ManejadorJSON(socketserver.StreamRequestHandler):
+    """Un evento JSON por línea; responde 'ok' o 'error: motivo' por línea"""
+
+    def handle(self):
+        ingesta = self.server.ingesta
+        for linea in self.rfile:
+            linea = linea.strip()
+            if not linea:
+                continue
+            error = ingesta.recibir_json(linea.decode('utf-8', errors='replace'), f"json:{self.client_address[0]}")
+            try:
+                self.wfile.write(b"ok\n" if not error else f"error: {error}\n".encode('utf-8'))
+            except OSError:
+                return
+
+
+class _Servidor(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class IngestaAdmisiones:
+    """
+    Recibe eventos de admisión y los pasa a la cola de pulseras listas.
+    Fuentes (cada una en su hilo): HL7 ADT por MLLP, líneas JSON por un
+    socket local y archivos (.hl7, .json, .jsonl) dejados en una carpeta.
+    """
+
+    def __init__(self, listas):
+        self.listas = listas
+        self._servidores = {}
+        self._carpetas = {}
+        # ruta -> (tamaño, mtime) vistos en la revisión anterior de la carpeta
+        self._vistos = {}
+
+    def _agregar(self, evento, origen):
+        """'' si quedó lista, o el motivo del rechazo"""
+        evento = dict(evento)
+        evento.pop('control', None)
+        try:
+            self.listas.agregar(evento, origen)
+        except DatosInvalidos as e:
+            return str(e)
+        return ""
+
+    def recibir_hl7(self, mensaje, origen="hl7"):
+        """Retorna (código de acuse HL7, texto)"""
+        try:
+            evento = parsear_hl7(mensaje)
+        except EventoInvalido as e:
+            # Otros eventos ADT (altas, traslados) se aceptan y se ignoran
+            return "AA", str(e)
+        error = self._agregar(evento, origen)
+        return ("AE", error) if error else ("AA", "")
+
+    def recibir_json(self, linea, origen="json"):
+        """'' si quedó lista, o el motivo del rechazo"""
+        try:
+            evento = parsear_json(linea)
+        except EventoInvalido as e:
+            return str(e)
+        return self._agregar(evento, origen)
+
+    def _servir(self, clave, puerto, manejador, host):
+        if clave in self._servidores:
+            return self._servidores[clave].server_address[1]
+        servidor = _Servidor((host, puerto), manejador)
+        servidor.ingesta = self
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        self._servidores[clave] = servidor
+        return servidor.server_address[1]
+
+    def escuchar_mllp(self, puerto=PUERTO_MLLP, host="127.0.0.1"):
+        """Abre el listener HL7/MLLP. Retorna el puerto. Lanza OSError si está ocupado."""
+        return self._servir("mllp", puerto, _ManejadorMLLP, host)
+
+    def escuchar_json(self, puerto=PUERTO_JSON, host="127.0.0.1"):
+        """Abre el socket de líneas JSON. Retorna el puerto. Lanza OSError si está ocupado."""
+        return self._servir("json", puerto, _ManejadorJSON, host)
+
+    def vigilar_carpeta(self, carpeta=CARPETA_ADMISIONES, intervalo=1.0):
+        """
+        Revisa la carpeta cada 'intervalo' segundos. Un archivo se toma
+        cuando su tamaño y fecha no cambiaron desde la revisión anterior (el
+        sistema de origen terminó de escribirlo); los .tmp y los ocultos se
+        ignoran, para quien escribe aparte y renombra al terminar. Cada archivo
+        procesado pasa a procesados/ (o a rechazados/ si ningún evento sirvió).
+        """
+        if carpeta in self._carpetas:
+            return
+        activa = threading.Event()
+        activa.set()
+        self._carpetas[carpeta] = activa
+        threading.Thread(target=self._vigilar, args=(carpeta, intervalo, activa), daemon=True).start()
+
+    def _vigilar(self, carpeta, intervalo, activa):
+        while activa.is_set():
+            try:
+                self.procesar_carpeta(carpeta)
+            except OSError as e:
+                # Carpeta inaccesible (unidad de red caída): se reintenta en la próxima vuelta
+                print(f"✗ Error al revisar la carpeta de admisiones {carpeta}: {e}")
+            time.sleep(intervalo)
+
+    def _estable(self, ruta):
+        """True si el archivo no cambió desde la revisión anterior"""
+        try:
+            estado = os.stat(ruta)
+        except OSError:
+            return False
+        firma = (estado.st_size, estado.st_mtime_ns)
+        anterior, self._vistos[ruta] = self._vistos.get(ruta), firma
+        return anterior == firma
+
+    def procesar_carpeta(self, carpeta=CARPETA_ADMISIONES, esperar_estable=True):
+        """
+        Procesa los archivos de la carpeta que ya terminaron de escribirse
+        (con esperar_estable=False, todos los que haya). Retorna (aceptados, rechazados).
+        """
+        aceptados = rechazados = 0
+        for subcarpeta in ("procesados", "rechazados"):
+            os.makedirs(os.path.join(carpeta, subcarpeta), exist_ok=True)
+        # glob no devuelve los archivos ocultos (.nombre.jsonl) y .tmp no es una extensión aceptada
+        rutas = sorted(glob.glob(os.path.join(carpeta, "*.*")))
+        for ruta in [ruta for ruta in list(self._vistos) if ruta not in rutas and os.path.dirname(ruta) == carpeta]:
+            del self._vistos[ruta]
+        for ruta in rutas:
+            extension = os.path.splitext(ruta)[1].lower()
+            if extension not in (".hl7", ".json", ".jsonl"):
+                continue
+            if esperar_estable and not self._estable(ruta):
+                continue   # Todavía se está escribiendo: se vuelve a mirar en la próxima revisión
+            self._vistos.pop(ruta, None)
+            try:
+                with open(ruta, 'r', encoding='utf-8', errors='replace') as f:
+                    contenido = f.read()
+            except OSError:
+                continue   # Todavía se está escribiendo o se movió
+            try:
+                if extension == ".hl7":
+                    errores = [self.recibir_hl7(m, f"archivo:{os.path.basename(ruta)}")[0] != "AA"
+                               for m in mensajes_hl7(contenido)]
+                else:
+                    lineas = [contenido] if extension == ".json" else [l for l in contenido.splitlines() if l.strip()]
+                    errores = [bool(self.recibir_json(l, f"archivo:{os.path.basename(ruta)}")) for l in lineas]
+            except Exception as e:
+                # Un archivo que rompe el procesamiento no debe frenar al resto de la carpeta
+                print(f"✗ Error al procesar {ruta}: {e}")
+                errores = [True]
+            aceptados += errores.count(False)
+            rechazados += errores.count(True)
+            destino = "rechazados" if errores and all(errores) else "procesados"
+            try:
+                os.replace(ruta, os.path.join(carpeta, destino, os.path.basename(ruta)))
+            except OSError:
+                pass
+        return aceptados, rechazados
+
+    def detener(self):
+        for servidor in self._servidores.values():
+            servidor.shutdown()
+            servidor.server_close()
+        self._servidores = {}
+        for activa in self._carpetas.values():
+            activa.clear()
+        self._carpetas = {}
+
+
+def enviar_mllp(mensaje, host="127.0.0.1", puerto=PUERTO_MLLP, timeout=5):
+    """Envía un mensaje HL7 por MLLP (p.ej. para probar) y retorna el ACK recibido"""
+    with socket.create_connection((host, puerto), timeout=timeout) as sock:
+        sock.sendall(INICIO_MLLP + mensaje.encode('utf-8') + FIN_MLLP)
+        respuesta = b""
+        while FIN_MLLP not in respuesta:
+            bloque = sock.recv(4096)
+            if not bloque:
+                break
+            respuesta += bloque
+    return respuesta.strip(INICIO_MLLP + FIN_MLLP).decode('utf-8', errors='replace')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Envía una admisión de prueba (HL7 por MLLP o JSON por socket)")
+    parser.add_argument('archivo', help="Archivo .hl7 (se envía por MLLP) o .jsonl (se envía por el socket JSON)")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--puerto', type=int)
+    args = parser.parse_args()
+
+    with open(args.archivo, 'r', encoding='utf-8') as f:
+        contenido = f.read()
+    if args.archivo.lower().endswith(".hl7"):
+        for mensaje in mensajes_hl7(contenido):
+            print(enviar_mllp(mensaje, args.host, args.puerto or PUERTO_MLLP).replace("\r", "\n"))
+    else:
+        with socket.create_connection((args.host, args.puerto or PUERTO_JSON), timeout=5) as sock:
+            lineas = [linea for linea in contenido.splitlines() if linea.strip()]
+            sock.sendall("".join(linea + "\n" for linea in lineas).encode('utf-8'))
+            archivo = sock.makefile('r', encoding='utf-8')
+            for linea in lineas:
+                print(archivo.readline().strip())
+    sys.exit(0)
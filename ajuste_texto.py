@@ -0,0 +1,152 @@
+# ajuste_texto.py
+import unicodedata
+from functools import lru_cache
+
+# Anchos de carácter de la fuente escalable 0 (CG Triumvirate Bold Condensed),
+# en milésimas del ancho indicado en ^A0. Aproximados con las métricas de
+# Helvetica Condensed Bold, que comparte el mismo diseño.
+ANCHOS_FUENTE_0 = {
+    ' ': 250, '!': 333, '"': 333, '#': 500, '$': 500, '%': 833, '&': 611, "'": 222,
+    '(': 278, ')': 278, '*': 389, '+': 500, ',': 250, '-': 333, '.': 250, '/': 278,
+    ':': 250, ';': 250, '<': 500, '=': 500, '>': 500, '?': 500, '@': 833,
+    'A': 556, 'B': 556, 'C': 556, 'D': 556, 'E': 500, 'F': 444, 'G': 556, 'H': 556,
+    'I': 278, 'J': 444, 'K': 556, 'L': 444, 'M': 722, 'N': 556, 'O': 556, 'P': 556,
+    'Q': 556, 'R': 556, 'S': 500, 'T': 444, 'U': 556, 'V': 500, 'W': 722, 'X': 500,
+    'Y': 500, 'Z': 444,
+    'a': 444, 'b': 500, 'c': 444, 'd': 500, 'e': 444, 'f': 278, 'g': 500, 'h': 500,
+    'i': 222, 'j': 222, 'k': 444, 'l': 222, 'm': 722, 'n': 500, 'o': 500, 'p': 500,
+    'q': 500, 'r': 333, 's': 444, 't': 278, 'u': 500, 'v': 444, 'w': 667, 'x': 444,
+    'y': 444, 'z': 389,
+}
+ANCHOS_FUENTE_0.update({str(d): 500 for d in range(10)})
+ANCHO_POR_DEFECTO = 556
+
+TABLAS_FUENTES = {'0': ANCHOS_FUENTE_0}
+
+# Abreviaturas usadas antes de recurrir a iniciales o a cortar el texto
+ABREVIATURAS = {
+    'hospital': 'Hosp.', 'sanatorio': 'Sanat.', 'clinica': 'Clín.', 'clínica': 'Clín.',
+    'general': 'Gral.', 'santa': 'Sta.', 'nacional': 'Nac.', 'provincial': 'Prov.',
+    'municipal': 'Mun.', 'regional': 'Reg.', 'universitario': 'Univ.', 'doctor': 'Dr.',
+    'maternidad': 'Mat.', 'instituto': 'Inst.',
+}
+
+# Partículas que se omiten al abreviar ("de los Ángeles" -> "Á.")
+PARTICULAS = {'de', 'del', 'la', 'las', 'los', 'y'}
+
+
+def limpiar_campo(texto):
+    """Quita los caracteres que ZPL interpreta como comandos (^ y ~)"""
+    return texto.replace('^', ' ').replace('~', ' ').strip()
+
+
+def _ancho_caracter(tabla, caracter):
+    ancho = tabla.get(caracter)
+    if ancho is None:
+        # Letras acentuadas (á, ñ, ü...) ocupan lo mismo que su letra base
+        base = unicodedata.normalize('NFD', caracter)[:1]
+        ancho = tabla.get(base, ANCHO_POR_DEFECTO)
+    return ancho
+
+
+@lru_cache(maxsize=4096)
+def ancho_texto(texto, fuente='0', alto=20, ancho=None):
+    """Ancho en dots de 'texto' impreso con ^A{fuente}N,{alto},{ancho}"""
+    tabla = TABLAS_FUENTES.get(fuente, ANCHOS_FUENTE_0)
+    milesimas = sum(_ancho_caracter(tabla, c) for c in texto)
+    return milesimas * (ancho or alto) / 1000.0
+
+
+class Ajuste:
+    """Resultado del ajuste de un campo: texto final, tamaño y líneas usadas"""
+
+    def __init__(self, texto, alto, lineas, ancho_bloque, metodo):
+        self.texto = texto
+        self.alto = alto
+        self.lineas = lineas
+        self.ancho_bloque = ancho_bloque
+        self.metodo = metodo
+
+    def zpl(self, x, y, fuente='0'):
+        """
+        Genera el campo ZPL. (x, y) es la línea base de la primera línea,
+        como en los ^FT de las plantillas.
+        """
+        if self.lineas == 1:
+            return f"^FT{x},{y}^A{fuente}N,{self.alto},{self.alto}^FD{self.texto}^FS"
+        # ^FB con ^FT ancla la última línea: se usa ^FO para crecer hacia abajo
+        arriba = max(0, y - self.alto)
+        return (f"^FO{x},{arriba}^A{fuente}N,{self.alto},{self.alto}"
+                f"^FB{self.ancho_bloque},{self.lineas},0,L,0^FD{self.texto}^FS")
+
+
+def _partir_en_lineas(palabras, fuente, alto, ancho_max, max_lineas):
+    lineas = []
+    actual = ""
+    for palabra in palabras:
+        candidata = f"{actual} {palabra}" if actual else palabra
+        if ancho_texto(candidata, fuente, alto) <= ancho_max:
+            actual = candidata
+            continue
+        if not actual or ancho_texto(palabra, fuente, alto) > ancho_max:
+            return None
+        lineas.append(actual)
+        actual = palabra
+        if len(lineas) >= max_lineas:
+            return None
+    if actual:
+        lineas.append(actual)
+    return lineas if len(lineas) <= max_lineas else None
+
+
+def _abreviar(palabras):
+    """Devuelve (yield) versiones cada vez más cortas del texto"""
+    palabras = [ABREVIATURAS.get(p.lower(), p) for p in palabras]
+    yield palabras
+    sin_particulas = [p for p in palabras if p.lower() not in PARTICULAS]
+    if len(sin_particulas) != len(palabras) and sin_particulas:
+        palabras = sin_particulas
+        yield palabras
+    # Iniciales para las palabras del medio (segundo nombre, etc.)
+    for i in range(1, len(palabras) - 1):
+        if not palabras[i].endswith('.'):
+            palabras = palabras[:i] + [f"{palabras[i][0]}."] + palabras[i + 1:]
+            yield palabras
+    if len(palabras) > 1 and not palabras[0].endswith('.'):
+        yield [f"{palabras[0][0]}."] + palabras[1:]
+
+
+@lru_cache(maxsize=4096)
+def ajustar_texto(texto, ancho_max, alto, alto_minimo=None, max_lineas=1, fuente='0'):
+    """
+    Elige cómo imprimir 'texto' en 'ancho_max' dots para que entre a la
+    primera. En orden: tal cual, achicando la fuente hasta 'alto_minimo',
+    partiendo en hasta 'max_lineas' líneas con ^FB, abreviando y, como
+    último recurso, cortando con un punto final.
+    """
+    texto = " ".join(limpiar_campo(texto).split())
+    alto_minimo = alto_minimo or alto
+
+    if ancho_texto(texto, fuente, alto) <= ancho_max:
+        return Ajuste(texto, alto, 1, ancho_max, 'original')
+
+    for tamano in range(alto - 1, alto_minimo - 1, -1):
+        if ancho_texto(texto, fuente, tamano) <= ancho_max:
+            return Ajuste(texto, tamano, 1, ancho_max, 'reducido')
+
+    palabras = texto.split(' ')
+    if max_lineas > 1:
+        lineas = _partir_en_lineas(palabras, fuente, alto, ancho_max, max_lineas)
+        if lineas:
+            return Ajuste("\\&".join(lineas), alto, len(lineas), ancho_max, 'multilinea')
+
+    for version in _abreviar(palabras):
+        abreviado = " ".join(version)
+        if ancho_texto(abreviado, fuente, alto_minimo) <= ancho_max:
+            return Ajuste(abreviado, alto_minimo, 1, ancho_max, 'abreviado')
+
+    # Cortar carácter a carácter (sin pasarse del ancho) y marcar con un punto
+    cortado = abreviado
+    while cortado and ancho_texto(cortado + ".", fuente, alto_minimo) > ancho_max:
+        cortado = cortado[:-1]
+    return Ajuste(cortado.rstrip(' .') + ".", alto_minimo, 1, ancho_max, 'cortado')
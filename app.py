@@ -6,7 +6,11 @@ from PyQt5.QtWidgets import QMessageBox, QMainWindow
 # Importa la clase de la UI generada
 from PDCimpresora import Ui_MainWindow
 # Importar el módulo de ID de hardware con protección
-from hardware_id import get_unique_hardware_id, get_hardware_info, verify_authorized_hardware
+from hardware_id import HardwareID, get_unique_hardware_id, get_hardware_info, verify_authorized_hardware
+from diario_impresiones import DiarioImpresiones
+from perfilado import iniciar_perfilado_si_corresponde
+from normalizacion_pacientes import normalizar_paciente, DatosInvalidos
+from instancia_unica import InstanciaUnica
 
 class MyMainWindow(QMainWindow):
     def __init__(self):
@@ -32,10 +36,21 @@ class MyMainWindow(QMainWindow):
         
         # Mostrar información de autorización en la barra de título
         self.setWindowTitle(f"PDC Impresora [AUTORIZADO] - ID: {self.hardware_id[:8]}...")
+
+        # Diario encadenado por hash: registro auditable de cada pulsera emitida
+        self.diario = DiarioImpresiones()
         
         # Conectar señales (botones, etc.)
-        self.ui.btnImprimir.clicked.connect(self.guardar_datos_en_txt)
+        # (lambda: el slot puede estar envuelto por el perfilado y no debe recibir 'checked')
+        self.ui.btnImprimir.clicked.connect(lambda: self.guardar_datos_en_txt())
     
+    def recibir_argumentos(self, argumentos, directorio=""):
+        """Otra instancia se abrió en este puesto: traer esta ventana al frente"""
+        if self.isMinimized():
+            self.showNormal()
+        self.raise_()
+        self.activateWindow()
+
     def show_unauthorized_access(self, message):
         """Muestra mensaje de acceso no autorizado"""
         app = QtWidgets.QApplication.instance()
@@ -111,17 +126,20 @@ La aplicación se cerrará por seguridad.""")
             QMessageBox.critical(self, "ERROR DE SEGURIDAD", f"Error en verificación: {e}")
             sys.exit(1)
         
-        nombre_paciente = self.ui.txtNombrePaciente.text()
-        dni_paciente = self.ui.txtDniPaciente.text()
-        nacimiento_paciente = self.ui.txtNacimiento.text()
-        nombre_hospital = self.ui.txtNombreHospital.text()
-        dimension_impresion = self.ui.boxDimensionesImpresion.currentText()
-
-        # Validar que los campos no estén vacíos
-        if not nombre_paciente or not dni_paciente or not nacimiento_paciente or not nombre_hospital:
-            QMessageBox.warning(self, "Campos Vacíos", "Por favor, complete todos los campos antes de imprimir.")
+        # Validar y normalizar (fecha completa, nombre capitalizado, DNI sin puntos)
+        try:
+            datos = normalizar_paciente(self.ui.txtNombrePaciente.text(), self.ui.txtDniPaciente.text(),
+                                        self.ui.txtNacimiento.text(), self.ui.txtNombreHospital.text())
+        except DatosInvalidos as e:
+            QMessageBox.warning(self, "Datos Inválidos", f"Revise los datos antes de guardar:\n\n{e}")
             return
 
+        nombre_paciente = datos['nombre']
+        dni_paciente = datos['dni']
+        nacimiento_paciente = datos['nacimiento']
+        nombre_hospital = datos['hospital']
+        dimension_impresion = self.ui.boxDimensionesImpresion.currentText()
+
         nombre_archivo = "registro_impresiones.txt"
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
@@ -147,6 +165,15 @@ ID Hardware generado: {hw_summary['generated_at']}
             with open(nombre_archivo, 'a', encoding='utf-8') as f:
                 f.write(linea_datos)
 
+            self.diario.registrar({
+                'hospital': nombre_hospital,
+                'paciente': nombre_paciente,
+                'dni': dni_paciente,
+                'nacimiento': nacimiento_paciente,
+                'formato': dimension_impresion,
+                'hardware_id': hw_summary['hardware_id']
+            })
+
             # Mostrar mensaje de éxito con información de seguridad
             mensaje_exito = f"""✓ Datos guardados correctamente en '{nombre_archivo}'.
 
@@ -202,10 +229,25 @@ Cualquier intento de uso en otra máquina será bloqueado."""
 
 # Esto es lo que se ejecuta cuando corres este script
 if __name__ == "__main__":
+    # Modo perfilado opcional: PDC_PERFIL=1 o --perfil (incluye las sondas de hardware)
+    iniciar_perfilado_si_corresponde([
+        (MyMainWindow, ['guardar_datos_en_txt', 'get_hardware_summary', 'mostrar_info_seguridad']),
+        (HardwareID, ['get_cpu_id', 'get_motherboard_serial', 'get_disk_serial', 'get_mac_address',
+                      'generate_hardware_fingerprint', 'verify_hardware_authorization']),
+    ])
+
+    # Una sola instancia por puesto: un segundo lanzamiento le pasa sus
+    # argumentos a la ventana abierta y termina sin repetir la verificación de hardware
+    instancia = InstanciaUnica()
+    if not instancia.adquirir():
+        sys.exit(0 if instancia.reenviar(sys.argv[1:]) else 1)
+
     app = QtWidgets.QApplication(sys.argv)
+    instancia.escuchar()
     
     try:
         window = MyMainWindow()
+        instancia.entregar_a(window.recibir_argumentos)
         
         # Mostrar información de hardware autorizado al iniciar
         print(f"🔒 Aplicación AUTORIZADA iniciada con Hardware ID: {window.hardware_id}")
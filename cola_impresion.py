@@ -0,0 +1,439 @@
+# cola_impresion.py
+import os
+import json
+import time
+import hashlib
+import threading
+
+from transporte_impresora import crear_transporte, unir
+from salud_impresoras import ImpresoraNoDisponible
+
+# Segundos durante los que una misma pulsera se considera duplicada
+VENTANA_DUPLICADOS = 30
+
+# Clases de prioridad (menor número = más urgente)
+PRIORIDAD_STAT = 0      # Pulseras de emergencia
+PRIORIDAD_RUTINA = 1    # Admisiones normales
+PRIORIDAD_LOTE = 2      # Reimpresiones masivas
+NOMBRES_PRIORIDAD = {PRIORIDAD_STAT: "STAT", PRIORIDAD_RUTINA: "rutina", PRIORIDAD_LOTE: "lote"}
+
+# Cada cuántos segundos de espera un trabajo sube una clase de prioridad.
+# Nunca llega a STAT: una emergencia no espera detrás de un lote envejecido.
+ENVEJECIMIENTO_SEGUNDOS = 60
+
+# Etiquetas que se dejan en el buffer de la impresora antes de enviar más
+# (salvo STAT). Si la impresora tuviera 500 etiquetas de un lote en su
+# buffer, adelantar una emergencia en la cola no serviría de nada.
+MAXIMO_EN_BUFFER = 2
+ESPERA_BUFFER_SEGUNDOS = 0.2
+# El estado del buffer (~HS) es una conexión aparte, así que no se consulta
+# por etiqueta: entre consultas se estima sumando lo enviado y solo se vuelve
+# a preguntar cuando la estimación llega al máximo. Con la impresora llena, la
+# consulta se repite cada ESPERA_BUFFER_SEGUNDOS, no más seguido.
+# Un destino que no informa su buffer se vuelve a consultar pasado este tiempo
+REINTENTO_ESTADO_SEGUNDOS = 60
+# Sin estado del buffer, cada etiqueta enviada se cuenta "en vuelo" durante
+# este tiempo (lo que tarda en imprimirse una pulsera): nunca hay más de
+# MAXIMO_EN_BUFFER en vuelo, así una STAT no queda detrás de todo un lote
+ETIQUETA_EN_VUELO_SEGUNDOS = 2.0
+
+
+def clave_idempotencia(nombre, dni, nacimiento, hospital, formato):
+    """
+    Clave de idempotencia de un trabajo: mismo paciente + mismo formato
+    = misma clave, sin importar mayúsculas ni espacios de más.
+    """
+    partes = [" ".join(str(campo).split()).lower() for campo in (nombre, dni, nacimiento, hospital, formato)]
+    return hashlib.sha256("\x1f".join(partes).encode('utf-8')).hexdigest()[:32]
+
+
+class TrabajoImpresion:
+    """
+    Trabajo de impresión: clave, una o más etiquetas ZPL, transporte de
+    destino y prioridad. Cada etiqueta es bytes o una tupla de segmentos de
+    bytes (PlantillaZPL.renderizar); una lista son varias etiquetas. Las
+    etiquetas se envían de a una, de modo que un trabajo más urgente puede
+    adelantarse entre etiqueta y etiqueta.
+    Un trabajo atómico (juego vinculado, p.ej. madre / bebé) va en un solo
+    envío: nada se intercala entre sus etiquetas y nunca queda a medias.
+    """
+
+    def __init__(self, clave, zpl, transporte, datos=None, prioridad=PRIORIDAD_RUTINA, atomico=False):
+        self.clave = clave
+        self.etiquetas = list(zpl) if isinstance(zpl, list) else [zpl]
+        self.atomico = atomico
+        if atomico and len(self.etiquetas) > 1:
+            # Todo el juego como una sola "etiqueta" de segmentos: un envío, un avance
+            self.etiquetas = [tuple(segmento for etiqueta in self.etiquetas
+                                    for segmento in (etiqueta if isinstance(etiqueta, tuple) else (etiqueta,)))]
+        self.transporte = transporte
+        self.datos = datos or {}
+        self.prioridad = prioridad
+        self.creado = time.time()
+        self.enviadas = 0
+        self.ultimo_turno = self.creado
+
+    @property
+    def terminado(self):
+        return self.enviadas >= len(self.etiquetas)
+
+    def prioridad_efectiva(self, ahora):
+        """Prioridad con envejecimiento: protege a rutina y lotes de la inanición"""
+        if self.prioridad == PRIORIDAD_STAT:
+            return PRIORIDAD_STAT
+        subidas = int((ahora - self.creado) // ENVEJECIMIENTO_SEGUNDOS)
+        return max(PRIORIDAD_RUTINA, self.prioridad - subidas)
+
+    def a_dict(self):
+        return {'clave': self.clave, 'etiquetas': [unir(e).decode('utf-8') for e in self.etiquetas],
+                'enviadas': self.enviadas, 'datos': self.datos, 'prioridad': self.prioridad,
+                'transporte': self.transporte.a_dict(), 'creado': self.creado, 'atomico': self.atomico}
+
+    @classmethod
+    def desde_dict(cls, datos):
+        trabajo = cls(datos['clave'], [e.encode('utf-8') for e in datos['etiquetas']],
+                      crear_transporte(datos['transporte']), datos.get('datos'),
+                      datos.get('prioridad', PRIORIDAD_RUTINA), datos.get('atomico', False))
+        trabajo.creado = datos.get('creado', trabajo.creado)
+        trabajo.enviadas = datos.get('enviadas', 0)
+        return trabajo
+
+
+class _ColaImpresora:
+    """
+    Cola de una impresora con su propio hilo. Antes de cada etiqueta elige el
+    trabajo con mejor prioridad efectiva; entre iguales, el que hace más
+    tiempo que no recibe turno (así un lote envejecido se intercala con la
+    rutina en lugar de acapararla).
+    """
+
+    def __init__(self, procesar_etiqueta, puede_enviar, fallar):
+        self._procesar_etiqueta = procesar_etiqueta
+        self._puede_enviar = puede_enviar
+        # fallar(trabajo, error): termina con error un trabajo que hizo fallar el paso
+        self._fallar = fallar
+        self._condicion = threading.Condition()
+        self._trabajos = []
+        self._activa = True
+        self._hilo = threading.Thread(target=self._trabajar, daemon=True)
+        self._hilo.start()
+
+    def agregar(self, trabajo):
+        with self._condicion:
+            self._trabajos.append(trabajo)
+            self._condicion.notify()
+
+    def _siguiente(self):
+        ahora = time.time()
+        return min(self._trabajos, key=lambda t: (t.prioridad_efectiva(ahora), t.ultimo_turno))
+
+    def _trabajar(self):
+        while True:
+            with self._condicion:
+                while self._activa and not self._trabajos:
+                    self._condicion.wait()
+                if not self._trabajos:
+                    return
+                trabajo = self._siguiente()
+
+            try:
+                if not self._puede_enviar(trabajo):
+                    # Impresora con el buffer lleno: esperar y volver a elegir,
+                    # por si mientras tanto llegó algo más urgente
+                    time.sleep(ESPERA_BUFFER_SEGUNDOS)
+                    continue
+                trabajo.ultimo_turno = time.time()
+
+                continuar = self._procesar_etiqueta(trabajo)
+            except Exception as e:
+                # Un error inesperado (spool, redirección) falla el trabajo, no el hilo:
+                # si el hilo muriera, los trabajos siguientes de esta impresora quedarían colgados
+                print(f"✗ Error en la cola de impresión ({trabajo.clave}): {e}")
+                self._fallar(trabajo, str(e))
+                continuar = False
+
+            if not continuar or trabajo.terminado:
+                with self._condicion:
+                    self._trabajos.remove(trabajo)
+
+    def detener(self):
+        """Termina el hilo después de enviar lo que ya está en la cola"""
+        with self._condicion:
+            self._activa = False
+            self._condicion.notify()
+        self._hilo.join()
+
+
+class ColaImpresion:
+    """
+    Cola de impresión con una cola y un hilo por impresora, prioridades
+    (STAT, rutina, lote) y supresión de duplicados. Un trabajo se descarta
+    si su clave está reservada (el operador está eligiendo impresora), en
+    la cola, en el spool, o se imprimió hace menos de 'ventana' segundos
+    según la memoria de la sesión o el diario.
+    """
+
+    def __init__(self, carpeta_spool="spool", diario=None, ventana=VENTANA_DUPLICADOS, al_terminar=None,
+                 preparar_etiqueta=None, redirigir=None, etiqueta_enviada=None):
+        self.carpeta_spool = carpeta_spool
+        self.diario = diario
+        self.ventana = ventana
+        # Callback al_terminar(trabajo, ok, error): se llama desde el hilo de envío
+        self.al_terminar = al_terminar
+        # preparar_etiqueta(transporte, etiqueta) -> etiqueta: último paso antes
+        # de enviar (p.ej. agregar la descarga del logo), en el hilo de envío
+        self.preparar_etiqueta = preparar_etiqueta
+        # etiqueta_enviada(transporte, etiqueta, error): resultado de cada envío
+        # de una etiqueta preparada (error None si salió), en el hilo de envío
+        self.etiqueta_enviada = etiqueta_enviada
+        # redirigir(transporte) -> otro transporte o None: adónde mandar los
+        # trabajos de una impresora caída (circuito abierto); sin él, fallan al instante
+        self.redirigir = redirigir
+        self._lock = threading.Lock()
+        self._colas = {}         # destino -> _ColaImpresora
+        self._iniciada = False
+        self._reservadas = set()
+        self._pendientes = {}    # clave -> trabajo (en cola o enviándose)
+        self._completadas = {}   # clave -> instante en que se imprimió
+        self._fallidas = set()   # claves que no llegaron a imprimirse: se pueden reintentar
+        self._en_espera = []     # trabajos recibidos antes de iniciar()
+        self._buffer = {}        # destino -> formatos estimados en el buffer desde la última ~HS
+        self._sin_estado = {}    # destino que no informa su buffer -> instante del último intento
+        self._en_vuelo = {}      # destino sin estado -> instantes de los últimos envíos
+        os.makedirs(carpeta_spool, exist_ok=True)
+
+    def _ruta_spool(self, clave):
+        return os.path.join(self.carpeta_spool, f"{clave}.json")
+
+    def es_duplicado(self, clave):
+        with self._lock:
+            if clave in self._reservadas or clave in self._pendientes:
+                return True
+            impreso = self._completadas.get(clave)
+            if impreso is not None:
+                return time.time() - impreso <= self.ventana
+            if clave in self._fallidas:
+                return False
+        if os.path.exists(self._ruta_spool(clave)):
+            return True
+        return self.diario is not None and self.diario.registrada_recientemente(clave, self.ventana)
+
+    def reservar(self, clave):
+        """
+        Reserva la clave mientras se arma el trabajo (diálogos, registro).
+        Retorna False si ya era un duplicado.
+        """
+        if self.es_duplicado(clave):
+            return False
+        with self._lock:
+            self._reservadas.add(clave)
+        return True
+
+    def liberar(self, clave):
+        """Libera una reserva que no llegó a la cola (cancelada o con error)"""
+        with self._lock:
+            if clave in self._reservadas:
+                self._reservadas.discard(clave)
+                # Pudo quedar en el diario, pero no se imprimió: se puede reintentar
+                self._fallidas.add(clave)
+
+    def enviar(self, trabajo):
+        """
+        Agrega el trabajo a la cola. Retorna False si se descartó por duplicado.
+        La reserva de la propia clave (si existe) no cuenta como duplicado.
+        """
+        with self._lock:
+            reservada = trabajo.clave in self._reservadas
+            self._reservadas.discard(trabajo.clave)
+        if not reservada and self.es_duplicado(trabajo.clave):
+            return False
+
+        # El spool sobrevive a un cierre de la aplicación con trabajos pendientes
+        self._guardar_spool(trabajo)
+        with self._lock:
+            self._pendientes[trabajo.clave] = trabajo
+            self._fallidas.discard(trabajo.clave)
+        self._encolar(trabajo)
+        return True
+
+    def _guardar_spool(self, trabajo):
+        with open(self._ruta_spool(trabajo.clave), 'w', encoding='utf-8') as f:
+            json.dump(trabajo.a_dict(), f, ensure_ascii=False)
+
+    def _destino(self, trabajo):
+        return f"{trabajo.transporte.tipo}:{trabajo.transporte.destino}"
+
+    def _encolar(self, trabajo):
+        destino = self._destino(trabajo)
+        with self._lock:
+            if not self._iniciada:
+                self._en_espera.append(trabajo)
+                return
+            cola = self._colas.get(destino)
+            if cola is None:
+                cola = self._colas[destino] = _ColaImpresora(self._procesar_etiqueta, self._puede_enviar,
+                                                             self._fallar)
+        cola.agregar(trabajo)
+
+    def recuperar_spool(self):
+        """Vuelve a encolar los trabajos que quedaron en el spool. Retorna cuántos."""
+        recuperados = 0
+        for nombre in sorted(os.listdir(self.carpeta_spool)):
+            if not nombre.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.carpeta_spool, nombre), 'r', encoding='utf-8') as f:
+                    trabajo = TrabajoImpresion.desde_dict(json.load(f))
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+            with self._lock:
+                if trabajo.clave in self._pendientes:
+                    continue
+                self._pendientes[trabajo.clave] = trabajo
+            self._encolar(trabajo)
+            recuperados += 1
+        return recuperados
+
+    def _ventana_libre(self, destino, ahora):
+        """Destino que no informa su buffer: True si hay lugar en la ventana de envíos en vuelo"""
+        with self._lock:
+            en_vuelo = [instante for instante in self._en_vuelo.get(destino, ())
+                        if ahora - instante < ETIQUETA_EN_VUELO_SEGUNDOS]
+            self._en_vuelo[destino] = en_vuelo
+            return len(en_vuelo) < MAXIMO_EN_BUFFER
+
+    def _puede_enviar(self, trabajo):
+        """Las STAT salen siempre; el resto espera si el buffer de la impresora está lleno"""
+        if trabajo.prioridad == PRIORIDAD_STAT:
+            return True
+        if not getattr(trabajo.transporte, 'controlar_flujo', True):
+            return True
+        destino = self._destino(trabajo)
+        ahora = time.monotonic()
+        consultar = getattr(trabajo.transporte, 'formatos_en_buffer', None)
+        if consultar is None:
+            return self._ventana_libre(destino, ahora)
+        with self._lock:
+            intento = self._sin_estado.get(destino)
+            sin_estado = intento is not None and ahora - intento < REINTENTO_ESTADO_SEGUNDOS
+            if not sin_estado and self._buffer.get(destino, MAXIMO_EN_BUFFER) < MAXIMO_EN_BUFFER:
+                return True
+        if sin_estado:
+            return self._ventana_libre(destino, ahora)
+        try:
+            formatos = consultar()
+        except (ValueError, IndexError):
+            # Responde otra cosa (no es una Zebra o tiene ~HS deshabilitado):
+            # hasta el próximo intento se usa la ventana de envíos en vuelo
+            with self._lock:
+                self._sin_estado[destino] = ahora
+            return self._ventana_libre(destino, ahora)
+        except OSError:
+            # Sin respuesta de estado: el envío dirá si la impresora está caída
+            return True
+        with self._lock:
+            self._buffer[destino] = formatos
+            self._sin_estado.pop(destino, None)
+        return formatos < MAXIMO_EN_BUFFER
+
+    def _procesar_etiqueta(self, trabajo):
+        """
+        Envía la siguiente etiqueta del trabajo. Retorna False si el trabajo
+        terminó con error o pasó a otra impresora y no debe seguir en esta cola.
+        """
+        error = ""
+        transporte = trabajo.transporte
+        try:
+            etiqueta = trabajo.etiquetas[trabajo.enviadas]
+            if self.preparar_etiqueta:
+                etiqueta = self.preparar_etiqueta(transporte, etiqueta)
+            try:
+                transporte.enviar(etiqueta)
+            except Exception as e:
+                if self.etiqueta_enviada:
+                    self.etiqueta_enviada(transporte, etiqueta, e)
+                raise
+            if self.etiqueta_enviada:
+                self.etiqueta_enviada(transporte, etiqueta, None)
+            trabajo.enviadas += 1
+            ok = True
+            with self._lock:
+                destino = self._destino(trabajo)
+                if destino in self._buffer:
+                    self._buffer[destino] += 1
+                if destino in self._en_vuelo:
+                    self._en_vuelo[destino].append(time.monotonic())
+        except ImpresoraNoDisponible as e:
+            if self._redirigir(trabajo):
+                return False
+            ok, error = False, str(e)
+        except Exception as e:
+            ok, error = False, str(e)
+
+        if ok and not trabajo.terminado:
+            # Trabajos de varias etiquetas: el spool guarda el avance cada tanto
+            if trabajo.enviadas % 50 == 0:
+                try:
+                    self._guardar_spool(trabajo)
+                except OSError as e:
+                    # Solo se pierde el avance guardado: tras un cierre se repetirían etiquetas
+                    print(f"✗ No se pudo guardar el avance de {trabajo.clave} en el spool: {e}")
+            return True
+
+        self._terminar(trabajo, ok, error)
+        return ok
+
+    def _fallar(self, trabajo, error):
+        try:
+            self._terminar(trabajo, False, error)
+        except Exception as e:
+            print(f"✗ Error al cerrar el trabajo {trabajo.clave}: {e}")
+
+    def _terminar(self, trabajo, ok, error):
+        """Saca el trabajo de pendientes y del spool, y avisa el resultado"""
+        with self._lock:
+            self._pendientes.pop(trabajo.clave, None)
+            if ok:
+                ahora = time.time()
+                self._completadas = {clave: instante for clave, instante in self._completadas.items()
+                                     if ahora - instante <= self.ventana}
+                self._completadas[trabajo.clave] = ahora
+            else:
+                self._fallidas.add(trabajo.clave)
+        try:
+            os.remove(self._ruta_spool(trabajo.clave))
+        except OSError:
+            pass
+
+        if self.al_terminar:
+            self.al_terminar(trabajo, ok, error)
+
+    def _redirigir(self, trabajo):
+        """Pasa el trabajo (con lo que le falta enviar) a la cola de otra impresora"""
+        if self.redirigir is None:
+            return False
+        anterior = trabajo.transporte
+        nuevo = self.redirigir(anterior)
+        if nuevo is None or (nuevo.tipo, nuevo.destino) == (anterior.tipo, anterior.destino):
+            return False
+        trabajo.transporte = nuevo
+        trabajo.datos['redirigido_desde'] = anterior.destino
+        self._guardar_spool(trabajo)
+        self._encolar(trabajo)
+        return True
+
+    def iniciar(self):
+        with self._lock:
+            self._iniciada = True
+            en_espera, self._en_espera = self._en_espera, []
+        for trabajo in en_espera:
+            self._encolar(trabajo)
+
+    def detener(self):
+        """Termina los hilos después de enviar lo que ya está en las colas"""
+        with self._lock:
+            colas = list(self._colas.values())
+            self._colas = {}
+            self._iniciada = False
+        for cola in colas:
+            cola.detener()
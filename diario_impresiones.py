@@ -0,0 +1,295 @@
+# diario_impresiones.py
+import os
+import sys
+import json
+import hashlib
+import threading
+from datetime import datetime
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+# Hash de la "entrada cero": ancla de la cadena
+HASH_INICIAL = "0" * 64
+# Cada cuántas entradas se escribe un punto de control
+INTERVALO_PUNTO_CONTROL = 100
+# Claves de idempotencia recientes que se mantienen en memoria
+MAXIMO_RECIENTES = 4096
+
+
+def _bloquear(f):
+    """Bloqueo exclusivo del archivo entre procesos (espera si otro lo tiene)"""
+    if os.name == 'nt':
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _desbloquear(f):
+    if os.name == 'nt':
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class ErrorIntegridad(Exception):
+    """El diario fue modificado: la cadena de hashes no coincide"""
+    pass
+
+
+def _calcular_hash(anterior, seq, tipo, timestamp, datos):
+    contenido = json.dumps([anterior, seq, tipo, timestamp, datos],
+                           ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+class DiarioImpresiones:
+    """
+    Diario de impresiones encadenado por hash (una entrada JSON por línea).
+    Cada entrada incluye el hash de la anterior; cada INTERVALO_PUNTO_CONTROL
+    entradas se escribe un punto de control. La verificación continúa desde
+    el último punto de control verificado, guardado en un archivo aparte.
+    """
+
+    def __init__(self, ruta="diario_impresiones.jsonl", intervalo=INTERVALO_PUNTO_CONTROL):
+        self.ruta = ruta
+        self.ruta_verificado = f"{os.path.splitext(ruta)[0]}.verificado.json"
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._ultimo_seq = None
+        self._ultimo_hash = None
+        # Tamaño del archivo tras nuestra última escritura: si cambió, escribió otro proceso
+        self._tamano = None
+        # Entradas cortadas (corte de luz a mitad de una escritura) que se sacaron del diario
+        self.ruta_cortadas = f"{os.path.splitext(ruta)[0]}.cortadas.txt"
+        # Bytes de la última entrada incompleta que encontró verificar() (0 si no había)
+        self.cola_cortada = 0
+        # clave de idempotencia -> instante (epoch) de las impresiones más recientes
+        self._recientes = {}
+
+    # ---------------------------- escritura ----------------------------
+
+    def _cargar_ultima_entrada(self):
+        """
+        Lee solo el final del archivo para retomar la cadena. Una última
+        entrada sin el salto de línea final quedó cortada: no cuenta.
+        """
+        self._ultimo_seq, self._ultimo_hash = 0, HASH_INICIAL
+        if not os.path.exists(self.ruta):
+            return
+        with open(self.ruta, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            tamano = f.tell()
+            bloque = 4096
+            while True:
+                inicio = max(0, tamano - bloque)
+                f.seek(inicio)
+                contenido = f.read()
+                lineas = contenido.split(b"\n")
+                # Lo que sigue al último salto de línea es una entrada cortada (o nada)
+                lineas.pop()
+                # La primera línea puede estar cortada si no empezamos en 0
+                completas = lineas if inicio == 0 else lineas[1:]
+                completas = [l for l in completas if l.strip()]
+                if completas or inicio == 0:
+                    break
+                bloque *= 2
+        entradas = []
+        for linea in completas:
+            try:
+                entradas.append(json.loads(linea.decode('utf-8')))
+            except ValueError:
+                continue   # La reporta verificar(); no debe frenar la impresión
+        if entradas:
+            self._ultimo_seq, self._ultimo_hash = entradas[-1]['seq'], entradas[-1]['hash']
+            # Las claves del último bloque alcanzan para detectar duplicados recientes
+            for entrada in entradas:
+                self._recordar(entrada)
+
+    def _reparar_cola(self, f):
+        """
+        Con el archivo bloqueado: si el diario termina en una entrada cortada,
+        la pasa a ruta_cortadas y trunca el diario en la última entrada
+        completa. Retorna True si hubo que reparar.
+        """
+        fd = f.fileno()
+        tamano = os.fstat(fd).st_size
+        bloque = 4096
+        while True:
+            inicio = max(0, tamano - bloque)
+            os.lseek(fd, inicio, os.SEEK_SET)
+            contenido = b""
+            while len(contenido) < tamano - inicio:
+                leido = os.read(fd, tamano - inicio - len(contenido))
+                if not leido:
+                    break
+                contenido += leido
+            if not contenido or contenido.endswith(b"\n"):
+                return False
+            corte = contenido.rfind(b"\n")
+            if corte >= 0 or inicio == 0:
+                break
+            bloque *= 2
+        completo = inicio + corte + 1
+        cola = contenido[corte + 1:]
+        with open(self.ruta_cortadas, 'ab') as cortadas:
+            cortadas.write(f"[{datetime.now().isoformat(timespec='seconds')}] offset {completo}: ".encode('utf-8')
+                           + cola + b"\n")
+        os.ftruncate(fd, completo)
+        print(f"✗ Diario {self.ruta}: última entrada cortada ({len(cola)} bytes), movida a {self.ruta_cortadas}")
+        return True
+
+    def _recordar(self, entrada):
+        clave = entrada.get('datos', {}).get('clave')
+        if clave:
+            self._recientes[clave] = datetime.fromisoformat(entrada['timestamp']).timestamp()
+            if len(self._recientes) > MAXIMO_RECIENTES:
+                # Conservar solo la mitad más nueva
+                ordenadas = sorted(self._recientes.items(), key=lambda item: item[1])
+                self._recientes = dict(ordenadas[len(ordenadas) // 2:])
+
+    def _escribir(self, f, tipo, datos):
+        seq = self._ultimo_seq + 1
+        timestamp = datetime.now().isoformat(timespec='seconds')
+        hash_entrada = _calcular_hash(self._ultimo_hash, seq, tipo, timestamp, datos)
+        entrada = {'seq': seq, 'tipo': tipo, 'timestamp': timestamp, 'datos': datos,
+                   'anterior': self._ultimo_hash, 'hash': hash_entrada}
+        f.write(json.dumps(entrada, ensure_ascii=False, sort_keys=True) + "\n")
+        self._ultimo_seq, self._ultimo_hash = seq, hash_entrada
+        return entrada
+
+    def registrar(self, datos):
+        """
+        Agrega una impresión al diario. 'datos' es un diccionario serializable.
+        Retorna la entrada escrita (incluye seq y hash).
+        """
+        return self.registrar_varias([datos])[0]
+
+    def registrar_varias(self, lista_datos):
+        """
+        Agrega varias impresiones (un lote) con un solo fsync al final.
+        Otra instancia puede escribir el mismo diario: el archivo queda
+        bloqueado durante el agregado y, si creció desde nuestra última
+        escritura, se relee el final para seguir la cadena desde ahí.
+        Retorna las entradas escritas.
+        """
+        entradas = []
+        # a+: se puede leer el final para repararlo; las escrituras van siempre al final
+        with self._lock, open(self.ruta, 'a+', encoding='utf-8') as f:
+            _bloquear(f)
+            try:
+                reparado = self._reparar_cola(f)
+                if reparado or self._ultimo_hash is None or os.fstat(f.fileno()).st_size != self._tamano:
+                    self._cargar_ultima_entrada()
+                for datos in lista_datos:
+                    entrada = self._escribir(f, 'impresion', datos)
+                    if entrada['seq'] % self.intervalo == self.intervalo - 1:
+                        # El punto de control ocupa el siguiente número de la secuencia
+                        self._escribir(f, 'punto_control', {'hasta_seq': entrada['seq']})
+                    entradas.append(entrada)
+                f.flush()
+                os.fsync(f.fileno())
+                self._tamano = os.fstat(f.fileno()).st_size
+            finally:
+                _desbloquear(f)
+            for entrada in entradas:
+                self._recordar(entrada)
+            return entradas
+
+    def registrada_recientemente(self, clave, ventana):
+        """True si la clave de idempotencia se registró en los últimos 'ventana' segundos"""
+        with self._lock:
+            if self._ultimo_hash is None:
+                self._cargar_ultima_entrada()
+            instante = self._recientes.get(clave)
+        return instante is not None and datetime.now().timestamp() - instante <= ventana
+
+    # --------------------------- verificación ---------------------------
+
+    def _leer_verificado(self):
+        try:
+            with open(self.ruta_verificado, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'seq': 0, 'hash': HASH_INICIAL, 'offset': 0}
+
+    def _guardar_verificado(self, estado):
+        temporal = f"{self.ruta_verificado}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(estado, f)
+        os.replace(temporal, self.ruta_verificado)
+
+    def verificar(self, completo=False):
+        """
+        Verifica la cadena. Por defecto solo recorre las entradas posteriores
+        al último punto de control verificado (costo O(entradas nuevas));
+        con completo=True rehace la verificación desde el principio.
+        Una última entrada sin salto de línea (corte durante la escritura) no
+        rompe la cadena: se informa en cola_cortada y la próxima escritura la
+        saca del diario.
+        Retorna la cantidad de entradas verificadas o lanza ErrorIntegridad.
+        """
+        self.cola_cortada = 0
+        if not os.path.exists(self.ruta):
+            return 0
+
+        estado = {'seq': 0, 'hash': HASH_INICIAL, 'offset': 0} if completo else self._leer_verificado()
+        seq_esperado, hash_anterior = estado['seq'] + 1, estado['hash']
+        verificadas = 0
+
+        if os.path.getsize(self.ruta) < estado['offset']:
+            raise ErrorIntegridad(f"Diario truncado antes del punto de control seq {estado['seq']}")
+
+        with open(self.ruta, 'rb') as f:
+            # La primera entrada leída debe encadenar con el punto de control guardado
+            f.seek(estado['offset'])
+            offset = estado['offset']
+            for linea in f:
+                offset += len(linea)
+                if not linea.strip():
+                    continue
+                if not linea.endswith(b"\n"):
+                    self.cola_cortada = len(linea)
+                    break
+                try:
+                    entrada = json.loads(linea.decode('utf-8'))
+                except ValueError:
+                    raise ErrorIntegridad(f"Entrada ilegible después de seq {seq_esperado - 1}")
+
+                if entrada.get('seq') != seq_esperado or entrada.get('anterior') != hash_anterior:
+                    raise ErrorIntegridad(f"Cadena rota en seq {seq_esperado}")
+                calculado = _calcular_hash(hash_anterior, entrada['seq'], entrada.get('tipo'),
+                                           entrada.get('timestamp'), entrada.get('datos'))
+                if calculado != entrada.get('hash'):
+                    raise ErrorIntegridad(f"Entrada modificada en seq {seq_esperado}")
+
+                seq_esperado, hash_anterior = seq_esperado + 1, calculado
+                verificadas += 1
+                if entrada.get('tipo') == 'punto_control':
+                    estado = {'seq': entrada['seq'], 'hash': calculado, 'offset': offset}
+
+        self._guardar_verificado(estado)
+        return verificadas
+
+
+# Para auditoría desde la línea de comandos
+if __name__ == "__main__":
+    ruta = "diario_impresiones.jsonl"
+    argumentos = [a for a in sys.argv[1:] if not a.startswith('--')]
+    if argumentos:
+        ruta = argumentos[0]
+
+    try:
+        diario = DiarioImpresiones(ruta)
+        cantidad = diario.verificar(completo="--completo" in sys.argv)
+        print(f"✓ Diario íntegro: {cantidad} entradas verificadas")
+        if diario.cola_cortada:
+            print(f"✗ La última entrada está cortada ({diario.cola_cortada} bytes): "
+                  f"la próxima impresión la mueve a {diario.ruta_cortadas}")
+    except ErrorIntegridad as e:
+        print(f"✗ DIARIO ALTERADO: {e}")
+        sys.exit(2)
@@ -0,0 +1,164 @@
+# etiquetas_referencia.py
+import os
+import re
+import csv
+import sys
+import json
+import time
+import difflib
+import argparse
+import datetime
+import statistics
+import unicodedata
+
+import ajuste_texto
+import plantillas_zpl
+from plantillas_zpl import FORMATOS, generar_segmentos
+from graficos_zpl import GraficoZPL
+
+CARPETA_REFERENCIAS = "etiquetas_referencia"
+# Fecha fija: la marca de tiempo de la etiqueta no debe cambiar entre corridas
+AHORA_REFERENCIA = datetime.datetime(2025, 6, 1, 20, 4, 5)
+# Logo sintético (un recuadro): cubre el campo ^XG sin depender de un archivo
+LOGO_REFERENCIA = GraficoZPL(b"\xff" * 4 + (b"\x80\x00\x00\x01" * 30) + b"\xff" * 4, 4, 32)
+
+# Pacientes de prueba: cortos, largos, con tildes, partículas y caracteres ZPL
+CORPUS = [
+    {'nombre': "leonardo fabian sombra", 'dni': "37738351", 'nacimiento': "15/10/93", 'hospital': "español"},
+    {'nombre': "Ana Paz", 'dni': "40111222", 'nacimiento': "01/01/2000", 'hospital': "Italiano"},
+    {'nombre': "María Fernanda de los Ángeles Gutiérrez Sombra Montenegro Villanueva Rodríguez",
+     'dni': "28999111", 'nacimiento': "29/02/1964",
+     'hospital': "Hospital Universitario Provincial de Maternidad Santa María de los Buenos Aires"},
+    {'nombre': "JOSÉ LUIS DEL VALLE", 'dni': "12345678", 'nacimiento': "1950-07-09", 'hospital': "Hospital de Clínicas"},
+    {'nombre': "Ñandú Üñez ^FS~JA", 'dni': "5", 'nacimiento': "", 'hospital': "San Roque ^XZ"},
+    {'nombre': "", 'dni': "", 'nacimiento': "", 'hospital': ""},
+]
+
+
+def _nombre_formato(formato):
+    formato = unicodedata.normalize('NFKD', formato).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r"[^0-9a-z]+", "_", formato.lower()).strip("_")
+
+
+def casos(corpus=None):
+    """(nombre del caso, formato, paciente, logo) para cada paciente x formato"""
+    for formato in FORMATOS:
+        for numero, paciente in enumerate(corpus or CORPUS):
+            yield f"{_nombre_formato(formato)}__{numero:02d}", formato, paciente, None
+        # Un caso con logo por formato alcanza para vigilar su posición
+        yield f"{_nombre_formato(formato)}__logo", formato, (corpus or CORPUS)[0], LOGO_REFERENCIA.referencia
+
+
+def renderizar(formato, paciente, logo=None):
+    return b"".join(generar_segmentos(formato, paciente['nombre'], paciente['dni'], paciente['nacimiento'],
+                                      paciente['hospital'], AHORA_REFERENCIA, logo))
+
+
+def _limpiar_caches():
+    plantillas_zpl._campo.cache_clear()
+    ajuste_texto.ajustar_texto.cache_clear()
+    ajuste_texto.ancho_texto.cache_clear()
+    plantillas_zpl._marca_tiempo_cacheada.cache_clear()
+    plantillas_zpl._paneles_madre.cache_clear()
+
+
+def medir(formato, paciente, logo=None, repeticiones=200):
+    """Tiempo de render en µs: en frío (caches vacías) y en caliente (mediana)"""
+    _limpiar_caches()
+    inicio = time.perf_counter()
+    renderizar(formato, paciente, logo)
+    frio = (time.perf_counter() - inicio) * 1e6
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        renderizar(formato, paciente, logo)
+        tiempos.append(time.perf_counter() - inicio)
+    return frio, statistics.median(tiempos) * 1e6
+
+
+def grabar(carpeta=CARPETA_REFERENCIAS, corpus=None):
+    """Guarda los bytes de cada caso como referencia. Retorna cuántos casos grabó."""
+    os.makedirs(carpeta, exist_ok=True)
+    indice = {}
+    for nombre, formato, paciente, logo in casos(corpus):
+        datos = renderizar(formato, paciente, logo)
+        with open(os.path.join(carpeta, f"{nombre}.zpl"), 'wb') as f:
+            f.write(datos)
+        indice[nombre] = {'formato': formato, 'paciente': paciente, 'logo': logo is not None, 'bytes': len(datos)}
+    with open(os.path.join(carpeta, "indice.json"), 'w', encoding='utf-8') as f:
+        json.dump(indice, f, ensure_ascii=False, indent=2)
+    return len(indice)
+
+
+def comparar(carpeta=CARPETA_REFERENCIAS, corpus=None, mostrar_diferencias=True):
+    """
+    Vuelve a generar cada caso y lo compara byte a byte con su referencia.
+    Retorna (distintos, faltantes, reporte por formato).
+    """
+    with open(os.path.join(carpeta, "indice.json"), 'r', encoding='utf-8') as f:
+        indice = json.load(f)
+
+    distintos, faltantes = [], []
+    reporte = {}
+    for nombre, formato, paciente, logo in casos(corpus):
+        fila = reporte.setdefault(formato, {'bytes': [], 'bytes_referencia': [], 'frio_us': [], 'caliente_us': []})
+        actual = renderizar(formato, paciente, logo)
+        frio, caliente = medir(formato, paciente, logo)
+        fila['bytes'].append(len(actual))
+        fila['frio_us'].append(frio)
+        fila['caliente_us'].append(caliente)
+
+        ruta = os.path.join(carpeta, f"{nombre}.zpl")
+        if nombre not in indice or not os.path.exists(ruta):
+            faltantes.append(nombre)
+            continue
+        with open(ruta, 'rb') as f:
+            referencia = f.read()
+        fila['bytes_referencia'].append(len(referencia))
+        if actual != referencia:
+            distintos.append(nombre)
+            if mostrar_diferencias:
+                diferencia = difflib.unified_diff(
+                    referencia.decode('utf-8').splitlines(), actual.decode('utf-8').splitlines(),
+                    f"referencia/{nombre}.zpl", f"actual/{nombre}.zpl", lineterm="")
+                print("\n".join(diferencia))
+    return distintos, faltantes, reporte
+
+
+def _imprimir_reporte(reporte):
+    print(f"{'formato':<36}{'bytes':>8}{'ref.':>8}{'dif.':>7}{'frío µs':>10}{'caliente µs':>13}")
+    for formato, fila in reporte.items():
+        actual = sum(fila['bytes'])
+        referencia = sum(fila['bytes_referencia'])
+        print(f"{formato:<36}{actual:>8}{referencia:>8}{actual - referencia:>+7}"
+              f"{statistics.mean(fila['frio_us']):>10.1f}{statistics.mean(fila['caliente_us']):>13.1f}")
+
+
+def cargar_corpus(ruta_csv):
+    """Corpus propio desde un CSV con columnas nombre,dni,nacimiento,hospital"""
+    with open(ruta_csv, 'r', encoding='utf-8', newline='') as f:
+        return [{campo: fila.get(campo, "") for campo in ('nombre', 'dni', 'nacimiento', 'hospital')}
+                for fila in csv.DictReader(f)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Graba o compara las etiquetas de referencia de cada formato")
+    parser.add_argument('--grabar', action='store_true', help="Regrabar las referencias con la salida actual")
+    parser.add_argument('--carpeta', default=CARPETA_REFERENCIAS)
+    parser.add_argument('--corpus', help="CSV de pacientes (nombre,dni,nacimiento,hospital) en lugar del corpus incluido")
+    args = parser.parse_args()
+
+    corpus = cargar_corpus(args.corpus) if args.corpus else None
+    if args.grabar:
+        print(f"✓ {grabar(args.carpeta, corpus)} etiquetas de referencia grabadas en {args.carpeta}")
+        sys.exit(0)
+
+    distintos, faltantes, reporte = comparar(args.carpeta, corpus)
+    _imprimir_reporte(reporte)
+    for nombre in faltantes:
+        print(f"? Sin referencia: {nombre} (grabar con --grabar)")
+    if distintos:
+        print(f"✗ {len(distintos)} etiquetas cambiaron: {', '.join(distintos)}")
+    else:
+        print("✓ Todas las etiquetas coinciden con la referencia")
+    sys.exit(1 if distintos or faltantes else 0)
@@ -0,0 +1,195 @@
+# exportar_historial.py
+import os
+import sys
+import csv
+import argparse
+from collections import Counter
+
+# Campos que se exportan, en el orden de las columnas
+COLUMNAS = ['fecha', 'hora', 'hospital', 'paciente', 'dni', 'nacimiento', 'formato']
+
+# Claves tal como aparecen en el registro -> nombre de columna.
+# Cubre tanto el formato de imprimir_Zebra.py como el de app.py
+CLAVES_REGISTRO = {
+    'hospital': 'hospital',
+    'paciente': 'paciente',
+    'dni': 'dni',
+    'nacimiento': 'nacimiento',
+    'ticket': 'formato',
+    'tipo de ticket': 'formato',
+    # Entrada de entrega (registro_entregas.txt; las versiones anteriores la
+    # dejaban en el registro de impresiones): la impresora aceptó el trabajo
+    'impresa en': 'impresora',
+}
+
+
+def _registro_vacio(linea_cabecera):
+    """Crea un registro a partir de la línea '[AAAA-MM-DD HH:MM:SS] ...'"""
+    cierre = linea_cabecera.find(']')
+    marca = linea_cabecera[1:cierre] if cierre > 0 else ""
+    fecha, _, hora = marca.partition(' ')
+    registro = dict.fromkeys(COLUMNAS, "")
+    registro['impresora'] = ""
+    registro['fecha'] = fecha
+    registro['hora'] = hora
+    return registro
+
+
+def leer_registros(ruta_log):
+    """
+    Recorre el registro de impresiones línea a línea y devuelve (yield) un
+    diccionario por entrada. Nunca carga el archivo completo en memoria.
+    Las entradas de entrega (trabajo aceptado por una impresora) traen
+    'impresora'; las de impresión registrada la dejan vacía.
+    """
+    registro = None
+    with open(ruta_log, 'r', encoding='utf-8', errors='replace') as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea:
+                continue
+            if linea.startswith('['):
+                if registro is not None:
+                    yield registro
+                registro = _registro_vacio(linea)
+                continue
+            if registro is None:
+                continue
+            clave, separador, valor = linea.partition(':')
+            if not separador:
+                continue
+            columna = CLAVES_REGISTRO.get(clave.strip().lower())
+            if columna:
+                # imprimir_Zebra.py deja una coma al final de cada valor
+                registro[columna] = valor.strip().rstrip(',').strip()
+    if registro is not None:
+        yield registro
+
+
+class EstadisticasImpresion:
+    """
+    Conteos por día, hospital y formato de las impresiones registradas, y por
+    impresora de las entregas (la impresora recién se conoce al terminar el
+    trabajo, que pudo ser redirigido a otra).
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.por_dia = Counter()
+        self.por_hospital = Counter()
+        self.por_formato = Counter()
+        self.por_impresora = Counter()
+
+    def agregar(self, registro):
+        self.total += 1
+        self.por_dia[registro['fecha']] += 1
+        self.por_hospital[registro['hospital']] += 1
+        self.por_formato[registro['formato']] += 1
+
+    def agregar_entrega(self, registro):
+        self.por_impresora[registro['impresora']] += 1
+
+    def filas(self):
+        """Filas (categoría, valor, cantidad) listas para CSV o XLSX"""
+        yield ('total', '', self.total)
+        for categoria, contador in (('dia', self.por_dia),
+                                    ('hospital', self.por_hospital),
+                                    ('formato', self.por_formato),
+                                    ('impresora', self.por_impresora)):
+            for valor, cantidad in sorted(contador.items()):
+                yield (categoria, valor, cantidad)
+
+
+class _SalidaCSV:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.archivo = open(ruta, 'w', newline='', encoding='utf-8-sig')
+        self.writer = csv.writer(self.archivo)
+        self.writer.writerow(COLUMNAS)
+
+    def escribir(self, registro):
+        self.writer.writerow([registro[c] for c in COLUMNAS])
+
+    def cerrar(self, estadisticas):
+        self.archivo.close()
+        ruta_estadisticas = self.ruta[:-4] if self.ruta.lower().endswith('.csv') else self.ruta
+        with open(f"{ruta_estadisticas}_estadisticas.csv", 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(['categoria', 'valor', 'cantidad'])
+            writer.writerows(estadisticas.filas())
+
+
+class _SalidaXLSX:
+    def __init__(self, ruta):
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            raise RuntimeError("Para exportar a XLSX, instala: python -m pip install openpyxl")
+
+        self.ruta = ruta
+        # write_only: las filas se vuelcan a disco a medida que se agregan
+        self.libro = Workbook(write_only=True)
+        self.hoja = self.libro.create_sheet("Impresiones")
+        self.hoja.append(COLUMNAS)
+
+    def escribir(self, registro):
+        self.hoja.append([registro[c] for c in COLUMNAS])
+
+    def cerrar(self, estadisticas):
+        hoja_estadisticas = self.libro.create_sheet("Estadisticas")
+        hoja_estadisticas.append(['categoria', 'valor', 'cantidad'])
+        for fila in estadisticas.filas():
+            hoja_estadisticas.append(list(fila))
+        self.libro.save(self.ruta)
+
+
+def exportar_historial(ruta_log, ruta_csv=None, ruta_xlsx=None, ruta_entregas=None):
+    """
+    Exporta el historial a CSV y/o XLSX y calcula las estadísticas, todo en
+    una única lectura del registro y con memoria constante. Las entregas
+    (registro aparte, si existe) solo suman al conteo por impresora.
+    Retorna el objeto EstadisticasImpresion.
+    """
+    salidas = []
+    if ruta_csv:
+        salidas.append(_SalidaCSV(ruta_csv))
+    if ruta_xlsx:
+        salidas.append(_SalidaXLSX(ruta_xlsx))
+
+    estadisticas = EstadisticasImpresion()
+    for registro in leer_registros(ruta_log):
+        if registro['impresora']:
+            estadisticas.agregar_entrega(registro)
+            continue
+        estadisticas.agregar(registro)
+        for salida in salidas:
+            salida.escribir(registro)
+    if ruta_entregas and os.path.exists(ruta_entregas):
+        for registro in leer_registros(ruta_entregas):
+            if registro['impresora']:
+                estadisticas.agregar_entrega(registro)
+
+    for salida in salidas:
+        salida.cerrar(estadisticas)
+    return estadisticas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta el historial de impresiones a CSV/XLSX")
+    parser.add_argument('--log', default="registro_impresiones.txt", help="Registro de impresiones a leer")
+    parser.add_argument('--entregas', default="registro_entregas.txt",
+                        help="Registro de entregas (impresora de cada trabajo), si existe")
+    parser.add_argument('--csv', help="Archivo CSV de salida")
+    parser.add_argument('--xlsx', help="Archivo XLSX de salida (requiere openpyxl)")
+    args = parser.parse_args()
+
+    try:
+        estadisticas = exportar_historial(args.log, args.csv, args.xlsx, args.entregas)
+    except Exception as e:
+        print(f"✗ Error al exportar: {e}")
+        sys.exit(1)
+
+    print(f"✓ {estadisticas.total} impresiones procesadas")
+    for categoria, valor, cantidad in estadisticas.filas():
+        if categoria != 'total':
+            print(f"  {categoria:<10} {valor:<40} {cantidad}")
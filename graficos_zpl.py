@@ -0,0 +1,244 @@
+# graficos_zpl.py
+import os
+import time
+import base64
+import re
+import hashlib
+import zlib
+import binascii
+import threading
+
+from transporte_impresora import unir
+from salud_impresoras import ImpresoraNoDisponible
+
+# Dónde se guardan los gráficos en la impresora (E: = flash, sobrevive a reinicios)
+UNIDAD_GRAFICOS = "E"
+# Tamaño máximo del logo en dots (cabe en la esquina de todas las etiquetas)
+ANCHO_MAXIMO_LOGO = 120
+ALTO_MAXIMO_LOGO = 60
+# Si el directorio (^HW) no confirma el gráfico, no se vuelve a consultar por este tiempo
+REINTENTO_DIRECTORIO_SEGUNDOS = 300
+
+# Compresión ACS: repeticiones 1-19 -> G..Y, múltiplos de 20 (20-400) -> g..z
+_ACS_UNIDADES = " GHIJKLMNOPQRSTUVWXY"
+_ACS_VEINTES = " ghijklmnopqrstuvwxyz"
+
+
+def _repeticion_acs(cantidad):
+    codigo = []
+    while cantidad >= 400:
+        codigo.append('z')
+        cantidad -= 400
+    if cantidad >= 20:
+        codigo.append(_ACS_VEINTES[cantidad // 20])
+        cantidad %= 20
+    if cantidad > 1:
+        codigo.append(_ACS_UNIDADES[cantidad])
+    return "".join(codigo)
+
+
+def comprimir_acs(filas, ancho_bytes):
+    """
+    Datos hexadecimales con compresión ACS (Alternative Compression Scheme):
+    corridas de un mismo dígito, ',' = resto de la fila en blanco,
+    '!' = resto de la fila en negro, ':' = igual a la fila anterior.
+    """
+    salida = []
+    anterior = None
+    for inicio in range(0, len(filas), ancho_bytes):
+        fila = binascii.hexlify(filas[inicio:inicio + ancho_bytes]).decode('ascii').upper()
+        if fila == anterior:
+            salida.append(":")
+            continue
+        anterior = fila
+        sin_ceros = fila.rstrip('0')
+        cola = ',' if len(sin_ceros) < len(fila) else ''
+        if not cola:
+            sin_f = fila.rstrip('F')
+            if len(sin_f) < len(fila) - 1:
+                sin_ceros, cola = sin_f, '!'
+        partes = []
+        i = 0
+        while i < len(sin_ceros):
+            j = i
+            while j < len(sin_ceros) and sin_ceros[j] == sin_ceros[i]:
+                j += 1
+            partes.append(_repeticion_acs(j - i) + sin_ceros[i])
+            i = j
+        salida.append("".join(partes) + cola)
+    return "".join(salida)
+
+
+def codificar_z64(datos):
+    """Formato :Z64: de Zebra: zlib + base64 + CRC-16 (CCITT) del texto base64"""
+    b64 = base64.b64encode(zlib.compress(datos, 9))
+    crc = binascii.crc_hqx(b64, 0)
+    return f":Z64:{b64.decode('ascii')}:{crc:04X}"
+
+
+class GraficoZPL:
+    """
+    Imagen monocroma lista para ZPL (1 = punto negro, 8 puntos por byte).
+    El nombre en la impresora sale del hash del contenido: si el logo
+    cambia, se carga con otro nombre y no hace falta borrar el anterior.
+    """
+
+    def __init__(self, filas, ancho_bytes, alto):
+        self.filas = bytes(filas)
+        self.ancho_bytes = ancho_bytes
+        self.alto = alto
+        resumen = hashlib.sha1(self.filas + ancho_bytes.to_bytes(4, 'big')).hexdigest()
+        self.nombre = f"L{resumen[:7].upper()}"
+        self.ruta = f"{UNIDAD_GRAFICOS}:{self.nombre}.GRF"
+        self._referencias = {}
+        self._descarga = None
+        self._z64 = None
+
+    @property
+    def total_bytes(self):
+        return len(self.filas)
+
+    def comando_descarga(self):
+        """~DG con datos ACS: guarda el gráfico en la memoria de la impresora"""
+        if self._descarga is None:
+            datos = comprimir_acs(self.filas, self.ancho_bytes)
+            self._descarga = f"~DG{self.ruta},{self.total_bytes},{self.ancho_bytes},{datos}\n".encode('ascii')
+        return self._descarga
+
+    def referencia(self, x, y):
+        """Campo ^XG que imprime el gráfico ya guardado en la impresora"""
+        clave = (x, y)
+        if clave not in self._referencias:
+            self._referencias[clave] = f"^FO{x},{y}^XG{self.ruta},1,1^FS".encode('ascii')
+        return self._referencias[clave]
+
+    def en_linea(self, x, y):
+        """Campo ^GF con el gráfico completo (Z64), para destinos sin memoria"""
+        if self._z64 is None:
+            self._z64 = codificar_z64(self.filas)
+        return (f"^FO{x},{y}^GFA,{self.total_bytes},{self.total_bytes},{self.ancho_bytes},"
+                f"{self._z64}^FS").encode('ascii')
+
+
+def _leer_pbm(ruta):
+    """PBM binario (P4): el formato 1-bit más simple, no requiere Pillow"""
+    with open(ruta, 'rb') as f:
+        contenido = f.read()
+    tokens = []
+    posicion = 2
+    while len(tokens) < 2:
+        while contenido[posicion:posicion + 1].isspace():
+            posicion += 1
+        if contenido[posicion:posicion + 1] == b"#":
+            posicion = contenido.index(b"\n", posicion) + 1
+            continue
+        inicio = posicion
+        while not contenido[posicion:posicion + 1].isspace():
+            posicion += 1
+        tokens.append(int(contenido[inicio:posicion]))
+    ancho, alto = tokens
+    datos = contenido[posicion + 1:]
+    ancho_bytes = (ancho + 7) // 8
+    return GraficoZPL(datos[:ancho_bytes * alto], ancho_bytes, alto)
+
+
+def cargar_grafico(ruta, ancho_maximo=ANCHO_MAXIMO_LOGO, alto_maximo=ALTO_MAXIMO_LOGO, umbral=128):
+    """
+    Convierte una imagen (una sola vez) a GraficoZPL. Los .pbm (P4) se leen
+    directamente; el resto de los formatos requiere Pillow.
+    """
+    with open(ruta, 'rb') as f:
+        if f.read(2) == b"P4":
+            return _leer_pbm(ruta)
+
+    try:
+        from PIL import Image
+    except ImportError:
+        raise RuntimeError("Para usar logos PNG/JPG, instala: pip install pillow (o usa un .pbm)")
+
+    imagen = Image.open(ruta).convert('L')
+    imagen.thumbnail((ancho_maximo, alto_maximo))
+    # En Pillow, modo '1' guarda 1 = blanco; ZPL usa 1 = negro
+    imagen = imagen.point(lambda valor: 255 if valor < umbral else 0, mode='1')
+    ancho_bytes = (imagen.width + 7) // 8
+    return GraficoZPL(imagen.tobytes(), ancho_bytes, imagen.height)
+
+
+class GestorGraficos:
+    """
+    Agrega la descarga (~DG) de un gráfico delante de una etiqueta solo si
+    la impresora todavía no lo tiene. Un destino queda confirmado cuando su
+    directorio (^HW) muestra el gráfico o cuando una etiqueta con la descarga
+    salió bien (etiqueta_enviada, llamado por la cola); los destinos de
+    archivo reciben el gráfico en línea (^GF Z64).
+    """
+
+    def __init__(self, grafico):
+        self.grafico = grafico
+        self._lock = threading.Lock()
+        self._confirmados = set()   # destinos que ya tienen el gráfico
+        self._sin_directorio = {}   # destino -> instante en que ^HW no confirmó el gráfico
+        self._patron = re.compile(rb"\^FO(\d+),(\d+)\^XG" + re.escape(grafico.ruta.encode('ascii')) + rb",1,1\^FS")
+
+    def _tiene_grafico(self, transporte):
+        listar = getattr(transporte, 'listar_graficos', None)
+        if listar is None:
+            return False
+        try:
+            return self.grafico.ruta in listar(UNIDAD_GRAFICOS)
+        except (OSError, ValueError):
+            return False
+
+    def preparar_etiqueta(self, transporte, etiqueta):
+        """Devuelve la etiqueta (bytes o segmentos) lista para ese transporte"""
+        marca = f"^XG{self.grafico.ruta}".encode('ascii')
+        # El ^XG llega entero en el segmento del logo: se busca segmento por
+        # segmento, sin unir la etiqueta (las que no llevan logo salen tal cual)
+        segmentos = etiqueta if isinstance(etiqueta, tuple) else (etiqueta,)
+        if not any(marca in segmento for segmento in segmentos):
+            return etiqueta
+
+        if transporte.tipo == 'archivo':
+            return self._patron.sub(lambda m: self.grafico.en_linea(int(m.group(1)), int(m.group(2))),
+                                    unir(etiqueta))
+
+        destino = f"{transporte.tipo}:{transporte.destino}"
+        with self._lock:
+            if destino in self._confirmados:
+                return etiqueta
+            consultado = self._sin_directorio.get(destino)
+        if consultado is None or time.monotonic() - consultado >= REINTENTO_DIRECTORIO_SEGUNDOS:
+            if self._tiene_grafico(transporte):
+                with self._lock:
+                    self._confirmados.add(destino)
+                    self._sin_directorio.pop(destino, None)
+                return etiqueta
+            # Sin directorio o sin el gráfico: se descarga con la etiqueta y no se
+            # vuelve a pagar la consulta (≥0.5 s) en cada etiqueta
+            with self._lock:
+                self._sin_directorio[destino] = time.monotonic()
+        return (self.grafico.comando_descarga(),) + segmentos
+
+    def etiqueta_enviada(self, transporte, etiqueta, error):
+        """
+        Resultado del envío (lo informa la cola). La descarga recién cuenta
+        cuando la etiqueta salió: si falló, el reintento la vuelve a llevar.
+        Una impresora caída se vuelve a verificar cuando responda.
+        """
+        destino = f"{transporte.tipo}:{transporte.destino}"
+        with self._lock:
+            if error is None:
+                if isinstance(etiqueta, tuple) and etiqueta and etiqueta[0] == self.grafico.comando_descarga():
+                    self._confirmados.add(destino)
+                    self._sin_directorio.pop(destino, None)
+            elif isinstance(error, ImpresoraNoDisponible):
+                self._confirmados.discard(destino)
+
+
+def buscar_logo(carpeta="."):
+    """Ruta del logo del hospital si existe (logo_hospital.pbm/.png/.jpg/.bmp)"""
+    for extension in ("pbm", "png", "jpg", "bmp"):
+        ruta = os.path.join(carpeta, f"logo_hospital.{extension}")
+        if os.path.exists(ruta):
+            return ruta
+    return None
@@ -0,0 +1,109 @@
+# instancia_unica.py
+import os
+import json
+import time
+import getpass
+
+from PyQt5.QtCore import QObject, QDir, QLockFile, QCoreApplication, pyqtSignal
+from PyQt5.QtNetwork import QLocalServer, QLocalSocket
+
+# Cuánto espera una segunda instancia a que la primera termine de arrancar
+ESPERA_CONEXION_MS = 5000
+
+
+def nombre_por_defecto(aplicacion="PDCimpresora"):
+    """Un canal por aplicación y usuario: dos usuarios en el mismo equipo no se cruzan"""
+    return f"{aplicacion}-{getpass.getuser()}"
+
+
+class InstanciaUnica(QObject):
+    """
+    Una sola instancia por puesto: la primera toma un QLockFile y atiende un
+    canal local (QLocalServer). Las siguientes le pasan sus argumentos
+    (p.ej. --lote pacientes.csv) por ese canal y terminan enseguida, sin
+    arrancar la interfaz ni volver a leer el hardware.
+    """
+
+    # (argumentos, directorio de trabajo de quien los envió)
+    argumentos_recibidos = pyqtSignal(list, str)
+
+    def __init__(self, nombre=None):
+        super().__init__()
+        self.nombre = nombre or nombre_por_defecto()
+        self._lock = QLockFile(os.path.join(QDir.tempPath(), f"{self.nombre}.lock"))
+        # Sin vencimiento por antigüedad: el lock de una instancia viva nunca es
+        # "viejo"; el de un proceso que murió se detecta por su PID
+        self._lock.setStaleLockTime(0)
+        self._servidor = None
+        self._pendientes = []    # mensajes recibidos antes de que alguien los escuche
+        self._receptor = None
+
+    def adquirir(self):
+        """True si esta es la primera instancia (el lock queda tomado)"""
+        return self._lock.tryLock(0)
+
+    def escuchar(self):
+        """Abre el canal local; llamar después de crear la QApplication"""
+        # Un socket que quedó de una instancia que murió impediría el listen
+        QLocalServer.removeServer(self.nombre)
+        self._servidor = QLocalServer(self)
+        self._servidor.newConnection.connect(self._nueva_conexion)
+        if not self._servidor.listen(self.nombre):
+            print(f"✗ No se pudo abrir el canal de instancia única: {self._servidor.errorString()}")
+
+    def entregar_a(self, receptor):
+        """receptor(argumentos, directorio): recibe también lo que llegó antes"""
+        self._receptor = receptor
+        self.argumentos_recibidos.connect(receptor)
+        pendientes, self._pendientes = self._pendientes, []
+        for argumentos, directorio in pendientes:
+            receptor(argumentos, directorio)
+
+    def _nueva_conexion(self):
+        while self._servidor.hasPendingConnections():
+            conexion = self._servidor.nextPendingConnection()
+            recibido = bytearray()
+            conexion.readyRead.connect(lambda c=conexion, r=recibido: self._leer(c, r))
+            conexion.disconnected.connect(conexion.deleteLater)
+
+    def _leer(self, conexion, recibido):
+        recibido += bytes(conexion.readAll())
+        if not recibido.endswith(b"\n"):
+            return
+        try:
+            mensaje = json.loads(recibido.decode('utf-8'))
+            argumentos, directorio = list(mensaje['argumentos']), str(mensaje['directorio'])
+        except (ValueError, KeyError, TypeError):
+            return
+        conexion.disconnectFromServer()
+        if self._receptor is None:
+            self._pendientes.append((argumentos, directorio))
+        else:
+            self.argumentos_recibidos.emit(argumentos, directorio)
+
+    def reenviar(self, argumentos, espera_ms=ESPERA_CONEXION_MS):
+        """
+        Envía los argumentos a la instancia que ya está abierta.
+        Retorna False si no respondió (p.ej. quedó colgada).
+        """
+        # Los sockets de Qt necesitan una aplicación; la de consola es instantánea
+        if QCoreApplication.instance() is None:
+            self._aplicacion = QCoreApplication([])
+        mensaje = json.dumps({'argumentos': list(argumentos), 'directorio': os.getcwd()}).encode('utf-8') + b"\n"
+        limite = time.monotonic() + espera_ms / 1000
+        while time.monotonic() < limite:
+            conexion = QLocalSocket()
+            conexion.connectToServer(self.nombre)
+            if conexion.waitForConnected(200):
+                conexion.write(mensaje)
+                enviado = conexion.waitForBytesWritten(1000)
+                conexion.disconnectFromServer()
+                return enviado
+            # La primera instancia puede estar arrancando todavía
+            time.sleep(0.05)
+        return False
+
+    def liberar(self):
+        if self._servidor is not None:
+            self._servidor.close()
+        self._lock.unlock()
@@ -0,0 +1,238 @@
+# normalizacion_pacientes.py
+import re
+import csv
+import sys
+import argparse
+import datetime
+from functools import lru_cache
+
+# Formato canónico de las fechas en etiquetas, registro y diario
+FORMATO_FECHA = "%d/%m/%Y"
+EDAD_MAXIMA = 130
+# DNI argentino: 7 u 8 dígitos (los puntos y espacios se descartan)
+DIGITOS_DNI = (7, 8)
+
+# Van en minúscula dentro de un nombre ("María de los Ángeles")
+PARTICULAS = {"de", "del", "la", "las", "los", "y", "e", "da", "das", "do", "dos", "di", "van", "von"}
+
+_SEPARADORES_FECHA = re.compile(r"[/\-. ]+")
+_ESPACIOS = re.compile(r"\s+")
+_CARACTERES_ZPL = re.compile(r"[\^~]")
+_COLUMNAS = ('nombre', 'dni', 'nacimiento', 'hospital')
+# Encabezados aceptados en los CSV de lotes -> columna
+_ENCABEZADOS = {'nombre': 'nombre', 'paciente': 'nombre', 'dni': 'dni', 'documento': 'dni',
+                'nacimiento': 'nacimiento', 'fecha de nacimiento': 'nacimiento', 'hospital': 'hospital',
+                'bebes': 'bebes', 'bebés': 'bebes', 'recien nacidos': 'bebes', 'recién nacidos': 'bebes'}
+
+
+class DatosInvalidos(ValueError):
+    """Uno o más campos del paciente no pasaron la validación"""
+
+    def __init__(self, errores):
+        self.errores = errores  # campo -> motivo
+        super().__init__("; ".join(f"{campo}: {motivo}" for campo, motivo in errores.items()))
+
+
+def _limpiar(texto):
+    """Sin caracteres de control ZPL, sin comas finales ni espacios de más"""
+    texto = _CARACTERES_ZPL.sub("", str(texto))
+    return _ESPACIOS.sub(" ", texto).strip().strip(",;").strip()
+
+
+def _capitalizar_palabra(palabra, primera):
+    if not primera and palabra.lower() in PARTICULAS:
+        return palabra.lower()
+    # Respeta guiones y apóstrofos: María-José, O'Brien
+    return re.sub(r"[^\W\d_]+", lambda m: m.group(0).capitalize(), palabra)
+
+
+@lru_cache(maxsize=8192)
+def normalizar_nombre(texto):
+    """'  PEREZ, juan  de la cruz,' -> 'Perez, Juan de la Cruz'. ValueError si no es un nombre."""
+    nombre = _limpiar(texto)
+    if not nombre:
+        raise ValueError("vacío")
+    if any(caracter.isdigit() for caracter in nombre):
+        raise ValueError(f"contiene números ({nombre})")
+    palabras = nombre.split(" ")
+    return " ".join(_capitalizar_palabra(palabra, i == 0) for i, palabra in enumerate(palabras))
+
+
+@lru_cache(maxsize=8192)
+def normalizar_dni(texto):
+    """'37.738.351' -> '37738351'. ValueError si no tiene 7 u 8 dígitos."""
+    if texto.isdigit() and len(texto) in DIGITOS_DNI:
+        return texto   # El caso común, sin limpieza
+    dni = re.sub(r"[\s.\-]", "", _limpiar(texto))
+    if not dni:
+        raise ValueError("vacío")
+    if not dni.isdigit():
+        raise ValueError(f"solo puede tener números ({dni})")
+    if len(dni) not in DIGITOS_DNI:
+        raise ValueError(f"debe tener {DIGITOS_DNI[0]} u {DIGITOS_DNI[1]} dígitos ({dni})")
+    return dni
+
+
+@lru_cache(maxsize=8192)
+def _normalizar_fecha(texto, hoy):
+    fecha = _limpiar(texto)
+    if not fecha:
+        raise ValueError("vacía")
+    partes = _SEPARADORES_FECHA.split(fecha)
+    if len(partes) == 1 and fecha.isdigit() and len(fecha) in (6, 8):
+        # 15101993 (151093 se rechaza abajo por el año de 2 dígitos)
+        partes = [fecha[:2], fecha[2:4], fecha[4:]]
+    if len(partes) != 3 or not all(parte.isdigit() for parte in partes):
+        raise ValueError(f"formato no reconocido ({fecha})")
+    if len(partes[0]) == 4:
+        anio, mes, dia = (int(parte) for parte in partes)   # 1993-10-15
+    else:
+        dia, mes, anio = (int(parte) for parte in partes)   # 15/10/1993
+    if len(partes[0]) != 4 and len(partes[2]) != 4:
+        # '15/10/25' puede ser 1925 o 2025: adivinar el siglo vuelve bebé a una paciente de 100 años
+        raise ValueError(f"el año debe tener 4 dígitos ({fecha})")
+    try:
+        nacimiento = datetime.date(anio, mes, dia)
+    except ValueError:
+        raise ValueError(f"no existe ({fecha})")
+    if nacimiento > hoy:
+        raise ValueError(f"está en el futuro ({fecha})")
+    if hoy.year - nacimiento.year > EDAD_MAXIMA:
+        raise ValueError(f"demasiado antigua ({fecha})")
+    return nacimiento.strftime(FORMATO_FECHA)
+
+
+def normalizar_fecha(texto, hoy=None):
+    """'15/10/1993', '1993-10-15', '15.10.1993' -> '15/10/1993'. ValueError si no es válida (o con año de 2 dígitos)."""
+    return _normalizar_fecha(texto, hoy or datetime.date.today())
+
+
+@lru_cache(maxsize=1024)
+def normalizar_hospital(texto):
+    """Espacios y comas de más; si está todo en mayúsculas o minúsculas, se capitaliza"""
+    hospital = _limpiar(texto)
+    if not hospital:
+        raise ValueError("vacío")
+    if hospital.isupper() or hospital.islower():
+        hospital = " ".join(_capitalizar_palabra(palabra, i == 0) for i, palabra in enumerate(hospital.split(" ")))
+    return hospital
+
+
+NORMALIZADORES = {
+    'nombre': normalizar_nombre,
+    'dni': normalizar_dni,
+    'nacimiento': normalizar_fecha,
+    'hospital': normalizar_hospital,
+}
+
+
+def normalizar_paciente(nombre, dni, nacimiento, hospital):
+    """
+    Normaliza y valida los datos de un paciente. Retorna un dict con las
+    claves nombre, dni, nacimiento y hospital; lanza DatosInvalidos con
+    todos los campos que fallaron.
+    """
+    valores = {'nombre': nombre, 'dni': dni, 'nacimiento': nacimiento, 'hospital': hospital}
+    resultado, errores = {}, {}
+    for campo, valor in valores.items():
+        try:
+            resultado[campo] = NORMALIZADORES[campo](valor)
+        except ValueError as e:
+            errores[campo] = str(e)
+    if errores:
+        raise DatosInvalidos(errores)
+    return resultado
+
+
+def _normalizar_columna(valores, normalizador):
+    """
+    Normaliza cada valor distinto una sola vez.
+    Retorna (valor -> resultado, valor -> motivo del rechazo).
+    """
+    resultados, errores = {}, {}
+    for valor in set(valores):
+        try:
+            resultados[valor] = normalizador(valor)
+        except ValueError as e:
+            errores[valor] = str(e)
+    return resultados, errores
+
+
+def normalizar_lote(filas):
+    """
+    Normaliza un lote por columnas: cada valor distinto de cada columna se
+    procesa una vez (en un lote, hospital y fechas se repiten mucho).
+    Retorna (válidas, rechazadas): válidas es una lista de dicts
+    normalizados y rechazadas una lista de (número de fila, fila, errores).
+    Otras columnas (p.ej. bebes en un lote de partos) pasan sin cambios.
+    """
+    filas = list(filas)
+    columnas = [[str(fila.get(campo, "") or "") for fila in filas] for campo in _COLUMNAS]
+    hoy = datetime.date.today()
+    # Los valores ya llegan sin repetir: se saltea el lru_cache, que con
+    # columnas de valores únicos (DNI) solo agregaría costo
+    normalizadores = [getattr(NORMALIZADORES[campo], '__wrapped__', NORMALIZADORES[campo]) for campo in _COLUMNAS]
+    normalizadores[_COLUMNAS.index('nacimiento')] = lambda valor: _normalizar_fecha.__wrapped__(valor, hoy)
+    tablas = [_normalizar_columna(valores, normalizador) for valores, normalizador in zip(columnas, normalizadores)]
+
+    # Cada columna se traduce de una vez con su tabla (None = valor rechazado)
+    traducidas = zip(*(map(resultados.get, valores) for valores, (resultados, _) in zip(columnas, tablas)))
+    extras = [campo for campo in (filas[0] if filas else {}) if campo and campo not in _COLUMNAS]
+    validas, rechazadas = [], []
+    for numero, celdas in enumerate(traducidas, start=1):
+        if None not in celdas:
+            valida = dict(zip(_COLUMNAS, celdas))
+            for campo in extras:
+                valida[campo] = filas[numero - 1].get(campo)
+            validas.append(valida)
+            continue
+        errores = {campo: tablas[i][1][columnas[i][numero - 1]]
+                   for i, campo in enumerate(_COLUMNAS) if celdas[i] is None}
+        rechazadas.append((numero, filas[numero - 1], errores))
+    return validas, rechazadas
+
+
+def leer_lote_csv(ruta):
+    """
+    Lee un CSV de pacientes (separado por ',' o ';') con columnas
+    nombre/paciente, dni, nacimiento y hospital. Retorna una lista de dicts.
+    """
+    with open(ruta, 'r', encoding='utf-8-sig', newline='') as f:
+        muestra = f.read(4096)
+        f.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+        except csv.Error:
+            dialecto = csv.excel
+        filas = []
+        for fila in csv.DictReader(f, dialect=dialecto):
+            filas.append({_ENCABEZADOS.get((clave or "").strip().lower(), clave): valor
+                          for clave, valor in fila.items()})
+    return filas
+
+
+def escribir_csv(ruta, filas, columnas):
+    with open(ruta, 'w', encoding='utf-8', newline='') as f:
+        escritor = csv.DictWriter(f, fieldnames=columnas, extrasaction='ignore')
+        escritor.writeheader()
+        escritor.writerows(filas)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Normaliza y valida un lote de pacientes (CSV)")
+    parser.add_argument('lote', help="CSV con columnas nombre,dni,nacimiento,hospital")
+    parser.add_argument('--salida', help="CSV con las filas válidas ya normalizadas")
+    parser.add_argument('--rechazos', help="CSV con las filas rechazadas y el motivo")
+    args = parser.parse_args()
+
+    validas, rechazadas = normalizar_lote(leer_lote_csv(args.lote))
+    if args.salida:
+        escribir_csv(args.salida, validas, list(_COLUMNAS))
+    if args.rechazos:
+        escribir_csv(args.rechazos, [dict(fila, fila_csv=numero + 1, motivo=str(DatosInvalidos(errores)))
+                                     for numero, fila, errores in rechazadas],
+                     ['fila_csv', *_COLUMNAS, 'motivo'])
+    for numero, _, errores in rechazadas[:20]:
+        print(f"✗ Fila {numero + 1}: {DatosInvalidos(errores)}")
+    print(f"✓ {len(validas)} filas válidas, {len(rechazadas)} rechazadas")
+    sys.exit(1 if rechazadas else 0)
@@ -0,0 +1,116 @@
+# perfilado.py
+import os
+import sys
+import time
+import cProfile
+import threading
+import functools
+import tracemalloc
+from datetime import datetime
+
+# Se activa con la variable de entorno o con el argumento de línea de comandos
+VARIABLE_ENTORNO = "PDC_PERFIL"
+ARGUMENTO = "--perfil"
+CARPETA_PERFILES = "perfiles"
+
+
+def perfilado_activo(argv=None):
+    """True si se pidió el modo de perfilado (PDC_PERFIL=1 o --perfil)"""
+    argv = sys.argv if argv is None else argv
+    valor = os.environ.get(VARIABLE_ENTORNO, "").strip().lower()
+    return ARGUMENTO in argv or valor in ("1", "true", "si", "sí", "yes")
+
+
+class SesionPerfilado:
+    """
+    Envuelve funciones con cProfile y tracemalloc. Cada llamada deja en
+    perfiles/<sesión>/ un .prof (abrir con pstats o snakeviz), un
+    .tracemalloc (tracemalloc.Snapshot.load) y una línea en resumen.csv.
+    """
+
+    def __init__(self, carpeta=CARPETA_PERFILES):
+        sesion = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+        self.carpeta = os.path.join(carpeta, sesion)
+        os.makedirs(self.carpeta, exist_ok=True)
+        self._lock = threading.Lock()
+        self._contador = 0
+        self._local = threading.local()
+        self._perfilando = threading.Lock()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+        with open(os.path.join(self.carpeta, "resumen.csv"), 'w', encoding='utf-8') as f:
+            f.write("n,funcion,hilo,duracion_ms,memoria_pico_kb\n")
+
+    def _siguiente_numero(self):
+        with self._lock:
+            self._contador += 1
+            return self._contador
+
+    def envolver(self, funcion, nombre=None):
+        nombre = nombre or funcion.__qualname__
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            # Llamadas anidadas (un slot que llama a otro) quedan dentro del perfil externo
+            if getattr(self._local, 'activo', False):
+                return funcion(*args, **kwargs)
+            # Desde Python 3.12 sólo puede haber un cProfile activo por proceso:
+            # si otro hilo ya está perfilando, esta llamada corre sin perfil
+            if not self._perfilando.acquire(blocking=False):
+                return funcion(*args, **kwargs)
+
+            perfil = cProfile.Profile()
+            try:
+                perfil.enable()
+            except ValueError as e:
+                # Otra herramienta de perfilado (un depurador, p.ej.) ya está activa
+                self._perfilando.release()
+                print(f"✗ No se pudo perfilar {nombre}: {e}")
+                return funcion(*args, **kwargs)
+            self._local.activo = True
+            tracemalloc.reset_peak()
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                perfil.disable()
+                duracion = (time.perf_counter() - inicio) * 1000
+                _, pico = tracemalloc.get_traced_memory()
+                self._local.activo = False
+                self._perfilando.release()
+                self._guardar(nombre, perfil, duracion, pico)
+
+        return envoltura
+
+    def _guardar(self, nombre, perfil, duracion_ms, pico):
+        numero = self._siguiente_numero()
+        base = os.path.join(self.carpeta, f"{numero:04d}_{nombre.replace('.', '_')}")
+        try:
+            perfil.dump_stats(f"{base}.prof")
+            tracemalloc.take_snapshot().dump(f"{base}.tracemalloc")
+            with self._lock, open(os.path.join(self.carpeta, "resumen.csv"), 'a', encoding='utf-8') as f:
+                f.write(f"{numero},{nombre},{threading.current_thread().name},{duracion_ms:.2f},{pico / 1024:.1f}\n")
+        except Exception as e:
+            # El perfilado nunca debe romper la impresión
+            print(f"✗ Error al guardar perfil de {nombre}: {e}")
+
+    def instrumentar(self, clase, nombres):
+        """Reemplaza los métodos indicados de la clase por versiones perfiladas"""
+        for nombre in nombres:
+            metodo = getattr(clase, nombre, None)
+            if callable(metodo):
+                setattr(clase, nombre, self.envolver(metodo, f"{clase.__name__}.{nombre}"))
+
+
+def iniciar_perfilado_si_corresponde(objetivos, argv=None):
+    """
+    Si el perfilado está activo, instrumenta cada (clase, [métodos]) de
+    'objetivos' y retorna la sesión; si no, retorna None sin tocar nada.
+    """
+    if not perfilado_activo(argv):
+        return None
+    sesion = SesionPerfilado()
+    for clase, nombres in objetivos:
+        sesion.instrumentar(clase, nombres)
+    print(f"⏱ Perfilado activo: resultados en {sesion.carpeta}")
+    return sesion
@@ -0,0 +1,88 @@
+# perfiles_impresion.py
+import os
+import json
+
+from transporte_impresora import crear_transporte
+
+RUTA_PERFILES = "perfiles_impresion.json"
+
+
+class PerfilImpresion:
+    """
+    Perfil de impresión del puesto: a dónde se envía (transporte), formato
+    por defecto y cantidad de copias. Con un perfil elegido, imprimir es un
+    solo clic, sin los diálogos de método y dirección.
+    """
+
+    def __init__(self, nombre, transporte, formato=None, copias=1):
+        self.nombre = nombre
+        self.transporte = dict(transporte)   # como TransporteRed.a_dict()
+        self.formato = formato
+        self.copias = max(1, int(copias))
+
+    def crear_transporte(self):
+        return crear_transporte(self.transporte)
+
+    def a_dict(self):
+        return {'nombre': self.nombre, 'transporte': self.transporte,
+                'formato': self.formato, 'copias': self.copias}
+
+    @classmethod
+    def desde_dict(cls, datos):
+        return cls(datos['nombre'], datos['transporte'], datos.get('formato'), datos.get('copias', 1))
+
+
+class PerfilesImpresion:
+    """Perfiles guardados en un JSON junto al programa, más el último elegido"""
+
+    def __init__(self, ruta=RUTA_PERFILES):
+        self.ruta = ruta
+        self.perfiles = {}
+        self.ultimo = None
+        self.cargar()
+
+    def cargar(self):
+        """Lee el archivo; si no existe o está dañado se empieza sin perfiles"""
+        try:
+            with open(self.ruta, 'r', encoding='utf-8') as f:
+                datos = json.load(f)
+            perfiles = [PerfilImpresion.desde_dict(p) for p in datos.get('perfiles', [])]
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"✗ No se pudieron leer los perfiles de {self.ruta}: {e}")
+            return
+        self.perfiles = {perfil.nombre: perfil for perfil in perfiles}
+        self.ultimo = datos.get('ultimo') if datos.get('ultimo') in self.perfiles else None
+
+    def guardar(self):
+        # Escritura atómica: un corte de luz no deja el archivo a medias
+        temporal = f"{self.ruta}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump({'ultimo': self.ultimo, 'perfiles': [p.a_dict() for p in self.perfiles.values()]},
+                      f, ensure_ascii=False, indent=2)
+        os.replace(temporal, self.ruta)
+
+    def agregar(self, perfil):
+        self.perfiles[perfil.nombre] = perfil
+        self.ultimo = perfil.nombre
+        self.guardar()
+
+    def eliminar(self, nombre):
+        self.perfiles.pop(nombre, None)
+        if self.ultimo == nombre:
+            self.ultimo = None
+        self.guardar()
+
+    def elegir(self, nombre):
+        """Recuerda el perfil elegido para el próximo inicio"""
+        nombre = nombre if nombre in self.perfiles else None
+        if nombre != self.ultimo:
+            self.ultimo = nombre
+            self.guardar()
+
+    def get(self, nombre):
+        return self.perfiles.get(nombre)
+
+    def nombres(self):
+        return list(self.perfiles)
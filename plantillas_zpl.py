@@ -0,0 +1,416 @@
+# plantillas_zpl.py
+import datetime
+import string
+from functools import lru_cache
+from ajuste_texto import ajustar_texto
+from validador_zpl import validar_zpl, ERROR
+
+# Plantillas registradas: nombre -> PlantillaZPL (validadas al cargarse)
+PLANTILLAS = {}
+
+
+class PlantillaZPL:
+    """
+    Plantilla ZPL precompilada: las partes fijas se codifican a bytes una sola
+    vez al importar el módulo y solo los campos variables se codifican en cada
+    etiqueta. renderizar() devuelve una tupla de segmentos de bytes que el
+    transporte puede enviar tal cual (sendmsg) sin armar un str intermedio.
+    """
+
+    def __init__(self, texto, nombre=None, codificacion='utf-8'):
+        self.texto = texto
+        self.nombre = nombre
+        self.codificacion = codificacion
+        # Validación al cargar (cacheada por hash): nunca se repite por etiqueta
+        self.hallazgos = validar_zpl(texto)
+        for hallazgo in self.hallazgos:
+            if hallazgo.nivel == ERROR:
+                print(f"✗ Plantilla ZPL {nombre or ''}: {hallazgo}")
+        if nombre:
+            PLANTILLAS[nombre] = self
+        self._segmentos = []   # bytes fijos; None en el lugar de cada campo
+        self._campos = []      # (posición en _segmentos, nombre del campo)
+        for literal, campo, _, _ in string.Formatter().parse(texto):
+            if literal:
+                self._segmentos.append(literal.encode(codificacion))
+            if campo is not None:
+                self._campos.append((len(self._segmentos), campo))
+                self._segmentos.append(None)
+
+    @property
+    def campos(self):
+        return [campo for _, campo in self._campos]
+
+    def renderizar(self, **valores):
+        # Copia de la lista de referencias: los bytes fijos no se duplican
+        segmentos = self._segmentos[:]
+        for posicion, campo in self._campos:
+            valor = valores[campo]
+            segmentos[posicion] = valor if isinstance(valor, bytes) else str(valor).encode(self.codificacion)
+        return tuple(segmentos)
+
+    def reemplazar(self, segmentos, **valores):
+        """Segmentos ya renderizados con algunos campos cambiados (sin volver a renderizar el resto)"""
+        segmentos = list(segmentos)
+        for posicion, campo in self._campos:
+            if campo in valores:
+                valor = valores[campo]
+                segmentos[posicion] = valor if isinstance(valor, bytes) else str(valor).encode(self.codificacion)
+        return tuple(segmentos)
+
+
+def unir_segmentos(segmentos):
+    """ZPL completo (str) a partir de los segmentos de una etiqueta"""
+    return b"".join(segmentos).decode('utf-8')
+
+
+@lru_cache(maxsize=64)
+def _marca_tiempo_cacheada(instante, formato):
+    return instante.strftime(formato).encode('utf-8')
+
+
+def _marca_tiempo(ahora, formato):
+    """Fecha/hora de impresión ya codificada; en un lote se formatea una vez por segundo"""
+    return _marca_tiempo_cacheada((ahora or datetime.datetime.now()).replace(microsecond=0), formato)
+
+
+@lru_cache(maxsize=4096)
+def _campo(texto, x, y, alto, ancho, alto_minimo=None, max_lineas=1):
+    """Campo de texto ajustado al ancho disponible (en dots), ya codificado"""
+    return ajustar_texto(texto, ancho, alto, alto_minimo, max_lineas).zpl(x, y).encode('utf-8')
+
+
+# Fecha/hora de impresión de cada formato
+MARCAS_TIEMPO = {
+    "80x80mm": "%d/%m/%Y %H:%M",
+    "58x58mm": "%d/%m/%Y",
+    "100x80mm": "%d/%m/%Y %H:%M:%S",
+    "4x2 pulgadas": "%d/%m/%Y %H:%M",
+    "2.25 x 1.25 (Pulsera hospitalaria)": "%d/%m/%Y",
+    "Madre / bebé (pulsera doble)": "%d/%m/%Y %H:%M",
+}
+
+
+def _logo(logo, x, y):
+    """Campo del logo (vacío si no hay); logo(x, y) devuelve los bytes, p.ej. GraficoZPL.referencia"""
+    return logo(x, y) if logo else b""
+
+
+_PLANTILLA_80X80 = PlantillaZPL("""^XA
+^CI28
+^MMT
+^PW609
+^LL609
+^LS0{logo}
+
+^FT50,50^A0N,28,28^FDTICKET MEDICO^FS
+^FT50,100^GB500,3,3^FS
+
+^FT50,140^A0N,20,20^FDHospital:^FS
+{hospital}
+
+^FT50,220^A0N,20,20^FDPaciente:^FS
+{nombre}
+
+^FT50,300^A0N,20,20^FDDNI: {dni}^FS
+
+^FT50,340^A0N,20,20^FDNacimiento:^FS
+^FT50,370^A0N,18,18^FD{nacimiento}^FS
+
+^FT50,420^A0N,16,16^FD{timestamp}^FS
+
+^FT50,460^GB500,3,3^FS
+^FT50,490^A0N,14,14^FDFormato: 80x80mm^FS
+
+^XZ""", "80x80mm")
+
+
+def generar_zpl_80x80(nombre, dni, nacimiento, hospital, ahora=None, logo=None):
+    """
+    Genera los segmentos ZPL para etiqueta de 80x80mm
+    """
+    return _PLANTILLA_80X80.renderizar(
+        hospital=_campo(hospital, 50, 170, 18, 509, alto_minimo=14),
+        nombre=_campo(nombre, 50, 250, 18, 509, alto_minimo=14),
+        dni=dni, nacimiento=nacimiento,
+        timestamp=_marca_tiempo(ahora, MARCAS_TIEMPO["80x80mm"]),
+        logo=_logo(logo, 440, 15))
+
+
+_PLANTILLA_58X58 = PlantillaZPL("""^XA
+^CI28
+^MMT
+^PW435
+^LL435
+^LS0{logo}
+
+^FT30,30^A0N,24,24^FDTICKET MED.^FS
+^FT30,65^GB375,2,2^FS
+
+^FT30,95^A0N,16,16^FDHospital:^FS
+{hospital}
+
+^FT30,155^A0N,16,16^FDPaciente:^FS
+{nombre}
+
+^FT30,210^A0N,16,16^FDDNI: {dni}^FS
+
+^FT30,240^A0N,16,16^FDNac: {nacimiento}^FS
+
+^FT30,280^A0N,12,12^FD{timestamp}^FS
+
+^FT30,310^GB375,2,2^FS
+^FT30,335^A0N,12,12^FD58x58mm^FS
+
+^XZ""", "58x58mm")
+
+
+def generar_zpl_58x58(nombre, dni, nacimiento, hospital, ahora=None, logo=None):
+    """
+    Genera los segmentos ZPL para etiqueta de 58x58mm (más compacta)
+    """
+    return _PLANTILLA_58X58.renderizar(
+        hospital=_campo(hospital, 30, 120, 14, 375, alto_minimo=11),
+        nombre=_campo(nombre, 30, 180, 14, 375, alto_minimo=11),
+        dni=dni, nacimiento=nacimiento,
+        timestamp=_marca_tiempo(ahora, MARCAS_TIEMPO["58x58mm"]),
+        logo=_logo(logo, 305, 2))
+
+
+_PLANTILLA_100X80 = PlantillaZPL("""^XA
+^CI28
+^MMT
+^PW754
+^LL609
+^LS0{logo}
+
+^FT50,40^A0N,32,32^FDREGISTRO MEDICO^FS
+^FT50,80^GB650,4,4^FS
+
+^FT50,120^A0N,22,22^FDHOSPITAL:^FS
+{hospital}
+
+^FT50,170^A0N,22,22^FDPACIENTE:^FS
+{nombre}
+
+^FT50,220^A0N,22,22^FDDNI:^FS
+^FT200,220^A0N,20,20^FD{dni}^FS
+
+^FT50,270^A0N,22,22^FDNACIMIENTO:^FS
+^FT200,270^A0N,20,20^FD{nacimiento}^FS
+
+^FT50,330^A0N,18,18^FDFecha de impresion:^FS
+^FT50,360^A0N,16,16^FD{timestamp}^FS
+
+^FT50,420^GB650,3,3^FS
+^FT50,450^A0N,16,16^FDFormato: 100x80mm^FS
+
+^XZ""", "100x80mm")
+
+
+def generar_zpl_100x80(nombre, dni, nacimiento, hospital, ahora=None, logo=None):
+    """
+    Genera los segmentos ZPL para etiqueta de 100x80mm
+    """
+    return _PLANTILLA_100X80.renderizar(
+        hospital=_campo(hospital, 200, 120, 20, 504, alto_minimo=16, max_lineas=2),
+        nombre=_campo(nombre, 200, 170, 20, 504, alto_minimo=16, max_lineas=2),
+        dni=dni, nacimiento=nacimiento,
+        timestamp=_marca_tiempo(ahora, MARCAS_TIEMPO["100x80mm"]),
+        logo=_logo(logo, 580, 10))
+
+
+_PLANTILLA_4X2_PULGADAS = PlantillaZPL("""^XA
+^CI28
+^MMT
+^PW812
+^LL406
+^LS0{logo}
+
+^FT50,35^A0N,28,28^FDIDENTIFICACION PACIENTE^FS
+^FT50,70^GB712,3,3^FS
+
+{hospital}
+
+{nombre}
+
+^FT50,190^A0N,20,20^FDDNI: {dni}     NACIMIENTO: {nacimiento}^FS
+
+^FT50,240^A0N,16,16^FDImpreso: {timestamp}^FS
+
+^FT50,280^GB712,2,2^FS
+^FT50,310^A0N,14,14^FDFormato: 4x2 pulgadas^FS
+
+^XZ""", "4x2 pulgadas")
+
+
+def generar_zpl_4x2_pulgadas(nombre, dni, nacimiento, hospital, ahora=None, logo=None):
+    """
+    Genera los segmentos ZPL para etiqueta de 4x2 pulgadas (estándar médico)
+    """
+    return _PLANTILLA_4X2_PULGADAS.renderizar(
+        hospital=_campo(f"HOSPITAL: {hospital}", 50, 110, 20, 712, alto_minimo=16),
+        nombre=_campo(f"PACIENTE: {nombre}", 50, 150, 20, 712, alto_minimo=16),
+        dni=dni, nacimiento=nacimiento,
+        timestamp=_marca_tiempo(ahora, MARCAS_TIEMPO["4x2 pulgadas"]),
+        logo=_logo(logo, 640, 5))
+
+
+_PLANTILLA_PULSERA_HOSPITALARIA = PlantillaZPL("""^XA
+^CI28
+^MMT
+^PW576
+^LL300
+^LS0{logo}
+
+^FT20,25^A0N,18,18^FDPULSERA HOSPITALARIA^FS
+^FT20,50^GB536,2,2^FS
+
+{hospital}
+
+{nombre}
+^FT20,130^A0N,14,14^FDDNI: {dni}^FS
+^FT20,155^A0N,14,14^FDNac: {nacimiento}^FS
+
+^FT20,185^A0N,12,12^FD{timestamp}^FS
+
+^FT20,210^GB536,2,2^FS
+^FT20,235^A0N,10,10^FDPulsera 2.25x1.25^FS
+
+^XZ""", "2.25 x 1.25 (Pulsera hospitalaria)")
+
+
+def generar_zpl_pulsera_hospitalaria(nombre, dni, nacimiento, hospital, ahora=None, logo=None):
+    """
+    Genera los segmentos ZPL para pulsera hospitalaria de 2.25 x 1.25 pulgadas
+    """
+    return _PLANTILLA_PULSERA_HOSPITALARIA.renderizar(
+        hospital=_campo(hospital, 20, 75, 16, 536, alto_minimo=12),
+        nombre=_campo(nombre, 20, 105, 14, 536, alto_minimo=10),
+        dni=dni, nacimiento=nacimiento,
+        timestamp=_marca_tiempo(ahora, MARCAS_TIEMPO["2.25 x 1.25 (Pulsera hospitalaria)"]),
+        logo=_logo(logo, 436, 120))
+
+
+FORMATO_MADRE_BEBE = "Madre / bebé (pulsera doble)"
+
+# Pulsera doble de 2100 dots con el texto rotado (^FWB): el panel del bebé y
+# el de la madre llevan los mismos datos de la madre. Los dos paneles se
+# renderizan juntos, una sola vez por paciente, con coordenadas absolutas
+# (sin ^LH a mitad del formato, que algunos firmwares aplican a todo el
+# formato y no desde ahí).
+_PLANTILLA_MADRE_BEBE = PlantillaZPL("""^XA
+^CI28
+^MMT
+^PW360
+^LL2100
+^LS0
+^FWB
+
+^FX Panel del bebé: recién nacido y fecha/hora^FS
+^FO160,460^FB550,1,0,L,0^A0B,22,22^FDRN {rn} - {timestamp}^FS
+{panel_bebe}
+
+^FX Panel de la madre: los mismos datos^FS
+{panel_madre}
+^FO190,1260^FB550,1,0,L,0^A0B,22,22^FDRN {rn} - {timestamp}^FS
+
+^XZ""", FORMATO_MADRE_BEBE)
+
+# Largo de cada línea del panel (a lo largo de la pulsera) y separación entre líneas
+_LARGO_PANEL = 550
+_SEPARACION_PANEL = 40
+# Origen (x, y) de la primera línea de cada panel
+_ORIGEN_PANEL_BEBE = (200, 460)
+_ORIGEN_PANEL_MADRE = (30, 1260)
+
+
+def _lineas_panel(origenes, texto, orden, alto=25, alto_minimo=18):
+    """La misma línea en cada panel: el texto se ajusta una sola vez"""
+    ajuste = ajustar_texto(texto, _LARGO_PANEL, alto, alto_minimo)
+    campo = f"^FB{_LARGO_PANEL},1,0,L,0^A0B,{ajuste.alto},{ajuste.alto}^FD{ajuste.texto}^FS"
+    return [f"^FO{x + orden * _SEPARACION_PANEL},{y}{campo}".encode('utf-8') for x, y in origenes]
+
+
+@lru_cache(maxsize=512)
+def _paneles_madre(nombre, dni, nacimiento, hospital):
+    """
+    Datos de la madre para los dos paneles (bebé, madre): una entrada de
+    cache por paciente, compartida por todas las pulseras del juego.
+    """
+    lineas = (f"Hospital: {hospital}", f"Nombre: {nombre}", f"DNI: {dni}", f"Fecha Nac.: {nacimiento}")
+    paneles = zip(*(_lineas_panel((_ORIGEN_PANEL_BEBE, _ORIGEN_PANEL_MADRE), texto, i)
+                    for i, texto in enumerate(lineas)))
+    return tuple(b"\n".join(panel) for panel in paneles)
+
+
+def generar_zpl_madre_bebe(nombre, dni, nacimiento, hospital, ahora=None, logo=None, orden=1, total=1):
+    """
+    Genera los segmentos ZPL de la pulsera doble madre / bebé (un recién
+    nacido). Sin logo: el gráfico no acompaña la rotación del texto.
+    """
+    panel_bebe, panel_madre = _paneles_madre(nombre, dni, nacimiento, hospital)
+    return _PLANTILLA_MADRE_BEBE.renderizar(
+        rn=f"{orden}/{total}".encode('ascii'),
+        timestamp=_marca_tiempo(ahora, MARCAS_TIEMPO[FORMATO_MADRE_BEBE]),
+        panel_bebe=panel_bebe, panel_madre=panel_madre)
+
+
+def generar_juego_madre_bebe(nombre, dni, nacimiento, hospital, bebes=1, ahora=None):
+    """
+    Juego de pulseras de un parto: una pulsera doble por recién nacido
+    (RN 1/2, RN 2/2...), con la misma fecha/hora. Se envía como un solo
+    trabajo atómico (ver TrabajoImpresion): nunca queda media pareja impresa.
+    """
+    ahora = (ahora or datetime.datetime.now()).replace(microsecond=0)
+    return [generar_zpl_madre_bebe(nombre, dni, nacimiento, hospital, ahora, orden=orden, total=bebes)
+            for orden in range(1, bebes + 1)]
+
+
+# Formatos disponibles: texto del combo de dimensiones -> generador
+FORMATOS = {
+    "80x80mm": generar_zpl_80x80,
+    "58x58mm": generar_zpl_58x58,
+    "100x80mm": generar_zpl_100x80,
+    "4x2 pulgadas": generar_zpl_4x2_pulgadas,
+    "2.25 x 1.25 (Pulsera hospitalaria)": generar_zpl_pulsera_hospitalaria,
+    FORMATO_MADRE_BEBE: generar_zpl_madre_bebe,
+}
+
+
+def generar_segmentos(dimension, nombre, dni, nacimiento, hospital, ahora=None, logo=None):
+    """
+    Genera la etiqueta como tupla de segmentos de bytes, lista para enviar.
+    Retorna None si la dimensión no está configurada.
+    """
+    generador = FORMATOS.get(dimension)
+    if generador is None:
+        return None
+    return generador(nombre, dni, nacimiento, hospital, ahora, logo)
+
+
+def con_copias(segmentos, copias):
+    """Agrega ^PQ antes del ^XZ final: la impresora repite la etiqueta sin reenviarla"""
+    if isinstance(segmentos, list):
+        # Juego de etiquetas (p.ej. madre / bebé): cada una con sus copias
+        return [con_copias(etiqueta, copias) for etiqueta in segmentos]
+    if copias <= 1 or not segmentos[-1].endswith(b"^XZ"):
+        return segmentos
+    return segmentos[:-1] + (segmentos[-1][:-3] + f"^PQ{copias}\n^XZ".encode('ascii'),)
+
+
+def con_marca_tiempo(dimension, segmentos, ahora=None):
+    """
+    Etiqueta ya renderizada (p.ej. pre-renderizada al llegar la admisión)
+    con la fecha/hora de impresión actualizada; el resto de los bytes no cambia.
+    """
+    return PLANTILLAS[dimension].reemplazar(segmentos, timestamp=_marca_tiempo(ahora, MARCAS_TIEMPO[dimension]))
+
+
+def generar_zpl(dimension, nombre, dni, nacimiento, hospital, ahora=None, logo=None):
+    """
+    Genera el ZPL (str) para la dimensión indicada.
+    Retorna None si la dimensión no está configurada.
+    """
+    segmentos = generar_segmentos(dimension, nombre, dni, nacimiento, hospital, ahora, logo)
+    return None if segmentos is None else unir_segmentos(segmentos)
@@ -0,0 +1,212 @@
+# salud_impresoras.py
+import time
+import threading
+
+# Estados del circuito de cada impresora
+CERRADO = "cerrado"          # Funciona: los envíos pasan
+ABIERTO = "abierto"          # Caída: los envíos fallan al instante, sin esperar timeouts
+SEMIABIERTO = "semiabierto"  # Pasó la espera: un solo envío de prueba decide
+
+# Fallos seguidos que abren el circuito
+FALLOS_PARA_ABRIR = 3
+# Espera entre sondeos mientras el circuito está abierto (se duplica hasta el máximo)
+SONDEO_INICIAL_SEGUNDOS = 2
+SONDEO_MAXIMO_SEGUNDOS = 60
+
+# Timeouts adaptativos: margen sobre la latencia observada (promedio móvil
+# exponencial), nunca por debajo del mínimo ni por encima del configurado
+ALFA_LATENCIA = 0.2
+FACTOR_TIMEOUT = 4
+TIMEOUT_CONEXION_MINIMO = 0.5
+# El envío depende del buffer de la impresora (una lenta acepta datos de a poco): más holgura
+TIMEOUT_ENVIO_MINIMO = 3.0
+
+
+class ImpresoraNoDisponible(OSError):
+    """El circuito de la impresora está abierto: el envío falla sin intentar conectar"""
+
+    def __init__(self, destino, reintento):
+        self.destino = destino
+        self.reintento = reintento   # segundos hasta el próximo sondeo
+        super().__init__(f"La impresora {destino.split(':', 1)[-1]} no responde "
+                         f"(se vuelve a probar en {max(0, round(reintento))} s)")
+
+
+class SaludImpresora:
+    """
+    Estado de conexión de una impresora: latencias observadas, fallos
+    seguidos y circuito (cerrado / abierto / semiabierto). Compartido por
+    todos los transportes que apuntan al mismo destino.
+    """
+
+    def __init__(self, destino, al_cambiar=None):
+        self.destino = destino
+        self.estado = CERRADO
+        self.fallos_seguidos = 0
+        self.latencia_conexion = None   # segundos (promedio móvil)
+        self.latencia_envio = None
+        self.ultimo_error = ""
+        self.sondeo = None              # sondeo() -> None si respondió de verdad, o lanza OSError (TransporteRed.sondear)
+        self._espera = SONDEO_INICIAL_SEGUNDOS
+        self._proximo_intento = 0.0
+        self._al_cambiar = al_cambiar
+        self._lock = threading.Lock()
+
+    def _promedio(self, anterior, valor):
+        return valor if anterior is None else anterior + ALFA_LATENCIA * (valor - anterior)
+
+    def _holgura(self):
+        # Tras cada fallo se duplica: una impresora lenta no se confunde con una caída
+        return 2 ** min(self.fallos_seguidos, FALLOS_PARA_ABRIR)
+
+    def timeout_conexion(self, maximo):
+        """Timeout de conexión según la latencia observada; sin datos, el configurado"""
+        with self._lock:
+            if self.latencia_conexion is None:
+                return maximo
+            timeout = (FACTOR_TIMEOUT * self.latencia_conexion + TIMEOUT_CONEXION_MINIMO) * self._holgura()
+            return min(maximo, timeout)
+
+    def timeout_envio(self, maximo):
+        with self._lock:
+            if self.latencia_envio is None:
+                return maximo
+            timeout = (FACTOR_TIMEOUT * self.latencia_envio + TIMEOUT_ENVIO_MINIMO) * self._holgura()
+            return min(maximo, timeout)
+
+    def verificar(self):
+        """
+        Lanza ImpresoraNoDisponible si el circuito está abierto. Vencida la
+        espera deja pasar un único intento (semiabierto) y frena al resto.
+        """
+        with self._lock:
+            if self.estado == CERRADO:
+                return
+            ahora = time.monotonic()
+            if self.estado == ABIERTO and ahora >= self._proximo_intento:
+                self.estado = SEMIABIERTO
+                return
+            if self.estado == SEMIABIERTO:
+                # El próximo intento de prueba, si este no informa, lo decide el sondeo
+                self._proximo_intento = max(self._proximo_intento, ahora + SONDEO_INICIAL_SEGUNDOS)
+            raise ImpresoraNoDisponible(self.destino, self._proximo_intento - ahora)
+
+    def registrar_exito(self, conexion=None, envio=None):
+        with self._lock:
+            if conexion is not None:
+                self.latencia_conexion = self._promedio(self.latencia_conexion, conexion)
+            if envio is not None:
+                self.latencia_envio = self._promedio(self.latencia_envio, envio)
+            cambio = self.estado != CERRADO
+            self.estado = CERRADO
+            self.fallos_seguidos = 0
+            self._espera = SONDEO_INICIAL_SEGUNDOS
+        if cambio and self._al_cambiar:
+            self._al_cambiar(self)
+
+    def registrar_fallo(self, error):
+        with self._lock:
+            self.fallos_seguidos += 1
+            self.ultimo_error = str(error)
+            if self.estado == CERRADO and self.fallos_seguidos < FALLOS_PARA_ABRIR:
+                return
+            # Falló el intento de prueba: la espera hasta el próximo se duplica
+            if self.estado != CERRADO:
+                self._espera = min(SONDEO_MAXIMO_SEGUNDOS, self._espera * 2)
+            cambio = self.estado == CERRADO
+            self.estado = ABIERTO
+            self._proximo_intento = time.monotonic() + self._espera
+        if cambio and self._al_cambiar:
+            self._al_cambiar(self)
+
+    def sondear_si_corresponde(self):
+        """
+        Un sondeo en segundo plano cuando vence la espera; True si la impresora
+        volvió. También sondea un semiabierto: si el intento de prueba nunca
+        informó su resultado, el circuito no queda trabado.
+        """
+        with self._lock:
+            if self.estado == CERRADO or self.sondeo is None or time.monotonic() < self._proximo_intento:
+                return False
+            sondeo = self.sondeo
+        try:
+            sondeo()
+        except OSError as e:
+            self.registrar_fallo(e)
+            return False
+        self.registrar_exito()
+        return True
+
+
+class MonitorImpresoras:
+    """
+    Registro de la salud de cada impresora (por destino, p.ej. 'red:10.0.0.5:9100')
+    con un hilo que sondea en segundo plano las que tienen el circuito abierto,
+    para cerrarlo apenas vuelven sin esperar a que falle otro trabajo.
+    """
+
+    def __init__(self, intervalo=0.5):
+        self.intervalo = intervalo
+        # al_cambiar(salud): se llama desde el hilo que detectó el cambio de estado
+        self.al_cambiar = None
+        self._impresoras = {}
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._activo = threading.Event()
+
+    def salud(self, destino):
+        with self._lock:
+            salud = self._impresoras.get(destino)
+            if salud is None:
+                salud = self._impresoras[destino] = SaludImpresora(destino, self._cambio)
+            return salud
+
+    def disponible(self, destino):
+        """False si el circuito de ese destino está abierto"""
+        with self._lock:
+            salud = self._impresoras.get(destino)
+        return salud is None or salud.estado != ABIERTO
+
+    def estados(self):
+        with self._lock:
+            return {destino: salud.estado for destino, salud in self._impresoras.items()}
+
+    def _cambio(self, salud):
+        if salud.estado == ABIERTO:
+            self._iniciar_sondeo()
+        if self.al_cambiar:
+            self.al_cambiar(salud)
+
+    def _iniciar_sondeo(self):
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._activo.set()
+            self._hilo = threading.Thread(target=self._sondear, daemon=True)
+            self._hilo.start()
+
+    def _sondear(self):
+        while self._activo.is_set():
+            with self._lock:
+                abiertas = [salud for salud in self._impresoras.values() if salud.estado != CERRADO]
+                if not abiertas:
+                    # Todas volvieron: el hilo termina y se relanza con la próxima caída
+                    self._hilo = None
+                    return
+            for salud in abiertas:
+                salud.sondear_si_corresponde()
+            time.sleep(self.intervalo)
+
+    def detener(self):
+        self._activo.clear()
+        with self._lock:
+            self._hilo = None
+
+
+# Una sola instancia por proceso: los transportes se crean por trabajo (o
+# desde el spool), pero la salud de una impresora es la misma para todos
+MONITOR = MonitorImpresoras()
+
+
+def salud_impresora(destino):
+    return MONITOR.salud(destino)
@@ -0,0 +1,270 @@
+# simulador_carga.py
+import re
+import sys
+import time
+import random
+import queue
+import socket
+import struct
+import argparse
+import threading
+import statistics
+import tempfile
+import socketserver
+from collections import Counter
+
+from plantillas_zpl import generar_segmentos
+from transporte_impresora import TransporteRed
+from cola_impresion import ColaImpresion, TrabajoImpresion, PRIORIDAD_STAT, PRIORIDAD_RUTINA, PRIORIDAD_LOTE
+
+PATRON_DNI = re.compile(rb"\^FDDNI: (\d+)\^FS")
+
+
+class _ManejadorImpresora(socketserver.BaseRequestHandler):
+    """Recibe ZPL de una conexión y encola cada documento ^XA...^XZ completo"""
+
+    def handle(self):
+        impresora = self.server.impresora
+        buffer = b""
+        cortar = random.random() < impresora.prob_corte
+        while True:
+            try:
+                bloque = self.request.recv(4096)
+            except OSError:
+                break
+            if not bloque:
+                break
+            if cortar:
+                # Conexión cortada (RST) a mitad de la etiqueta: lo recibido se pierde
+                impresora.cortes += 1
+                self.request.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                return
+            buffer += bloque
+            if b"~HS" in buffer:
+                self.request.sendall(impresora.estado_host())
+                buffer = buffer.replace(b"~HS", b"")
+            while b"^XZ" in buffer:
+                documento, _, buffer = buffer.partition(b"^XZ")
+                inicio = documento.find(b"^XA")
+                if inicio >= 0:
+                    impresora.cola.put(documento[inicio:] + b"^XZ")
+
+
+class _ServidorImpresora(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class ImpresoraFalsa:
+    """
+    Listener TCP que se comporta como una Zebra en el puerto raw: lo recibido
+    pasa a un buffer y un "motor" lo imprime de a una etiqueta por vez.
+    - bytes_por_segundo: velocidad del motor (impresora lenta)
+    - prob_corte: probabilidad de cortar cada conexión antes de recibir la etiqueta
+    - pausa_segundos: arranca en pausa; el buffer se imprime al reanudar
+    """
+
+    def __init__(self, puerto=0, bytes_por_segundo=None, prob_corte=0.0, pausa_segundos=0):
+        self.bytes_por_segundo = bytes_por_segundo
+        self.prob_corte = prob_corte
+        self.pausa_segundos = pausa_segundos
+        self.impresas = []      # (dni, instante de impresión) en orden
+        self.cortes = 0
+        self.cola = queue.Queue()
+        self._reanudada = threading.Event()
+        if pausa_segundos <= 0:
+            self._reanudada.set()
+        self._servidor = _ServidorImpresora(("127.0.0.1", puerto), _ManejadorImpresora)
+        self._servidor.impresora = self
+
+    @property
+    def puerto(self):
+        return self._servidor.server_address[1]
+
+    @property
+    def pausada(self):
+        return not self._reanudada.is_set()
+
+    def estado_host(self):
+        """Respuesta a ~HS: pausa en el tercer campo, formatos en buffer en el quinto"""
+        pausa = 1 if self.pausada else 0
+        en_buffer = self.cola.unfinished_tasks
+        return (f"\x02030,0,{pausa},1245,{en_buffer:03d},0,0,0,000,0,0,0\x03\r\n"
+                f"\x02000,0,0,0,0,2,4,0,00000000,1,000\x03\r\n"
+                f"\x021234,0\x03\r\n").encode('ascii')
+
+    def _motor(self):
+        while True:
+            documento = self.cola.get()
+            self._reanudada.wait()
+            if self.bytes_por_segundo:
+                time.sleep(len(documento) / self.bytes_por_segundo)
+            encontrado = PATRON_DNI.search(documento)
+            dni = encontrado.group(1).decode('ascii') if encontrado else None
+            self.impresas.append((dni, time.perf_counter()))
+            self.cola.task_done()
+
+    def iniciar(self):
+        threading.Thread(target=self._servidor.serve_forever, daemon=True).start()
+        threading.Thread(target=self._motor, daemon=True).start()
+        if self.pausada:
+            temporizador = threading.Timer(self.pausa_segundos, self._reanudada.set)
+            temporizador.daemon = True
+            temporizador.start()
+
+    def esperar_vacia(self, timeout):
+        """Espera a que el motor imprima todo lo recibido (o a que venza el timeout)"""
+        limite = time.perf_counter() + timeout
+        while self.cola.unfinished_tasks and time.perf_counter() < limite:
+            time.sleep(0.01)
+
+    def detener(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+
+def _puesto(numero, etiquetas, impresoras, formato, timeout, reintentos, resultados, cola=None):
+    """
+    Un puesto de admisión: genera y envía etiquetas con el código real.
+    Con 'cola', las etiquetas pasan por la cola de impresión; el puesto 0
+    manda emergencias (STAT) y el resto rutina.
+    """
+    prioridad = PRIORIDAD_STAT if numero == 0 else PRIORIDAD_RUTINA
+    transportes = [TransporteRed("127.0.0.1", imp.puerto, timeout=timeout) for imp in impresoras]
+    for i in range(etiquetas):
+        dni = f"{numero:03d}{i:05d}"
+        transporte = transportes[(numero + i) % len(transportes)]
+        inicio = time.perf_counter()
+        zpl = generar_segmentos(formato, f"Paciente Simulado {numero}-{i}", dni, "01/01/1990", "Hospital de Prueba")
+        if cola is not None:
+            enviado = cola.enviar(TrabajoImpresion(dni, zpl, transporte, prioridad=prioridad))
+            resultados.append((dni, enviado, inicio, time.perf_counter() - inicio, prioridad))
+            continue
+        enviado = False
+        for _ in range(reintentos + 1):
+            try:
+                transporte.enviar(zpl)
+                enviado = True
+                break
+            except OSError:
+                continue
+        resultados.append((dni, enviado, inicio, time.perf_counter() - inicio, prioridad))
+
+
+def _percentiles(valores):
+    if not valores:
+        return 0.0, 0.0
+    if len(valores) == 1:
+        return valores[0], valores[0]
+    cuantiles = statistics.quantiles(valores, n=100)
+    return cuantiles[49], cuantiles[98]
+
+
+def simular(impresoras=2, puestos=4, etiquetas=25, formato="2.25 x 1.25 (Pulsera hospitalaria)",
+            bytes_por_segundo=None, prob_corte=0.0, pausa_segundos=0, timeout=10, reintentos=1,
+            espera_maxima=30.0, usar_cola=False, lote=0):
+    """
+    Corre la simulación y retorna un diccionario con el reporte.
+    Con usar_cola, los puestos envían a través de ColaImpresion; 'lote' agrega
+    al principio una reimpresión masiva de esa cantidad de etiquetas.
+    """
+    falsas = [ImpresoraFalsa(bytes_por_segundo=bytes_por_segundo, prob_corte=prob_corte,
+                             pausa_segundos=pausa_segundos) for _ in range(impresoras)]
+    for impresora in falsas:
+        impresora.iniciar()
+
+    cola = None
+    if usar_cola or lote:
+        cola = ColaImpresion(carpeta_spool=tempfile.mkdtemp(prefix="spool_simulado_"))
+        cola.iniciar()
+        for numero, impresora in enumerate(falsas):
+            etiquetas_lote = [generar_segmentos(formato, f"Reimpresion {i}", f"9{numero:02d}{i:06d}", "01/01/1990",
+                                                "Hospital de Prueba") for i in range(lote)]
+            if etiquetas_lote:
+                cola.enviar(TrabajoImpresion(f"lote-{numero}", etiquetas_lote,
+                                             TransporteRed("127.0.0.1", impresora.puerto, timeout=timeout),
+                                             prioridad=PRIORIDAD_LOTE))
+
+    resultados = []
+    hilos = [threading.Thread(target=_puesto, args=(n, etiquetas, falsas, formato, timeout, reintentos,
+                                                    resultados, cola))
+             for n in range(puestos)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    if cola is not None:
+        cola.detener()
+
+    # Dar tiempo a que las impresoras terminen de imprimir su buffer
+    time.sleep(0.1)
+    for impresora in falsas:
+        impresora.esperar_vacia(espera_maxima)
+        impresora.detener()
+
+    impresas = Counter()
+    primera_impresion = {}
+    for impresora in falsas:
+        for dni, instante in impresora.impresas:
+            impresas[dni] += 1
+            primera_impresion[dni] = min(instante, primera_impresion.get(dni, instante))
+    final = max(primera_impresion.values(), default=time.perf_counter())
+    duracion = final - inicio
+
+    # Latencia de envío (lo que espera el operador) y de punta a punta (hasta la etiqueta impresa)
+    envio_p50, envio_p99 = _percentiles(sorted(lat for _, _, _, lat, _ in resultados))
+    impresion_p50, impresion_p99 = _percentiles(sorted(
+        primera_impresion[dni] - t0 for dni, _, t0, _, _ in resultados if dni in primera_impresion))
+    _, stat_p99 = _percentiles(sorted(
+        primera_impresion[dni] - t0 for dni, _, t0, _, prioridad in resultados
+        if dni in primera_impresion and prioridad == PRIORIDAD_STAT))
+
+    return {
+        'etiquetas': len(resultados),
+        'fallidas': sum(1 for _, ok, _, _, _ in resultados if not ok),
+        'perdidas': sum(1 for dni, _, _, _, _ in resultados if dni not in impresas),
+        'duplicadas': sum(c - 1 for c in impresas.values() if c > 1),
+        'cortes': sum(impresora.cortes for impresora in falsas),
+        'envio_p50_ms': envio_p50 * 1000,
+        'envio_p99_ms': envio_p99 * 1000,
+        'p50_ms': impresion_p50 * 1000,
+        'p99_ms': impresion_p99 * 1000,
+        'stat_p99_ms': stat_p99 * 1000,
+        'etiquetas_por_segundo': len(primera_impresion) / duracion if duracion > 0 else 0.0,
+        'duracion_s': duracion,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulador de carga con impresoras ZPL falsas")
+    parser.add_argument('--impresoras', type=int, default=2)
+    parser.add_argument('--puestos', type=int, default=4, help="Puestos de admisión concurrentes")
+    parser.add_argument('--etiquetas', type=int, default=25, help="Etiquetas por puesto")
+    parser.add_argument('--formato', default="2.25 x 1.25 (Pulsera hospitalaria)")
+    parser.add_argument('--bps', type=int, default=None, help="Caudal de cada impresora en bytes/s")
+    parser.add_argument('--corte', type=float, default=0.0, help="Probabilidad de cortar una conexión")
+    parser.add_argument('--pausa', type=float, default=0, help="Segundos que las impresoras arrancan en pausa")
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--reintentos', type=int, default=1)
+    parser.add_argument('--cola', action='store_true', help="Enviar a través de la cola de impresión")
+    parser.add_argument('--lote', type=int, default=0, help="Etiquetas de reimpresión masiva por impresora (usa la cola)")
+    args = parser.parse_args()
+
+    reporte = simular(args.impresoras, args.puestos, args.etiquetas, args.formato, args.bps,
+                      args.corte, args.pausa, args.timeout, args.reintentos,
+                      usar_cola=args.cola, lote=args.lote)
+
+    print("=== REPORTE DE CARGA ===")
+    print(f"Etiquetas:      {reporte['etiquetas']} ({reporte['fallidas']} fallidas en el puesto)")
+    print(f"Envío p50/p99:  {reporte['envio_p50_ms']:.1f} / {reporte['envio_p99_ms']:.1f} ms")
+    print(f"Impreso p50:    {reporte['p50_ms']:.1f} ms")
+    print(f"Impreso p99:    {reporte['p99_ms']:.1f} ms")
+    if args.cola or args.lote:
+        print(f"STAT p99:       {reporte['stat_p99_ms']:.1f} ms")
+    print(f"Throughput:     {reporte['etiquetas_por_segundo']:.1f} etiquetas/s")
+    print(f"Perdidas:       {reporte['perdidas']}")
+    print(f"Duplicadas:     {reporte['duplicadas']}")
+    print(f"Cortes:         {reporte['cortes']}")
+    sys.exit(1 if reporte['perdidas'] or reporte['duplicadas'] else 0)
@@ -0,0 +1,48 @@
+# tests/test_cola_impresion.py
+import time
+
+import cola_impresion
+from cola_impresion import ColaImpresion, TrabajoImpresion, PRIORIDAD_LOTE, PRIORIDAD_STAT
+from transporte_impresora import TransporteDispositivo
+
+
+class _ImpresoraUSB(TransporteDispositivo):
+    """Impresora USB falsa: guarda lo enviado y no responde ~HS (solo escritura)"""
+
+    def __init__(self):
+        super().__init__("/dev/usb/lp9")
+        self.enviadas = []
+
+    def enviar(self, datos):
+        self.enviadas.append(datos)
+
+    def formatos_en_buffer(self):
+        raise ValueError("la impresora no responde ~HS")
+
+
+def _esperar(condicion, timeout=10):
+    limite = time.monotonic() + timeout
+    while not condicion():
+        assert time.monotonic() < limite, "la cola no terminó a tiempo"
+        time.sleep(0.01)
+
+
+def test_stat_no_espera_detras_de_un_lote_sin_estado(tmp_path, monkeypatch):
+    monkeypatch.setattr(cola_impresion, "ETIQUETA_EN_VUELO_SEGUNDOS", 0.05)
+    monkeypatch.setattr(cola_impresion, "ESPERA_BUFFER_SEGUNDOS", 0.01)
+    impresora = _ImpresoraUSB()
+    terminados = []
+    cola = ColaImpresion(str(tmp_path / "spool"), al_terminar=lambda trabajo, ok, error: terminados.append(ok))
+    cola.iniciar()
+    try:
+        for numero in range(30):
+            cola.enviar(TrabajoImpresion(f"lote-{numero}", b"LOTE", impresora, prioridad=PRIORIDAD_LOTE))
+        _esperar(lambda: len(impresora.enviadas) >= 2)
+        cola.enviar(TrabajoImpresion("stat", b"STAT", impresora, prioridad=PRIORIDAD_STAT))
+        _esperar(lambda: len(terminados) == 31)
+    finally:
+        cola.detener()
+
+    assert all(terminados)
+    # Sin ventana, el lote entero ya estaría en la impresora antes que la STAT
+    assert impresora.enviadas.index(b"STAT") <= 6
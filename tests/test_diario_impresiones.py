@@ -0,0 +1,41 @@
+# tests/test_diario_impresiones.py
+import json
+
+from diario_impresiones import DiarioImpresiones
+
+
+def _diario_con_cola_cortada(tmp_path):
+    ruta = str(tmp_path / "diario.jsonl")
+    diario = DiarioImpresiones(ruta, intervalo=10)
+    for numero in range(3):
+        diario.registrar({'clave': f"clave-{numero}"})
+    # Corte de luz a mitad de la cuarta entrada
+    with open(ruta, 'ab') as f:
+        f.write(b'{"anterior": "abc", "datos": {"clave": "clave-3"}, "se')
+    return ruta
+
+
+def test_ultima_linea_cortada_no_frena_el_diario(tmp_path):
+    ruta = _diario_con_cola_cortada(tmp_path)
+
+    diario = DiarioImpresiones(ruta, intervalo=10)
+    assert diario.registrada_recientemente("clave-2", 60)
+    assert not diario.registrada_recientemente("clave-3", 60)
+
+    entrada = diario.registrar({'clave': "clave-4"})
+    assert entrada['seq'] == 4
+    assert DiarioImpresiones(ruta, intervalo=10).verificar(completo=True) == 4
+
+    with open(ruta, 'rb') as f:
+        lineas = f.read().splitlines()
+    assert [json.loads(linea)['seq'] for linea in lineas] == [1, 2, 3, 4]
+    with open(diario.ruta_cortadas, 'rb') as f:
+        assert b'"clave-3"' in f.read()
+
+
+def test_verificar_informa_la_cola_cortada(tmp_path):
+    ruta = _diario_con_cola_cortada(tmp_path)
+
+    diario = DiarioImpresiones(ruta, intervalo=10)
+    assert diario.verificar(completo=True) == 3
+    assert diario.cola_cortada > 0
@@ -0,0 +1,30 @@
+# tests/test_exportar_historial.py
+import csv
+
+from exportar_historial import exportar_historial
+
+IMPRESION = ("[2025-06-01 20:04:08] \n Hospital: Español \n=> \n Paciente: Ana Paz, \n Dni: 40111222, \n"
+             " Nacimiento: 01/01/2000, \n ticket: 58x58mm\n")
+ENTREGA = "[2025-06-01 20:04:09] \n Impresa en: 192.168.1.50:9100, \n Paciente: Ana Paz, \n Dni: 40111222\n"
+
+
+def test_entregas_cuentan_por_impresora_y_no_son_filas(tmp_path):
+    log, entregas, salida = tmp_path / "registro.txt", tmp_path / "entregas.txt", tmp_path / "historial.csv"
+    # Un registro viejo con una entrega mezclada, más el registro de entregas aparte
+    log.write_text(IMPRESION + ENTREGA + IMPRESION, encoding='utf-8')
+    entregas.write_text(ENTREGA, encoding='utf-8')
+
+    estadisticas = exportar_historial(str(log), str(salida), ruta_entregas=str(entregas))
+
+    with open(salida, encoding='utf-8-sig', newline='') as f:
+        filas = list(csv.DictReader(f))
+    assert [fila['paciente'] for fila in filas] == ["Ana Paz", "Ana Paz"]
+    assert estadisticas.total == 2
+    assert estadisticas.por_impresora == {"192.168.1.50:9100": 2}
+
+
+def test_sin_registro_de_entregas(tmp_path):
+    log = tmp_path / "registro.txt"
+    log.write_text(IMPRESION, encoding='utf-8')
+    estadisticas = exportar_historial(str(log), ruta_entregas=str(tmp_path / "no_existe.txt"))
+    assert estadisticas.total == 1 and not estadisticas.por_impresora
@@ -0,0 +1,28 @@
+# tests/test_normalizacion_pacientes.py
+import datetime
+
+import pytest
+
+from normalizacion_pacientes import normalizar_fecha, normalizar_lote
+
+HOY = datetime.date(2025, 10, 20)
+
+
+@pytest.mark.parametrize("texto", ["15/10/25", "15/10/93", "151025", "15.10.93"])
+def test_anio_de_dos_digitos_se_rechaza(texto):
+    # 15/10/25 puede ser una paciente de 100 años: no se adivina el siglo
+    with pytest.raises(ValueError, match="4 dígitos"):
+        normalizar_fecha(texto, HOY)
+
+
+@pytest.mark.parametrize("texto", ["15/10/1925", "1925-10-15", "15.10.1925", "15101925"])
+def test_anio_completo_se_respeta(texto):
+    assert normalizar_fecha(texto, HOY) == "15/10/1925"
+
+
+def test_lote_rechaza_la_fila_con_anio_de_dos_digitos():
+    filas = [{'nombre': "ana paz", 'dni': "40111222", 'nacimiento': "15/10/25", 'hospital': "Italiano"},
+             {'nombre': "ana paz", 'dni': "40111222", 'nacimiento': "15/10/2025", 'hospital': "Italiano"}]
+    validas, rechazadas = normalizar_lote(filas)
+    assert [fila['nacimiento'] for fila in validas] == ["15/10/2025"]
+    assert rechazadas[0][0] == 1 and 'nacimiento' in rechazadas[0][2]
@@ -0,0 +1,405 @@
+# transporte_impresora.py
+import os
+import glob
+import time
+import errno
+import select
+import socket
+import datetime
+import subprocess
+
+from salud_impresoras import salud_impresora
+
+PUERTO_ZPL = 9100  # Puerto estándar para impresoras ZPL
+# Máximo de segmentos por llamada a sendmsg (IOV_MAX suele ser 1024)
+MAXIMO_SEGMENTOS = 1024
+# Espera máxima de la respuesta a ~HS por USB o puerto serie
+ESPERA_ESTADO_SEGUNDOS = 1.0
+
+
+def unir(datos):
+    """bytes de una etiqueta, ya venga entera o como tupla de segmentos"""
+    return b"".join(datos) if isinstance(datos, (list, tuple)) else datos
+
+
+def enviar_segmentos(sock, segmentos):
+    """
+    Envía una lista de segmentos de bytes con sendmsg (scatter-gather, sin
+    copiarlos a un buffer único). En plataformas sin sendmsg (Windows) une
+    los segmentos y usa sendall.
+    """
+    if not hasattr(sock, 'sendmsg'):
+        sock.sendall(b"".join(segmentos))
+        return
+    pendientes = [memoryview(segmento) for segmento in segmentos if segmento]
+    inicio = 0
+    while inicio < len(pendientes):
+        enviados = sock.sendmsg(pendientes[inicio:inicio + MAXIMO_SEGMENTOS])
+        # Avanzar sobre lo enviado: sendmsg puede enviar solo una parte
+        while enviados:
+            largo = len(pendientes[inicio])
+            if enviados >= largo:
+                enviados -= largo
+                inicio += 1
+            else:
+                pendientes[inicio] = pendientes[inicio][enviados:]
+                enviados = 0
+
+
+def formatos_en_estado(respuesta):
+    """Formatos en el buffer según la respuesta a ~HS (campo 'eee' de la primera línea)"""
+    primera_linea = respuesta.split(b"\x03")[0].lstrip(b"\x02\r\n")
+    return int(primera_linea.split(b",")[4])
+
+
+class TransporteRed:
+    """
+    Envío por TCP/IP al puerto raw (9100) de la impresora. El timeout
+    configurado es el máximo: se adapta a la latencia observada de cada
+    impresora, y tras varios fallos seguidos los envíos fallan al instante
+    (ImpresoraNoDisponible) hasta que un sondeo la encuentra de nuevo.
+    """
+
+    tipo = "red"
+
+    def __init__(self, ip, puerto=PUERTO_ZPL, timeout=10):
+        self.ip = ip
+        self.puerto = puerto
+        self.timeout = timeout
+
+    @property
+    def destino(self):
+        return f"{self.ip}:{self.puerto}"
+
+    @property
+    def salud(self):
+        return salud_impresora(f"{self.tipo}:{self.destino}")
+
+    def a_dict(self):
+        return {'tipo': self.tipo, 'ip': self.ip, 'puerto': self.puerto, 'timeout': self.timeout}
+
+    def _conectar(self, salud):
+        """
+        Conexión con timeout adaptativo; un fallo cuenta para el circuito.
+        Retorna (socket, segundos que tardó). Conectar no alcanza para darla
+        por sana: el éxito lo registra quien completa el envío o la consulta
+        (una impresora a medio morir acepta la conexión y falla después).
+        """
+        salud.verificar()
+        salud.sondeo = self.sondear
+        inicio = time.monotonic()
+        try:
+            sock = socket.create_connection((self.ip, self.puerto), timeout=salud.timeout_conexion(self.timeout))
+        except OSError as e:
+            salud.registrar_fallo(e)
+            raise
+        return sock, time.monotonic() - inicio
+
+    def sondear(self):
+        """
+        Sondeo del monitor: una consulta de estado (~HS) completa, no solo
+        abrir la conexión. Lanza OSError si la impresora no responde.
+        """
+        try:
+            self.formatos_en_buffer()
+        except (ValueError, IndexError) as e:
+            raise OSError(f"sin respuesta de estado: {e}")
+
+    def enviar(self, datos):
+        """
+        Envía la etiqueta (bytes o tupla de segmentos de bytes).
+        Lanza OSError si la impresora no responde.
+        """
+        salud = self.salud
+        sock, conexion = self._conectar(salud)
+        with sock:
+            sock.settimeout(salud.timeout_envio(self.timeout))
+            inicio = time.monotonic()
+            try:
+                if isinstance(datos, (list, tuple)):
+                    enviar_segmentos(sock, datos)
+                else:
+                    sock.sendall(datos)
+            except OSError as e:
+                salud.registrar_fallo(e)
+                raise
+        salud.registrar_exito(conexion, time.monotonic() - inicio)
+
+    def formatos_en_buffer(self):
+        """
+        Consulta ~HS y retorna cuántos formatos esperan en el buffer de la
+        impresora (campo 'eee' de la primera línea de la respuesta).
+        Lanza ValueError si la impresora acepta la conexión pero no responde ~HS.
+        """
+        salud = self.salud
+        sock, conexion = self._conectar(salud)
+        with sock:
+            sock.settimeout(salud.timeout_envio(self.timeout))
+            sock.sendall(b"~HS")
+            respuesta = b""
+            try:
+                while respuesta.count(b"\x03") < 3:
+                    bloque = sock.recv(1024)
+                    if not bloque:
+                        break
+                    respuesta += bloque
+            except socket.timeout:
+                raise ValueError("la impresora no responde ~HS")
+        formatos = formatos_en_estado(respuesta)
+        # Respondió el estado completo: vale como éxito (y como intento de prueba del semiabierto)
+        salud.registrar_exito(conexion)
+        return formatos
+
+    def listar_graficos(self, unidad="E"):
+        """
+        Pide el directorio de gráficos (^HW) y retorna los nombres
+        guardados en la unidad, como {'E:LOGO.GRF', ...}.
+        """
+        salud = self.salud
+        sock, conexion = self._conectar(salud)
+        with sock:
+            sock.sendall(f"^XA^HW{unidad}:*.GRF^XZ".encode('ascii'))
+            respuesta = b""
+            # El listado no tiene marca de fin: se lee hasta que la impresora calla
+            sock.settimeout(0.5)
+            try:
+                while True:
+                    bloque = sock.recv(4096)
+                    if not bloque:
+                        break
+                    respuesta += bloque
+            except socket.timeout:
+                pass
+        if respuesta:
+            salud.registrar_exito(conexion)
+        # Líneas como "*E:LOGO.GRF   1234"; la cabecera repite el patrón "E:*.GRF"
+        palabras = (palabra.lstrip("*") for palabra in respuesta.decode('ascii', errors='replace').upper().split())
+        return {palabra for palabra in palabras if palabra.endswith(".GRF") and "*" not in palabra}
+
+
+class TransportePuertoSerie:
+    """Envío por puerto serie/COM (requiere pyserial)"""
+
+    tipo = "com"
+
+    def __init__(self, puerto, baudios=9600, timeout=5):
+        self.puerto = puerto
+        self.baudios = baudios
+        self.timeout = timeout
+
+    @property
+    def destino(self):
+        return self.puerto
+
+    def a_dict(self):
+        return {'tipo': self.tipo, 'puerto': self.puerto, 'baudios': self.baudios, 'timeout': self.timeout}
+
+    def enviar(self, datos):
+        import serial  # Opcional: solo se necesita para este transporte
+
+        ser = serial.Serial(self.puerto, self.baudios, timeout=self.timeout)
+        try:
+            ser.write(unir(datos))
+        finally:
+            ser.close()
+
+    def formatos_en_buffer(self):
+        """
+        Consulta ~HS por el mismo puerto. Lanza ValueError si la impresora no
+        responde (cable sin línea de recepción) o falta pyserial.
+        """
+        try:
+            import serial
+        except ImportError:
+            raise ValueError("pyserial no está instalado")
+
+        ser = serial.Serial(self.puerto, self.baudios, timeout=min(self.timeout, ESPERA_ESTADO_SEGUNDOS))
+        try:
+            ser.write(b"~HS")
+            respuesta = b""
+            while respuesta.count(b"\x03") < 3:
+                bloque = ser.read_until(b"\x03")
+                if not bloque:
+                    raise ValueError("la impresora no responde ~HS")
+                respuesta += bloque
+        finally:
+            ser.close()
+        return formatos_en_estado(respuesta)
+
+
+class TransporteArchivo:
+    """Guarda el ZPL en un archivo para revisión o envío manual"""
+
+    tipo = "archivo"
+    # Sin impresora detrás: la cola no espera a que se vacíe ningún buffer
+    controlar_flujo = False
+
+    def __init__(self, carpeta="."):
+        self.carpeta = carpeta
+        self.ultimo_archivo = None
+
+    @property
+    def destino(self):
+        return os.path.abspath(self.carpeta)
+
+    def a_dict(self):
+        return {'tipo': self.tipo, 'carpeta': self.carpeta}
+
+    def enviar(self, datos):
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.ultimo_archivo = os.path.join(self.carpeta, f"etiqueta_{timestamp}.zpl")
+        with open(self.ultimo_archivo, 'ab') as f:
+            f.writelines(datos if isinstance(datos, (list, tuple)) else [datos])
+
+
+class TransporteDispositivo:
+    """
+    Escritura directa al dispositivo de una impresora USB en Linux
+    (/dev/usb/lp0): sin pila de red ni adaptador serie.
+    """
+
+    tipo = "usb"
+
+    def __init__(self, dispositivo="/dev/usb/lp0", buffer=65536, timeout=10):
+        self.dispositivo = dispositivo
+        self.buffer = buffer
+        self.timeout = timeout
+
+    @property
+    def destino(self):
+        return self.dispositivo
+
+    def a_dict(self):
+        return {'tipo': self.tipo, 'dispositivo': self.dispositivo, 'buffer': self.buffer, 'timeout': self.timeout}
+
+    def enviar(self, datos):
+        """
+        Lanza OSError si el dispositivo no existe, no hay permiso (grupo 'lp')
+        o la impresora no acepta los datos en 'timeout' segundos (sin papel,
+        en pausa): una escritura bloqueante dejaría trabado el hilo de la cola.
+        """
+        pendiente = memoryview(unir(datos))
+        limite = time.monotonic() + self.timeout
+        fd = os.open(self.dispositivo, os.O_WRONLY | os.O_NONBLOCK)
+        try:
+            while pendiente:
+                restante = limite - time.monotonic()
+                if restante <= 0 or not select.select([], [fd], [], restante)[1]:
+                    raise OSError(errno.ETIMEDOUT, f"{self.dispositivo} no aceptó datos en {self.timeout} s")
+                try:
+                    # Bloques grandes: el driver no recibe un write por segmento
+                    escritos = os.write(fd, pendiente[:self.buffer])
+                except BlockingIOError:
+                    continue
+                pendiente = pendiente[escritos:]
+        finally:
+            os.close(fd)
+
+    def formatos_en_buffer(self):
+        """
+        Consulta ~HS por el mismo dispositivo (las Zebra USB responden por el
+        canal de lectura). Lanza ValueError si no hay respuesta.
+        """
+        fd = os.open(self.dispositivo, os.O_RDWR | os.O_NONBLOCK)
+        try:
+            os.write(fd, b"~HS")
+            respuesta = b""
+            limite = time.monotonic() + min(self.timeout, ESPERA_ESTADO_SEGUNDOS)
+            while respuesta.count(b"\x03") < 3:
+                restante = limite - time.monotonic()
+                if restante <= 0 or not select.select([fd], [], [], restante)[0]:
+                    raise ValueError("la impresora no responde ~HS")
+                try:
+                    bloque = os.read(fd, 1024)
+                except BlockingIOError:
+                    continue
+                except OSError as e:
+                    # Dispositivo solo de escritura
+                    raise ValueError(f"no se puede leer el estado: {e}")
+                if not bloque:
+                    raise ValueError("la impresora no responde ~HS")
+                respuesta += bloque
+        finally:
+            os.close(fd)
+        return formatos_en_estado(respuesta)
+
+
+def dispositivos_usb():
+    """Impresoras USB conectadas (/dev/usb/lp*)"""
+    return sorted(glob.glob("/dev/usb/lp*"))
+
+
+class TransporteCups:
+    """Envío a una cola local de CUPS en modo raw (lp -d cola -o raw)"""
+
+    tipo = "cups"
+
+    def __init__(self, cola, timeout=10):
+        self.cola = cola
+        self.timeout = timeout
+
+    @property
+    def destino(self):
+        return self.cola
+
+    def a_dict(self):
+        return {'tipo': self.tipo, 'cola': self.cola, 'timeout': self.timeout}
+
+    def enviar(self, datos):
+        """Lanza OSError si lp no está instalado o rechaza el trabajo"""
+        try:
+            resultado = subprocess.run(["lp", "-d", self.cola, "-o", "raw"], input=unir(datos),
+                                       capture_output=True, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            raise OSError(f"lp no respondió en {self.timeout} s")
+        if resultado.returncode != 0:
+            raise OSError(resultado.stderr.decode('utf-8', errors='replace').strip()
+                          or f"lp terminó con código {resultado.returncode}")
+
+    def formatos_en_buffer(self):
+        """
+        Trabajos que CUPS todavía tiene en la cola (lpstat -o). Con raw, cada
+        envío es un trabajo. Lanza ValueError si lpstat no está o falla.
+        """
+        try:
+            resultado = subprocess.run(["lpstat", "-o", self.cola], capture_output=True, timeout=self.timeout)
+        except FileNotFoundError:
+            raise ValueError("lpstat no está instalado")
+        except subprocess.TimeoutExpired:
+            raise OSError(f"lpstat no respondió en {self.timeout} s")
+        if resultado.returncode != 0:
+            raise ValueError(resultado.stderr.decode('utf-8', errors='replace').strip()
+                             or f"lpstat terminó con código {resultado.returncode}")
+        # Una línea por trabajo: "zebra-123  usuario  1024  fecha"
+        prefijo = f"{self.cola}-".encode('utf-8')
+        return sum(1 for linea in resultado.stdout.splitlines() if linea.startswith(prefijo))
+
+
+def colas_cups():
+    """Nombres de las colas de CUPS del equipo (vacío si CUPS no está instalado)"""
+    try:
+        resultado = subprocess.run(["lpstat", "-e"], capture_output=True, timeout=5)
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    return resultado.stdout.decode('utf-8', errors='replace').split()
+
+
+TRANSPORTES = {
+    TransporteRed.tipo: TransporteRed,
+    TransportePuertoSerie.tipo: TransportePuertoSerie,
+    TransporteArchivo.tipo: TransporteArchivo,
+    TransporteDispositivo.tipo: TransporteDispositivo,
+    TransporteCups.tipo: TransporteCups,
+}
+
+
+def crear_transporte(config):
+    """
+    Crea un transporte a partir de un diccionario como {'tipo': 'red', 'ip': ...}
+    (el formato que devuelve a_dict()). Lanza ValueError si el tipo no existe.
+    """
+    parametros = dict(config)
+    clase = TRANSPORTES.get(parametros.pop('tipo', None))
+    if clase is None:
+        raise ValueError(f"Transporte desconocido: {config.get('tipo')}")
+    return clase(**parametros)
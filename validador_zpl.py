@@ -0,0 +1,215 @@
+# validador_zpl.py
+import re
+import sys
+import hashlib
+import argparse
+
+# Comandos ZPL II reconocidos (sin el prefijo ^ o ~). ^A y ^B llevan además
+# la fuente / el tipo de código: se validan por su primera letra.
+COMANDOS_CIRCUNFLEJO = {
+    'XA', 'XZ', 'XF', 'XG', 'DF', 'FO', 'FT', 'FD', 'FS', 'FB', 'FW', 'FR', 'FH', 'FX', 'FN', 'FV',
+    'FP', 'FC', 'FM', 'FA', 'CF', 'CI', 'CC', 'CT', 'CD', 'CW', 'CV', 'PW', 'LL', 'LS', 'LH', 'LT',
+    'LR', 'MM', 'MN', 'MT', 'MD', 'MF', 'ML', 'MU', 'PR', 'PQ', 'PO', 'PM', 'PF', 'PA', 'PP', 'GB', 'GC',
+    'GD', 'GE', 'GF', 'GS', 'IM', 'ID', 'IL', 'IS', 'BY', 'HH', 'HW', 'HG', 'HF', 'HV', 'HT', 'JM', 'JU',
+    'JZ', 'JB', 'JJ', 'JS', 'JT', 'JW', 'KN', 'KP', 'KD', 'KL', 'SN', 'SF', 'SZ', 'SC', 'SE', 'SL', 'SO',
+    'SP', 'SQ', 'SR', 'SS', 'ST', 'SX', 'TO', 'TB', 'WD', 'DN', 'NI', 'NS', 'NC', 'NT', 'MW', 'PH',
+}
+COMANDOS_TILDE = {
+    'DG', 'DY', 'DB', 'DE', 'DN', 'DS', 'DT', 'DU', 'EG', 'HB', 'HD', 'HI', 'HM', 'HQ', 'HS', 'HU',
+    'JA', 'JB', 'JC', 'JD', 'JE', 'JF', 'JG', 'JI', 'JL', 'JN', 'JO', 'JP', 'JQ', 'JR', 'JS', 'JX',
+    'NC', 'NT', 'PH', 'PL', 'PM', 'PP', 'PR', 'PS', 'RO', 'SD', 'TA', 'WC', 'WQ', 'CC', 'CD', 'CT',
+}
+# Comandos que posicionan un campo y los que definen el tamaño de la etiqueta
+_POSICION = {'FO', 'FT'}
+_MARCADOR = re.compile(r"\{[A-Za-z_][A-Za-z0-9_]*\}")
+_COMANDO = re.compile(r"([\^~])([A-Za-z@][A-Za-z0-9@]?)([^\^~]*)", re.S)
+
+ERROR = "error"
+AVISO = "aviso"
+
+
+class Hallazgo:
+    """Un problema encontrado en el ZPL: nivel, línea y descripción"""
+
+    def __init__(self, nivel, linea, mensaje):
+        self.nivel = nivel
+        self.linea = linea
+        self.mensaje = mensaje
+
+    def __repr__(self):
+        return f"Hallazgo({self.nivel!r}, {self.linea}, {self.mensaje!r})"
+
+    def __str__(self):
+        return f"línea {self.linea}: {self.nivel}: {self.mensaje}"
+
+
+def _numeros(parametros):
+    """Parámetros numéricos de un comando ('50,170' -> [50, 170]); None si no es número"""
+    valores = []
+    for parametro in parametros.split(","):
+        parametro = parametro.strip()
+        valores.append(int(parametro) if parametro.isdigit() else None)
+    return valores
+
+
+def _analizar(texto):
+    """
+    Revisa un documento ZPL. Los marcadores de plantilla ({campo}) se tratan
+    como campos completos o texto variable y no se analizan.
+    """
+    hallazgos = []
+    texto = _MARCADOR.sub("", texto)
+    ancho = alto = None
+    origen_x = origen_y = 0  # ^LH: los campos se ubican relativos a este origen
+    rotacion = 'N'           # ^FW: rotación por defecto
+    rotacion_campo = None    # ^A0B: rotación del campo actual
+    campo_x = campo_y = None
+    ancho_bloque = None
+    tiene_ci28 = False
+    texto_no_ascii = False
+    abiertos = 0
+
+    # Líneas de comentario al estilo ';' o '#': ZPL las imprime o las ignora mal
+    for numero, linea in enumerate(texto.splitlines(), start=1):
+        if linea.strip().startswith((";", "#")):
+            hallazgos.append(Hallazgo(ERROR, numero, f"comentario '{linea.strip()[:30]}' no es ZPL (usar ^FX)"))
+
+    posicion = 0
+    for coincidencia in _COMANDO.finditer(texto):
+        linea = texto.count("\n", 0, coincidencia.start()) + 1
+        # Texto suelto antes del comando (fuera de ^FD): la impresora lo descarta o lo imprime
+        suelto = texto[posicion:coincidencia.start()].strip()
+        if suelto and not suelto.startswith((";", "#")):
+            hallazgos.append(Hallazgo(AVISO, linea, f"texto fuera de un comando: '{suelto[:30]}'"))
+        posicion = coincidencia.end()
+
+        prefijo, nombre, parametros = coincidencia.groups()
+        nombre = nombre.upper()
+        if prefijo == "^" and nombre[0] in "AB" and nombre not in COMANDOS_CIRCUNFLEJO:
+            # ^A0N,20,20 / ^BCN,...: la segunda letra es la fuente o el tipo de código
+            comando = nombre[0]
+            parametros = nombre[1:] + parametros
+        else:
+            comando = nombre
+            conocidos = COMANDOS_CIRCUNFLEJO if prefijo == "^" else COMANDOS_TILDE
+            if comando not in conocidos:
+                hallazgos.append(Hallazgo(ERROR, linea, f"comando desconocido {prefijo}{comando}"))
+                continue
+
+        if comando == 'XA':
+            abiertos += 1
+        elif comando == 'XZ':
+            abiertos -= 1
+            if abiertos < 0:
+                hallazgos.append(Hallazgo(ERROR, linea, "^XZ sin ^XA"))
+                abiertos = 0
+        elif comando == 'PW':
+            ancho = _numeros(parametros)[0]
+        elif comando == 'LL':
+            alto = _numeros(parametros)[0]
+        elif comando == 'CI':
+            tiene_ci28 = tiene_ci28 or _numeros(parametros)[0] == 28
+        elif comando == 'FW':
+            rotacion = parametros.strip()[:1].upper() or 'N'
+        elif comando == 'A' and len(parametros) > 1 and parametros[1].upper() in "NRIB":
+            rotacion_campo = parametros[1].upper()
+        elif comando == 'LH':
+            origen_x, origen_y = ((_numeros(parametros) + [0, 0])[:2])
+            origen_x, origen_y = origen_x or 0, origen_y or 0
+        elif comando in _POSICION:
+            campo_x, campo_y = (_numeros(parametros) + [None, None])[:2]
+            campo_x = None if campo_x is None else campo_x + origen_x
+            campo_y = None if campo_y is None else campo_y + origen_y
+            ancho_bloque = None
+            hallazgos.extend(_fuera_de_limites(f"^{comando}", linea, campo_x, campo_y, ancho, alto))
+        elif comando == 'FB':
+            ancho_bloque = (_numeros(parametros)[0], linea)
+        elif comando == 'GB':
+            medidas = _numeros(parametros)
+            if campo_x is not None and campo_y is not None and medidas and medidas[0]:
+                alto_caja = medidas[1] if len(medidas) > 1 and medidas[1] else 0
+                hallazgos.extend(_fuera_de_limites("^GB", linea, campo_x + medidas[0], campo_y + alto_caja,
+                                                   ancho, alto))
+        elif comando == 'FD':
+            texto_no_ascii = texto_no_ascii or not parametros.isascii()
+        elif comando == 'FS':
+            if ancho_bloque and ancho_bloque[0] and campo_x is not None and campo_y is not None:
+                # El bloque se revisa al cerrar el campo, cuando ya se conoce su rotación:
+                # en campos rotados (R/B) crece en vertical
+                largo, linea_bloque = ancho_bloque
+                if (rotacion_campo or rotacion) in "RB":
+                    hallazgos.extend(_fuera_de_limites("^FB", linea_bloque, campo_x, campo_y + largo, ancho, alto))
+                else:
+                    hallazgos.extend(_fuera_de_limites("^FB", linea_bloque, campo_x + largo, campo_y, ancho, alto))
+            campo_x = campo_y = ancho_bloque = rotacion_campo = None
+
+    if abiertos > 0:
+        hallazgos.append(Hallazgo(ERROR, texto.count("\n") + 1, "^XA sin ^XZ"))
+    return hallazgos, tiene_ci28, texto_no_ascii
+
+
+def _fuera_de_limites(comando, linea, x, y, ancho, alto):
+    hallazgos = []
+    if x is not None and ancho is not None and x > ancho:
+        hallazgos.append(Hallazgo(ERROR, linea, f"{comando} termina en x={x}, fuera del ancho ^PW{ancho}"))
+    if y is not None and alto is not None and y > alto:
+        hallazgos.append(Hallazgo(ERROR, linea, f"{comando} termina en y={y}, fuera del largo ^LL{alto}"))
+    return hallazgos
+
+
+# Resultados por hash de la plantilla: cada plantilla se valida una sola vez
+# (al cargarla), nunca en cada impresión
+_RESULTADOS = {}
+
+
+def validar_zpl(texto):
+    """
+    Valida una plantilla o documento ZPL. Retorna una tupla de Hallazgo
+    (vacía si está bien). Resultado cacheado por hash del texto.
+    """
+    clave = hashlib.sha256(texto.encode('utf-8')).hexdigest()
+    resultado = _RESULTADOS.get(clave)
+    if resultado is None:
+        hallazgos, tiene_ci28, texto_no_ascii = _analizar(texto)
+        # Campos variables ({nombre}) o texto con tildes: sin ^CI28 la
+        # impresora interpreta los bytes UTF-8 como Latin-1 (Ã± en vez de ñ)
+        if not tiene_ci28 and (texto_no_ascii or _MARCADOR.search(texto)):
+            hallazgos.insert(0, Hallazgo(ERROR, 1, "falta ^CI28: el texto UTF-8 (ñ, tildes) se imprime mal"))
+        resultado = _RESULTADOS[clave] = tuple(hallazgos)
+    return resultado
+
+
+def documentos_en_archivo(ruta):
+    """Documentos ^XA...^XZ dentro de un archivo (.zpl o código con ZPL embebido)"""
+    with open(ruta, 'r', encoding='utf-8', errors='replace') as f:
+        contenido = f.read()
+    return re.findall(r"\^XA.*?\^XZ", contenido, re.S)
+
+
+def validar_registradas():
+    """(nombre, hallazgos) de cada plantilla registrada en plantillas_zpl"""
+    from plantillas_zpl import PLANTILLAS
+    return [(nombre, validar_zpl(plantilla.texto)) for nombre, plantilla in PLANTILLAS.items()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Valida las plantillas ZPL registradas o archivos con ZPL")
+    parser.add_argument('archivos', nargs='*', help="Archivos .zpl o .py con ZPL (por defecto, las plantillas registradas)")
+    args = parser.parse_args()
+
+    if args.archivos:
+        revisiones = [(f"{ruta} #{n}", validar_zpl(documento))
+                      for ruta in args.archivos for n, documento in enumerate(documentos_en_archivo(ruta), start=1)]
+    else:
+        revisiones = validar_registradas()
+
+    errores = 0
+    for nombre, hallazgos in revisiones:
+        if not hallazgos:
+            print(f"✓ {nombre}")
+            continue
+        print(f"✗ {nombre}")
+        for hallazgo in hallazgos:
+            print(f"    {hallazgo}")
+        errores += sum(1 for hallazgo in hallazgos if hallazgo.nivel == ERROR)
+    sys.exit(1 if errores else 0)
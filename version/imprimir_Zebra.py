@@ -1,37 +1,229 @@
+import os
 import sys
+import argparse
 import datetime
-import socket
-import os
-from PyQt5 import QtWidgets
+from PyQt5 import QtCore, QtWidgets
+from PyQt5.QtCore import pyqtSignal
 from PyQt5.QtWidgets import QMessageBox, QMainWindow, QInputDialog
 # Importa la clase de la UI generada
 from PDCimpresora import Ui_MainWindow
+from diario_impresiones import DiarioImpresiones
+from plantillas_zpl import (generar_segmentos, generar_juego_madre_bebe, con_copias, FORMATOS,
+                            FORMATO_MADRE_BEBE)
+from transporte_impresora import (TransporteRed, TransportePuertoSerie, TransporteArchivo, TransporteDispositivo,
+                                  TransporteCups, dispositivos_usb, colas_cups, PUERTO_ZPL)
+from perfilado import iniciar_perfilado_si_corresponde
+from graficos_zpl import buscar_logo, cargar_grafico, GestorGraficos
+from perfiles_impresion import PerfilesImpresion, PerfilImpresion
+from normalizacion_pacientes import normalizar_paciente, normalizar_lote, leer_lote_csv, DatosInvalidos
+from cola_impresion import (ColaImpresion, TrabajoImpresion, clave_idempotencia, PRIORIDAD_STAT, PRIORIDAD_RUTINA,
+                            PRIORIDAD_LOTE)
+from instancia_unica import InstanciaUnica, nombre_por_defecto
+from salud_impresoras import MONITOR, ABIERTO
+from admisiones import ColaListas, IngestaAdmisiones, PUERTO_MLLP, PUERTO_JSON, CARPETA_ADMISIONES
+
+REGISTRO_IMPRESIONES = "registro_impresiones.txt"
+# A qué impresora salió cada trabajo (aparte: el registro de impresiones es una fila por pulsera)
+REGISTRO_ENTREGAS = "registro_entregas.txt"
 
 class MyMainWindow(QMainWindow):
+    # Emitida desde el hilo de la cola: (trabajo, ok, error)
+    impresion_terminada = pyqtSignal(object, bool, str)
+    # Emitida cuando una impresora deja de responder o vuelve: (SaludImpresora)
+    estado_impresora = pyqtSignal(object)
+    # Emitida desde los hilos de ingesta cuando llega (o se imprime) una admisión
+    admisiones_cambiaron = pyqtSignal()
+
     def __init__(self):
         super().__init__()
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self) # Configura la UI en esta ventana principal
+        # Pulsera doble madre / bebé (juego vinculado, ver generar_juego_madre_bebe)
+        self.ui.boxDimensionesImpresion.addItem(FORMATO_MADRE_BEBE)
 
         # Configuración por defecto de la impresora (puede ser modificada)
         self.printer_ip = "192.168.1.100"  # IP por defecto de la impresora ZPL
-        self.printer_port = 9100  # Puerto estándar para impresoras ZPL
+        self.printer_port = PUERTO_ZPL  # Puerto estándar para impresoras ZPL
+
+        # Perfiles de impresión del puesto (perfiles_impresion.json): con uno
+        # elegido se imprime con un clic, sin diálogos de método ni dirección
+        self.perfiles = PerfilesImpresion()
+        for perfil in self.perfiles.perfiles.values():
+            if perfil.transporte.get('tipo') == 'red':
+                # La IP sugerida en el diálogo sale de los perfiles, no del código
+                self.printer_ip = perfil.transporte.get('ip', self.printer_ip)
+                break
+
+        # Diario encadenado por hash: registro auditable de cada pulsera emitida
+        self.diario = DiarioImpresiones()
+
+        # Logo del hospital (logo_hospital.pbm/.png): se convierte una sola vez y
+        # se descarga a cada impresora solo si todavía no lo tiene
+        self.logo = None
+        self.graficos = None
+        ruta_logo = buscar_logo()
+        if ruta_logo:
+            try:
+                self.logo = cargar_grafico(ruta_logo)
+                self.graficos = GestorGraficos(self.logo)
+            except (OSError, ValueError, RuntimeError) as e:
+                print(f"✗ No se pudo cargar el logo {ruta_logo}: {e}")
+
+        # Cola de impresión: envía en segundo plano y descarta los dobles clics
+        # Con una impresora caída, sus trabajos van a otra de los perfiles (o fallan al instante)
+        self.cola = ColaImpresion(diario=self.diario, al_terminar=self.impresion_terminada.emit,
+                                  preparar_etiqueta=self.graficos.preparar_etiqueta if self.graficos else None,
+                                  etiqueta_enviada=self.graficos.etiqueta_enviada if self.graficos else None,
+                                  redirigir=self.transporte_alternativo)
+        self.impresion_terminada.connect(self.mostrar_resultado_impresion)
+        MONITOR.al_cambiar = self.estado_impresora.emit
+        self.estado_impresora.connect(self.mostrar_estado_impresora)
+        self.cola.recuperar_spool()
+        self.cola.iniciar()
+
+        # Admisiones recibidas (HL7, JSON o carpeta): ya validadas y renderizadas,
+        # imprimir es elegir el paciente y enviar
+        self.listas = ColaListas(logo=self.logo.referencia if self.logo else None)
+        self.ingesta = IngestaAdmisiones(self.listas)
+        self.listas.al_cambiar = self.admisiones_cambiaron.emit
+        self.labelAdmitidos = QtWidgets.QLabel("Admitidos:", self.ui.frame_4)
+        self.labelAdmitidos.setGeometry(QtCore.QRect(40, 260, 101, 16))
+        self.boxAdmitidos = QtWidgets.QComboBox(self.ui.frame_4)
+        self.boxAdmitidos.setGeometry(QtCore.QRect(160, 260, 211, 22))
+        self.cargar_combo_admitidos()
+
+        # Pulseras de emergencia: pasan delante de la rutina y de los lotes
+        self.chkUrgente = QtWidgets.QCheckBox("Urgente (STAT)", self.ui.frame_4)
+        self.chkUrgente.setGeometry(QtCore.QRect(290, 170, 111, 21))
+
+        self.labelPerfil = QtWidgets.QLabel("Perfil:", self.ui.frame_4)
+        self.labelPerfil.setGeometry(QtCore.QRect(40, 100, 101, 16))
+        self.boxPerfil = QtWidgets.QComboBox(self.ui.frame_4)
+        self.boxPerfil.setGeometry(QtCore.QRect(150, 100, 221, 22))
+        self.btnGuardarPerfil = QtWidgets.QPushButton("Guardar perfil", self.ui.frame_4)
+        self.btnGuardarPerfil.setGeometry(QtCore.QRect(150, 130, 101, 24))
+        self.btnQuitarPerfil = QtWidgets.QPushButton("Quitar", self.ui.frame_4)
+        self.btnQuitarPerfil.setGeometry(QtCore.QRect(260, 130, 75, 24))
+        self.cargar_combo_perfiles()
 
         # Conectar señales (botones, etc.) aquí, NO en el archivo UI generado
-        self.ui.btnImprimir.clicked.connect(self.procesar_impresion)
+        # (lambda: el slot puede estar envuelto por el perfilado y no debe recibir 'checked')
+        self.ui.btnImprimir.clicked.connect(lambda: self.procesar_impresion())
+        self.boxPerfil.currentTextChanged.connect(lambda texto: self.elegir_perfil(texto))
+        self.btnGuardarPerfil.clicked.connect(lambda: self.guardar_perfil())
+        self.btnQuitarPerfil.clicked.connect(lambda: self.quitar_perfil())
+        self.admisiones_cambiaron.connect(lambda: self.cargar_combo_admitidos())
+        self.boxAdmitidos.activated.connect(lambda indice: self.elegir_admitido(indice))
+        self.ui.txtDniPaciente.editingFinished.connect(lambda: self.completar_desde_admision())
+
+    # Primer elemento del combo de perfiles: sin perfil, se pregunta con diálogos
+    SIN_PERFIL = "Preguntar cada vez"
+
+    def cargar_combo_perfiles(self):
+        """Llena el combo con los perfiles guardados y elige el último usado"""
+        self.boxPerfil.blockSignals(True)
+        self.boxPerfil.clear()
+        self.boxPerfil.addItem(self.SIN_PERFIL)
+        self.boxPerfil.addItems(self.perfiles.nombres())
+        self.boxPerfil.blockSignals(False)
+        ultimo = self.perfiles.ultimo or self.SIN_PERFIL
+        self.boxPerfil.setCurrentText(ultimo)
+        self.elegir_perfil(ultimo)
+
+    def perfil_actual(self):
+        return self.perfiles.get(self.boxPerfil.currentText())
+
+    def elegir_perfil(self, nombre):
+        """Aplica el formato por defecto del perfil y lo recuerda para el próximo inicio"""
+        self.perfiles.elegir(nombre)
+        perfil = self.perfiles.get(nombre)
+        if perfil and perfil.formato:
+            indice = self.ui.boxDimensionesImpresion.findText(perfil.formato)
+            if indice >= 0:
+                self.ui.boxDimensionesImpresion.setCurrentIndex(indice)
+
+    def guardar_perfil(self):
+        """
+        Crea un perfil con los diálogos de siempre (método y dirección), el
+        formato elegido en pantalla y la cantidad de copias.
+        """
+        transporte = self.elegir_transporte()
+        if transporte is None:
+            return
+        nombre, ok = QInputDialog.getText(self, "Guardar perfil", "Nombre del perfil:",
+                                          text=f"{transporte.tipo} {transporte.destino}")
+        if not ok or not nombre.strip() or nombre.strip() == self.SIN_PERFIL:
+            return
+        copias, ok = QInputDialog.getInt(self, "Guardar perfil", "Copias por pulsera:", 1, 1, 99)
+        if not ok:
+            return
+        perfil = PerfilImpresion(nombre.strip(), transporte.a_dict(),
+                                 self.ui.boxDimensionesImpresion.currentText(), copias)
+        try:
+            self.perfiles.agregar(perfil)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"No se pudo guardar el perfil: {e}")
+            return
+        self.cargar_combo_perfiles()
+
+    def quitar_perfil(self):
+        perfil = self.perfil_actual()
+        if perfil is None:
+            return
+        respuesta = QMessageBox.question(self, "Quitar perfil", f"¿Quitar el perfil '{perfil.nombre}'?")
+        if respuesta == QMessageBox.Yes:
+            self.perfiles.eliminar(perfil.nombre)
+            self.cargar_combo_perfiles()
 
     def procesar_impresion(self):
         """
         Función principal que guarda los datos y luego procede a imprimir según la dimensión seleccionada.
+        Un segundo clic con los mismos datos mientras la pulsera está en curso (o recién impresa) se ignora.
         """
-        # Primero guardamos los datos
-        if not self.guardar_datos_en_txt():
-            return  # Si hay error al guardar, no continuar con la impresión
-        
-        # Luego procedemos con la impresión ZPL
-        self.imprimir_segun_dimension_zpl()
+        if not self.normalizar_campos():
+            return
+
+        clave = clave_idempotencia(self.ui.txtNombrePaciente.text(), self.ui.txtDniPaciente.text(),
+                                   self.ui.txtNacimiento.text(), self.ui.txtNombreHospital.text(),
+                                   self.ui.boxDimensionesImpresion.currentText())
+        if not self.cola.reservar(clave):
+            self.statusBar().showMessage("Impresión duplicada ignorada: esta pulsera ya está en curso o se imprimió recién.", 5000)
+            return
+
+        try:
+            # Primero guardamos los datos
+            if not self.guardar_datos_en_txt(clave):
+                return  # Si hay error al guardar, no continuar con la impresión
+
+            # Luego procedemos con la impresión ZPL
+            self.imprimir_segun_dimension_zpl(clave)
+        finally:
+            # Si el trabajo no llegó a la cola, la clave queda libre para reintentar
+            self.cola.liberar(clave)
 
-    def guardar_datos_en_txt(self):
+    def normalizar_campos(self):
+        """
+        Valida y normaliza los datos del paciente (fecha completa, nombre
+        capitalizado, DNI sin puntos) y los deja así en pantalla, de modo que
+        registro, diario y etiqueta usen los mismos valores.
+        Retorna False (y avisa) si algún campo es inválido.
+        """
+        try:
+            datos = normalizar_paciente(self.ui.txtNombrePaciente.text(), self.ui.txtDniPaciente.text(),
+                                        self.ui.txtNacimiento.text(), self.ui.txtNombreHospital.text())
+        except DatosInvalidos as e:
+            nombres = {'nombre': "Paciente", 'dni': "DNI", 'nacimiento': "Nacimiento", 'hospital': "Hospital"}
+            detalle = "\n".join(f"• {nombres[campo]}: {motivo}" for campo, motivo in e.errores.items())
+            QMessageBox.warning(self, "Datos Inválidos", f"Revise los datos antes de imprimir:\n\n{detalle}")
+            return False
+
+        self.ui.txtNombrePaciente.setText(datos['nombre'])
+        self.ui.txtDniPaciente.setText(datos['dni'])
+        self.ui.txtNacimiento.setText(datos['nacimiento'])
+        self.ui.txtNombreHospital.setText(datos['hospital'])
+        return True
+
+    def guardar_datos_en_txt(self, clave=None):
         """
         Función para leer los datos de los QLineEdit y guardarlos en un archivo TXT.
         Retorna True si se guardó correctamente, False si hubo error.
@@ -47,22 +239,49 @@ class MyMainWindow(QMainWindow):
             QMessageBox.warning(self, "Campos Vacíos", "Por favor, complete todos los campos antes de imprimir.")
             return False
 
-        nombre_archivo = "registro_impresiones.txt"
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        linea_datos = f"[{timestamp}] \n Hospital: {nombre_hospital} \n=> \n Paciente: {nombre_paciente}, \n Dni: {dni_paciente}, \n Nacimiento: {nacimiento_paciente}, \n ticket: {dimension_impresion}\n"
-
         try:
-            with open(nombre_archivo, 'a', encoding='utf-8') as f:
-                f.write(linea_datos)
-
-            QMessageBox.information(self, "Éxito", f"Datos guardados en '{nombre_archivo}' correctamente.")
+            self.registrar_impresiones([{
+                'hospital': nombre_hospital,
+                'paciente': nombre_paciente,
+                'dni': dni_paciente,
+                'nacimiento': nacimiento_paciente,
+                'formato': dimension_impresion,
+                'clave': clave
+            }])
+
+            if self.perfil_actual() is None:
+                QMessageBox.information(self, "Éxito", f"Datos guardados en '{REGISTRO_IMPRESIONES}' correctamente.")
+            # Con un perfil la impresión es de un clic: el aviso no frena el flujo
             return True
 
         except Exception as e:
             QMessageBox.critical(self, "Error al Guardar", f"No se pudo guardar el archivo: {e}")
             return False
 
-    def imprimir_segun_dimension_zpl(self):
+    def registrar_impresiones(self, registros):
+        """
+        Agrega las impresiones al registro de texto y al diario (un lote se
+        escribe con una sola apertura y un solo fsync). Lanza OSError si falla.
+        """
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with open(REGISTRO_IMPRESIONES, 'a', encoding='utf-8') as f:
+            for datos in registros:
+                f.write(f"[{timestamp}] \n Hospital: {datos['hospital']} \n=> \n Paciente: {datos['paciente']}, \n Dni: {datos['dni']}, \n Nacimiento: {datos['nacimiento']}, \n ticket: {datos['formato']}\n")
+        self.diario.registrar_varias(registros)
+
+    def registrar_entrega(self, trabajo):
+        """
+        Deja en el registro de entregas a qué impresora salió un trabajo terminado
+        (la de destino final, si fue redirigido), para el conteo por impresora.
+        """
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            with open(REGISTRO_ENTREGAS, 'a', encoding='utf-8') as f:
+                f.write(f"[{timestamp}] \n Impresa en: {trabajo.transporte.destino}, \n Paciente: {trabajo.datos.get('paciente', '')}, \n Dni: {trabajo.datos.get('dni', '')}\n")
+        except OSError as e:
+            print(f"✗ Error al registrar la entrega de {trabajo.datos.get('paciente', '')}: {e}")
+
+    def imprimir_segun_dimension_zpl(self, clave=None):
         """
         Función que maneja la impresión ZPL según la dimensión seleccionada.
         """
@@ -74,288 +293,356 @@ class MyMainWindow(QMainWindow):
         nacimiento_paciente = self.ui.txtNacimiento.text()
         nombre_hospital = self.ui.txtNombreHospital.text()
         
-        # Usar if/elif para manejar diferentes dimensiones ZPL
-        if dimension_impresion == "80x80mm":
-            zpl_code = self.generar_zpl_80x80(nombre_paciente, dni_paciente, nacimiento_paciente, nombre_hospital)
-        elif dimension_impresion == "58x58mm":
-            zpl_code = self.generar_zpl_58x58(nombre_paciente, dni_paciente, nacimiento_paciente, nombre_hospital)
-        elif dimension_impresion == "100x80mm":
-            zpl_code = self.generar_zpl_100x80(nombre_paciente, dni_paciente, nacimiento_paciente, nombre_hospital)
-        elif dimension_impresion == "4x2 pulgadas":
-            zpl_code = self.generar_zpl_4x2_pulgadas(nombre_paciente, dni_paciente, nacimiento_paciente, nombre_hospital)
-        elif dimension_impresion == "2.25 x 1.25 (Pulsera hospitalaria)":
-            zpl_code = self.generar_zpl_pulsera_hospitalaria(nombre_paciente, dni_paciente, nacimiento_paciente, nombre_hospital)
+        # Las plantillas ajustan nombre y hospital al ancho real de cada etiqueta
+        # y devuelven la etiqueta como segmentos de bytes listos para enviar.
+        # Si el paciente llegó por admisiones, la etiqueta ya está renderizada.
+        lista = self.listas.ver(dni_paciente)
+        if lista is not None and not lista.coincide(nombre_paciente, dni_paciente, nacimiento_paciente,
+                                                    nombre_hospital):
+            lista = None
+        bebes = 1
+        if dimension_impresion == FORMATO_MADRE_BEBE:
+            # Recién nacidos: los de la admisión, si los trajo; con un perfil (un clic) no se pregunta
+            bebes = lista.datos.get('bebes', 1) if lista is not None else 1
+            if self.perfil_actual() is None:
+                bebes, ok = QInputDialog.getInt(self, "Pulsera Madre / Bebé", "Recién nacidos del parto:", bebes, 1, 9)
+                if not ok:
+                    return
+        if bebes > 1:
+            # Mellizos, trillizos: una pulsera doble por bebé, todas en un solo envío
+            zpl_code = generar_juego_madre_bebe(nombre_paciente, dni_paciente, nacimiento_paciente,
+                                                nombre_hospital, bebes)
+        elif lista is not None and dimension_impresion in lista.segmentos:
+            zpl_code = lista.etiqueta(dimension_impresion)
         else:
+            logo = self.logo.referencia if self.logo else None
+            zpl_code = generar_segmentos(dimension_impresion, nombre_paciente, dni_paciente, nacimiento_paciente,
+                                         nombre_hospital, logo=logo)
+        if zpl_code is None:
             # Dimensión por defecto o no reconocida
             QMessageBox.warning(self, "Dimensión no reconocida", f"La dimensión '{dimension_impresion}' no está configurada.")
             return
         
-        # Enviar código ZPL a la impresora
-        if self.enviar_zpl_a_impresora(zpl_code):
-            # Limpiar los campos después de imprimir exitosamente
+        if clave is None:
+            clave = clave_idempotencia(nombre_paciente, dni_paciente, nacimiento_paciente,
+                                       nombre_hospital, dimension_impresion)
+        datos = {'paciente': nombre_paciente, 'dni': dni_paciente}
+        prioridad = PRIORIDAD_STAT if self.chkUrgente.isChecked() else PRIORIDAD_RUTINA
+
+        # Enviar código ZPL a la cola de impresión
+        if self.enviar_zpl_a_impresora(zpl_code, clave, datos, prioridad, atomico=bebes > 1):
+            # Los datos ya viajan con el trabajo: se puede cargar el siguiente paciente
+            self.listas.tomar(dni_paciente)
             self.limpiar_campos()
 
-    def generar_zpl_80x80(self, nombre, dni, nacimiento, hospital):
+    def enviar_zpl_a_impresora(self, zpl_code, clave, datos=None, prioridad=PRIORIDAD_RUTINA, atomico=False):
         """
-        Genera código ZPL para etiqueta de 80x80mm
+        Elige cómo enviar a la impresora y encola el trabajo: con el perfil
+        elegido, o preguntando método y dirección si no hay perfil.
+        Con atomico, un juego de etiquetas (lista) sale en un solo envío.
+        Retorna True si quedó en la cola, False si se canceló o era un duplicado.
         """
-        timestamp = datetime.datetime.now().strftime("%d/%m/%Y %H:%M")
-        
-        zpl = f"""^XA
-^MMT
-^PW609
-^LL609
-^LS0
-
-^FT50,50^A0N,28,28^FDTICKET MEDICO^FS
-^FT50,100^GB500,3,3^FS
-
-^FT50,140^A0N,20,20^FDHospital:^FS
-^FT50,170^A0N,18,18^FD{hospital[:30]}^FS
-
-^FT50,220^A0N,20,20^FDPaciente:^FS
-^FT50,250^A0N,18,18^FD{nombre[:25]}^FS
-
-^FT50,300^A0N,20,20^FDDNI: {dni}^FS
-
-^FT50,340^A0N,20,20^FDNacimiento:^FS
-^FT50,370^A0N,18,18^FD{nacimiento}^FS
-
-^FT50,420^A0N,16,16^FD{timestamp}^FS
-
-^FT50,460^GB500,3,3^FS
-^FT50,490^A0N,14,14^FDFormato: 80x80mm^FS
+        try:
+            perfil = self.perfil_actual()
+            if perfil is not None:
+                transporte = perfil.crear_transporte()
+                zpl_code = con_copias(zpl_code, perfil.copias)
+                datos = dict(datos or {}, perfil=perfil.nombre)
+            else:
+                transporte = self.elegir_transporte()
+            if transporte is None:
+                return False
 
-^XZ"""
-        return zpl
+            trabajo = TrabajoImpresion(clave, zpl_code, transporte, datos, prioridad, atomico)
+            if not self.cola.enviar(trabajo):
+                self.statusBar().showMessage("Impresión duplicada ignorada.", 5000)
+                return False
+            self.statusBar().showMessage(f"Etiqueta en cola para {transporte.destino}", 5000)
+            return True
+                
+        except Exception as e:
+            QMessageBox.critical(self, "Error de Impresión", f"Error al enviar a la impresora: {e}")
+            return False
 
-    def generar_zpl_58x58(self, nombre, dni, nacimiento, hospital):
+    def elegir_transporte(self):
         """
-        Genera código ZPL para etiqueta de 58x58mm (más compacta)
+        Pregunta el método de envío (y su dirección) con diálogos.
+        Retorna None si se canceló.
         """
-        timestamp = datetime.datetime.now().strftime("%d/%m/%Y")
+        items = ("Red (IP)", "Puerto COM", "USB (Linux)", "Cola CUPS (raw)", "Archivo ZPL", "Cancelar")
+        item, ok = QInputDialog.getItem(self, "Método de Impresión", 
+                                      "Selecciona cómo enviar a la impresora:", items, 0, False)
         
-        zpl = f"""^XA
-^MMT
-^PW435
-^LL435
-^LS0
-
-^FT30,30^A0N,24,24^FDTICKET MED.^FS
-^FT30,65^GB375,2,2^FS
-
-^FT30,95^A0N,16,16^FDHospital:^FS
-^FT30,120^A0N,14,14^FD{hospital[:20]}^FS
-
-^FT30,155^A0N,16,16^FDPaciente:^FS
-^FT30,180^A0N,14,14^FD{nombre[:18]}^FS
-
-^FT30,210^A0N,16,16^FDDNI: {dni}^FS
-
-^FT30,240^A0N,16,16^FDNac: {nacimiento}^FS
-
-^FT30,280^A0N,12,12^FD{timestamp}^FS
-
-^FT30,310^GB375,2,2^FS
-^FT30,335^A0N,12,12^FD58x58mm^FS
-
-^XZ"""
-        return zpl
-
-    def generar_zpl_100x80(self, nombre, dni, nacimiento, hospital):
+        if not ok or item == "Cancelar":
+            return None
+        
+        if item == "Red (IP)":
+            return self.transporte_red()
+        if item == "Puerto COM":
+            return self.transporte_puerto_serie()
+        if item == "USB (Linux)":
+            return self.transporte_usb()
+        if item == "Cola CUPS (raw)":
+            return self.transporte_cups()
+        return TransporteArchivo()
+
+    def transporte_red(self):
         """
-        Genera código ZPL para etiqueta de 100x80mm
+        Pide la IP de la impresora y arma el transporte TCP/IP
         """
-        timestamp = datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-        
-        zpl = f"""^XA
-^MMT
-^PW754
-^LL609
-^LS0
-
-^FT50,40^A0N,32,32^FDREGISTRO MEDICO^FS
-^FT50,80^GB650,4,4^FS
-
-^FT50,120^A0N,22,22^FDHOSPITAL:^FS
-^FT200,120^A0N,20,20^FD{hospital[:35]}^FS
-
-^FT50,170^A0N,22,22^FDPACIENTE:^FS
-^FT200,170^A0N,20,20^FD{nombre[:30]}^FS
-
-^FT50,220^A0N,22,22^FDDNI:^FS
-^FT200,220^A0N,20,20^FD{dni}^FS
-
-^FT50,270^A0N,22,22^FDNACIMIENTO:^FS
-^FT200,270^A0N,20,20^FD{nacimiento}^FS
-
-^FT50,330^A0N,18,18^FDFecha de impresion:^FS
-^FT50,360^A0N,16,16^FD{timestamp}^FS
-
-^FT50,420^GB650,3,3^FS
-^FT50,450^A0N,16,16^FDFormato: 100x80mm^FS
-
-^XZ"""
-        return zpl
+        # Permitir al usuario cambiar la IP si es necesario
+        ip, ok = QInputDialog.getText(self, "IP de Impresora", 
+                                    f"IP de la impresora ZPL:", text=self.printer_ip)
+        if not ok:
+            return None
+            
+        self.printer_ip = ip
+        # Puerto raw con timeout de 10 segundos
+        return TransporteRed(self.printer_ip, self.printer_port, timeout=10)
 
-    def generar_zpl_4x2_pulgadas(self, nombre, dni, nacimiento, hospital):
+    def transporte_puerto_serie(self):
         """
-        Genera código ZPL para etiqueta de 4x2 pulgadas (estándar médico)
+        Pide el puerto COM y arma el transporte serie
         """
-        timestamp = datetime.datetime.now().strftime("%d/%m/%Y %H:%M")
-        
-        zpl = f"""^XA
-^MMT
-^PW812
-^LL406
-^LS0
-
-^FT50,35^A0N,28,28^FDIDENTIFICACION PACIENTE^FS
-^FT50,70^GB712,3,3^FS
-
-^FT50,110^A0N,20,20^FDHOSPITAL: {hospital[:40]}^FS
-
-^FT50,150^A0N,20,20^FDPACIENTE: {nombre[:35]}^FS
-
-^FT50,190^A0N,20,20^FDDNI: {dni}     NACIMIENTO: {nacimiento}^FS
-
-^FT50,240^A0N,16,16^FDImpreso: {timestamp}^FS
-
-^FT50,280^GB712,2,2^FS
-^FT50,310^A0N,14,14^FDFormato: 4x2 pulgadas^FS
+        try:
+            import serial  # noqa: F401 - solo para avisar antes de encolar
+        except ImportError:
+            QMessageBox.critical(self, "Módulo Requerido", 
+                               "Para usar puerto COM, instala: pip install pyserial")
+            return None
 
-^XZ"""
-        return zpl
+        # Permitir al usuario especificar el puerto COM
+        puerto, ok = QInputDialog.getText(self, "Puerto COM", 
+                                        "Puerto COM (ej: COM1, COM3):", text="COM1")
+        if not ok:
+            return None
+        return TransportePuertoSerie(puerto, 9600, timeout=5)
 
-    def generar_zpl_pulsera_hospitalaria(self, nombre, dni, nacimiento, hospital):
+    def transporte_usb(self):
         """
-        Genera código ZPL para pulsera hospitalaria de 2.25 x 1.25 pulgadas
+        Elige el dispositivo USB (/dev/usb/lp*) y arma el transporte directo
         """
-        timestamp = datetime.datetime.now().strftime("%d/%m/%Y")
-        
-        zpl = f"""^XA
-^MMT
-^PW576
-^LL300
-^LS0
-
-^FT20,25^A0N,18,18^FDPULSERA HOSPITALARIA^FS
-^FT20,50^GB536,2,2^FS
-
-^FT20,75^A0N,16,16^FD{hospital[:25]}^FS
-
-^FT20,105^A0N,14,14^FD{nombre[:22]}^FS
-^FT20,130^A0N,14,14^FDDNI: {dni}^FS
-^FT20,155^A0N,14,14^FDNac: {nacimiento}^FS
-
-^FT20,185^A0N,12,12^FD{timestamp}^FS
-
-^FT20,210^GB536,2,2^FS
-^FT20,235^A0N,10,10^FDPulsera 2.25x1.25^FS
-
-^XZ"""
-        return zpl
-
-    def enviar_zpl_a_impresora(self, zpl_code):
+        dispositivos = dispositivos_usb() or ["/dev/usb/lp0"]
+        dispositivo, ok = QInputDialog.getItem(self, "Impresora USB",
+                                             "Dispositivo de la impresora:", dispositivos, 0, True)
+        if not ok or not dispositivo:
+            return None
+        return TransporteDispositivo(dispositivo)
+
+    def transporte_cups(self):
         """
-        Envía el código ZPL a la impresora a través de red o puerto.
-        Retorna True si se envió correctamente, False si hubo error.
+        Elige la cola de CUPS (configurada como raw) y arma el transporte
         """
-        try:
-            # Preguntar al usuario el método de envío
-            items = ("Red (IP)", "Puerto COM", "Archivo ZPL", "Cancelar")
-            item, ok = QInputDialog.getItem(self, "Método de Impresión", 
-                                          "Selecciona cómo enviar a la impresora:", items, 0, False)
-            
-            if not ok or item == "Cancelar":
-                return False
-            
-            if item == "Red (IP)":
-                return self.enviar_por_red(zpl_code)
-            elif item == "Puerto COM":
-                return self.enviar_por_puerto_serie(zpl_code)
-            elif item == "Archivo ZPL":
-                return self.guardar_archivo_zpl(zpl_code)
-                
-        except Exception as e:
-            QMessageBox.critical(self, "Error de Impresión", f"Error al enviar a la impresora: {e}")
-            return False
+        colas = colas_cups()
+        if colas:
+            cola, ok = QInputDialog.getItem(self, "Cola CUPS", "Cola de impresión (raw):", colas, 0, True)
+        else:
+            cola, ok = QInputDialog.getText(self, "Cola CUPS", "Cola de impresión (raw):", text="zebra")
+        if not ok or not cola:
+            return None
+        return TransporteCups(cola)
 
-    def enviar_por_red(self, zpl_code):
+    def recibir_argumentos(self, argumentos, directorio=""):
         """
-        Envía ZPL por red TCP/IP
+        Argumentos de línea de comandos, propios o reenviados por otra
+        instancia: --lote pacientes.csv [--formato "58x58mm"], y las fuentes
+        de admisiones: --mllp [PUERTO] --json [PUERTO] --carpeta-admisiones [CARPETA].
         """
+        if self.isMinimized():
+            self.showNormal()
+        self.raise_()
+        self.activateWindow()
+
+        # Un argumento mal escrito (propio o reenviado) no debe cerrar la aplicación
+        parser = argparse.ArgumentParser(add_help=False, exit_on_error=False)
+        parser.add_argument('--lote')
+        parser.add_argument('--formato')
+        parser.add_argument('--mllp', nargs='?', type=int, const=PUERTO_MLLP)
+        parser.add_argument('--json', nargs='?', type=int, const=PUERTO_JSON)
+        parser.add_argument('--carpeta-admisiones', nargs='?', const=CARPETA_ADMISIONES)
         try:
-            # Permitir al usuario cambiar la IP si es necesario
-            ip, ok = QInputDialog.getText(self, "IP de Impresora", 
-                                        f"IP de la impresora ZPL:", text=self.printer_ip)
-            if not ok:
-                return False
-                
-            self.printer_ip = ip
-            
-            # Crear socket y enviar
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(10)  # Timeout de 10 segundos
-            sock.connect((self.printer_ip, self.printer_port))
-            sock.send(zpl_code.encode('utf-8'))
-            sock.close()
-            
-            QMessageBox.information(self, "Éxito", f"Etiqueta enviada a impresora {self.printer_ip}")
-            return True
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error de Red", f"No se pudo conectar a la impresora: {e}")
-            return False
-
-    def enviar_por_puerto_serie(self, zpl_code):
+            opciones, _ = parser.parse_known_args(argumentos)
+        except (argparse.ArgumentError, SystemExit) as e:
+            self.statusBar().showMessage(f"Argumentos inválidos ({' '.join(argumentos)}): {e}", 10000)
+            return
+        self.iniciar_admisiones(opciones.mllp, opciones.json,
+                                opciones.carpeta_admisiones and os.path.join(directorio, opciones.carpeta_admisiones))
+        if opciones.lote:
+            # La ruta es relativa a la carpeta desde donde se lanzó la otra instancia
+            self.imprimir_lote(os.path.join(directorio, opciones.lote), opciones.formato)
+
+    def iniciar_admisiones(self, puerto_mllp=None, puerto_json=None, carpeta=None):
+        """Abre las fuentes de eventos de admisión pedidas (las ya abiertas se ignoran)"""
+        fuentes = []
+        try:
+            if puerto_mllp is not None:
+                fuentes.append(f"HL7 en el puerto {self.ingesta.escuchar_mllp(puerto_mllp)}")
+            if puerto_json is not None:
+                fuentes.append(f"JSON en el puerto {self.ingesta.escuchar_json(puerto_json)}")
+        except OSError as e:
+            QMessageBox.critical(self, "Error de Admisiones", f"No se pudo abrir el puerto de admisiones: {e}")
+        if carpeta:
+            self.ingesta.vigilar_carpeta(carpeta)
+            fuentes.append(f"carpeta {carpeta}")
+        if fuentes:
+            self.statusBar().showMessage(f"Recibiendo admisiones: {', '.join(fuentes)}", 10000)
+
+    def cargar_combo_admitidos(self):
+        """Pacientes admitidos con la pulsera lista, el más reciente primero"""
+        pendientes = self.listas.pendientes()
+        self.boxAdmitidos.clear()
+        self.boxAdmitidos.addItem(f"{len(pendientes)} pulseras listas" if pendientes else "Sin admisiones pendientes")
+        for lista in pendientes:
+            self.boxAdmitidos.addItem(f"{lista.datos['dni']} - {lista.datos['nombre']}", lista.datos['dni'])
+
+    def elegir_admitido(self, indice):
+        dni = self.boxAdmitidos.itemData(indice)
+        lista = self.listas.ver(dni) if dni else None
+        if lista is not None:
+            self.cargar_datos_admision(lista)
+
+    def completar_desde_admision(self):
+        """Al escribir un DNI que ya llegó por admisiones, completa el resto de los datos"""
+        dni = "".join(c for c in self.ui.txtDniPaciente.text() if c.isdigit())
+        lista = self.listas.ver(dni)
+        if lista is not None:
+            self.cargar_datos_admision(lista)
+
+    def cargar_datos_admision(self, lista):
+        self.ui.txtNombrePaciente.setText(lista.datos['nombre'])
+        self.ui.txtDniPaciente.setText(lista.datos['dni'])
+        self.ui.txtNacimiento.setText(lista.datos['nacimiento'])
+        self.ui.txtNombreHospital.setText(lista.datos['hospital'])
+
+    def imprimir_lote(self, ruta, formato=None):
         """
-        Envía ZPL por puerto serie/COM
+        Imprime todas las pulseras de un CSV con prioridad de lote: las
+        pulseras individuales y las urgentes pasan por delante.
         """
+        dimension = formato or self.ui.boxDimensionesImpresion.currentText()
+        if dimension not in FORMATOS:
+            QMessageBox.warning(self, "Dimensión no reconocida", f"La dimensión '{dimension}' no está configurada.")
+            return
         try:
-            import serial
-            
-            # Permitir al usuario especificar el puerto COM
-            puerto, ok = QInputDialog.getText(self, "Puerto COM", 
-                                            "Puerto COM (ej: COM1, COM3):", text="COM1")
-            if not ok:
-                return False
-            
-            # Configurar y enviar por puerto serie
-            ser = serial.Serial(puerto, 9600, timeout=5)
-            ser.write(zpl_code.encode('utf-8'))
-            ser.close()
-            
-            QMessageBox.information(self, "Éxito", f"Etiqueta enviada a puerto {puerto}")
-            return True
-            
-        except ImportError:
-            QMessageBox.critical(self, "Módulo Requerido", 
-                               "Para usar puerto COM, instala: pip install pyserial")
-            return False
-        except Exception as e:
-            QMessageBox.critical(self, "Error Puerto COM", f"Error en puerto serie: {e}")
-            return False
+            validas, rechazadas = normalizar_lote(leer_lote_csv(ruta))
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error de Lote", f"No se pudo leer el lote {ruta}: {e}")
+            return
+
+        resumen = f"{len(validas)} pulseras válidas en {os.path.basename(ruta)}."
+        if rechazadas:
+            detalle = "\n".join(f"• Fila {numero + 1}: {DatosInvalidos(errores)}" for numero, _, errores in rechazadas[:10])
+            resumen += f"\n{len(rechazadas)} filas rechazadas (no se imprimen):\n{detalle}"
+        respuesta = QMessageBox.question(self, "Imprimir Lote", f"{resumen}\n\n¿Imprimir en formato {dimension}?")
+        if respuesta != QMessageBox.Yes or not validas:
+            return
 
-    def guardar_archivo_zpl(self, zpl_code):
+        perfil = self.perfil_actual()
+        transporte = perfil.crear_transporte() if perfil else self.elegir_transporte()
+        if transporte is None:
+            return
+        logo = self.logo.referencia if self.logo else None
+
+        trabajos, registros, claves = [], [], set()
+        sin_bebes = 0
+        for paciente in validas:
+            clave = clave_idempotencia(paciente['nombre'], paciente['dni'], paciente['nacimiento'],
+                                       paciente['hospital'], dimension)
+            bebes = str(paciente.get('bebes') or "1").strip()
+            if dimension == FORMATO_MADRE_BEBE and (not bebes.isdigit() or not 1 <= int(bebes) <= 9):
+                sin_bebes += 1
+                continue
+            # Filas repetidas dentro del CSV o pulseras recién impresas. La reserva
+            # evita que el registro en el diario haga pasar la pulsera por duplicada.
+            if clave in claves or not self.cola.reservar(clave):
+                continue
+            claves.add(clave)
+            if dimension == FORMATO_MADRE_BEBE:
+                # Lote de partos: columna bebes (1 si no está); cada parto es un juego atómico
+                zpl_code = generar_juego_madre_bebe(paciente['nombre'], paciente['dni'], paciente['nacimiento'],
+                                                    paciente['hospital'], int(bebes))
+            else:
+                zpl_code = generar_segmentos(dimension, paciente['nombre'], paciente['dni'], paciente['nacimiento'],
+                                             paciente['hospital'], logo=logo)
+            if perfil is not None:
+                zpl_code = con_copias(zpl_code, perfil.copias)
+            datos = {'paciente': paciente['nombre'], 'dni': paciente['dni'], 'lote': os.path.basename(ruta)}
+            trabajos.append(TrabajoImpresion(clave, zpl_code, transporte, datos, PRIORIDAD_LOTE,
+                                             atomico=dimension == FORMATO_MADRE_BEBE))
+            registros.append({'hospital': paciente['hospital'], 'paciente': paciente['nombre'],
+                              'dni': paciente['dni'], 'nacimiento': paciente['nacimiento'],
+                              'formato': dimension, 'clave': clave})
+
+        try:
+            self.registrar_impresiones(registros)
+            encolados = sum(1 for trabajo in trabajos if self.cola.enviar(trabajo))
+        except OSError as e:
+            QMessageBox.critical(self, "Error al Guardar", f"No se pudo registrar el lote: {e}")
+            return
+        finally:
+            # Las claves que no llegaron a la cola quedan libres para reintentar
+            for clave in claves:
+                self.cola.liberar(clave)
+        omitidas = len(validas) - encolados - sin_bebes
+        self.statusBar().showMessage(f"Lote en cola: {encolados} pulseras para {transporte.destino}"
+                                     + (f" ({omitidas} ya impresas, omitidas)" if omitidas else "")
+                                     + (f" ({sin_bebes} con la columna bebes inválida)" if sin_bebes else ""), 10000)
+
+    def mostrar_resultado_impresion(self, trabajo, ok, error):
         """
-        Guarda el código ZPL en un archivo para revisión o envío manual
+        Informa el resultado de un trabajo de la cola (se ejecuta en el hilo de la UI).
         """
-        try:
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            nombre_archivo = f"etiqueta_{timestamp}.zpl"
-            
-            with open(nombre_archivo, 'w', encoding='utf-8') as f:
-                f.write(zpl_code)
-            
+        paciente = trabajo.datos.get('paciente', '')
+        tipo = trabajo.transporte.tipo
+        if ok:
+            self.registrar_entrega(trabajo)
+        if trabajo.datos.get('lote'):
+            # Un lote no abre un diálogo por pulsera: el avance va a la barra de estado
+            estado = "impresa" if ok else f"ERROR: {error}"
+            self.statusBar().showMessage(f"Lote {trabajo.datos['lote']}: {paciente} {estado}", 5000)
+            return
+        if not ok:
+            titulos = {'red': "Error de Red", 'com': "Error Puerto COM", 'usb': "Error USB",
+                       'cups': "Error de CUPS", 'archivo': "Error al Guardar ZPL"}
+            QMessageBox.critical(self, titulos.get(tipo, "Error de Impresión"),
+                                 f"No se pudo imprimir la pulsera de {paciente}: {error}")
+        elif trabajo.datos.get('perfil'):
+            # Impresión de un clic (con perfil): el resultado va a la barra de estado
+            redirigido = trabajo.datos.get('redirigido_desde')
+            destino = trabajo.transporte.ultimo_archivo if tipo == 'archivo' else trabajo.transporte.destino
+            self.statusBar().showMessage(f"Etiqueta de {paciente} enviada a {destino}"
+                                         + (f" ({redirigido} no respondía)" if redirigido else ""), 5000)
+        elif tipo == 'archivo':
             QMessageBox.information(self, "Archivo Guardado", 
-                                  f"Código ZPL guardado en: {nombre_archivo}\n\n"
+                                  f"Código ZPL guardado en: {trabajo.transporte.ultimo_archivo}\n\n"
                                   "Puedes enviar este archivo directamente a tu impresora ZPL.")
-            return True
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error al Guardar ZPL", f"No se pudo guardar el archivo ZPL: {e}")
-            return False
+        else:
+            redirigido = trabajo.datos.get('redirigido_desde')
+            QMessageBox.information(self, "Éxito", f"Etiqueta de {paciente} enviada a {trabajo.transporte.destino}"
+                                    + (f" ({redirigido} no respondía)" if redirigido else ""))
+
+    def transporte_alternativo(self, transporte):
+        """
+        Otra impresora de red de los perfiles del puesto que esté respondiendo,
+        para los trabajos de una impresora caída. None si no hay ninguna.
+        Se llama desde el hilo de la cola.
+        """
+        for perfil in self.perfiles.perfiles.values():
+            if perfil.transporte.get('tipo') != 'red':
+                continue
+            alternativo = perfil.crear_transporte()
+            if alternativo.destino != transporte.destino and MONITOR.disponible(f"red:{alternativo.destino}"):
+                return alternativo
+        return None
+
+    def mostrar_estado_impresora(self, salud):
+        """Avisa en la barra de estado cuando una impresora deja de responder o vuelve"""
+        destino = salud.destino.split(":", 1)[-1]
+        if salud.estado == ABIERTO:
+            self.statusBar().showMessage(f"La impresora {destino} no responde ({salud.ultimo_error}): "
+                                         "sus trabajos fallan al instante o van a otra impresora del perfil", 15000)
+        else:
+            self.statusBar().showMessage(f"La impresora {destino} volvió a responder", 5000)
 
     def limpiar_campos(self):
         """
@@ -365,10 +652,28 @@ class MyMainWindow(QMainWindow):
         self.ui.txtDniPaciente.clear()
         self.ui.txtNacimiento.clear()
         self.ui.txtNombreHospital.clear()
+        self.chkUrgente.setChecked(False)
 
 # Esto es lo que se ejecuta cuando corres este script
 if __name__ == "__main__":
+    # Modo perfilado opcional: PDC_PERFIL=1 o --perfil
+    iniciar_perfilado_si_corresponde([
+        (MyMainWindow, ['procesar_impresion', 'normalizar_campos', 'guardar_datos_en_txt', 'imprimir_segun_dimension_zpl',
+                        'enviar_zpl_a_impresora', 'mostrar_resultado_impresion', 'guardar_perfil',
+                        'imprimir_lote']),
+        (ColaImpresion, ['_procesar_etiqueta']),
+    ])
+
+    # Una sola instancia por puesto: si ya hay una abierta, se le pasan los
+    # argumentos (p.ej. --lote pacientes.csv) y esta termina sin abrir ventana
+    instancia = InstanciaUnica(nombre_por_defecto("imprimir_Zebra"))
+    if not instancia.adquirir():
+        sys.exit(0 if instancia.reenviar(sys.argv[1:]) else 1)
+
     app = QtWidgets.QApplication(sys.argv)
+    instancia.escuchar()
     window = MyMainWindow()
     window.show()
+    window.recibir_argumentos(sys.argv[1:], os.getcwd())
+    instancia.entregar_a(window.recibir_argumentos)
     sys.exit(app.exec_())
\ No newline at end of file
@@ -33,13 +33,13 @@ zpl = """
 ^CI28
 ^FWB
 
-; Nombre Hospital (arriba de Caja Bebé)
+^FX Nombre Hospital (arriba de Caja Bebé)^FS
 ^FO200,460
 ^FB550,1,0,L,0
 ^A0B,25,25
 ^FDHospital: {nombre_hospital}^FS
 
-; Caja Bebé
+^FX Caja Bebé^FS
 ^FO240,460
 ^FB550,1,0,L,0
 ^A0B,25,25
@@ -55,13 +55,13 @@ zpl = """
 ^A0B,25,25
 ^FDFecha Nac.: {fecha_nac_mama}^FS
 
-; Nombre Hospital (arriba de Datos Mamá)
+^FX Nombre Hospital (arriba de Datos Mamá)^FS
 ^FO30,1260
 ^FB550,1,0,L,0
 ^A0B,25,25
 ^FDHospital: {nombre_hospital}^FS
 
-; Datos de MAMÁ
+^FX Datos de MAMÁ^FS
 ^FO70,1260
 ^FB550,1,0,L,0
 ^A0B,25,25